@@ -0,0 +1,30 @@
+"""
+Points/sec of the offline coordinate conversion engine.
+
+Usage: python -m benchmarks.bench_crs [num_points]
+"""
+import sys
+import time
+
+import numpy as np
+
+from onemap_py import crs
+
+
+def main(n: int = 2000000):
+    rng = np.random.default_rng(0)
+    x = rng.uniform(2000, 50000, n)
+    y = rng.uniform(20000, 50000, n)
+    lat, lng = crs.svy21_to_wgs84(x, y)
+
+    for source, target, kwargs in [("SVY21", "WGS84", {"x": x, "y": y}),
+                                   ("WGS84", "SVY21", {"lat": lat, "lng": lng}),
+                                   ("SVY21", "EPSG3857", {"x": x, "y": y})]:
+        start = time.perf_counter()
+        crs.convert_many(source, target, **kwargs)
+        elapsed = time.perf_counter() - start
+        print(f"{source:>8} -> {target:<8}: {n / elapsed / 1e6:6.2f}M points/s")
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:]])
@@ -0,0 +1,48 @@
+"""
+Compare decoding many route geometries one at a time with pypolyline against the batch decoder,
+for time and peak memory of the decoded result.
+
+Usage: python -m benchmarks.bench_polyline [num_routes] [points_per_route]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from pypolyline.util import encode_coordinates
+
+from onemap_py import Router
+
+
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    # Separate run, tracing allocations slows down the timing considerably
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(num_routes: int = 2000, points_per_route: int = 500):
+    rng = np.random.default_rng(0)
+    steps = rng.normal(0, 0.0005, (num_routes, points_per_route, 2))
+    routes = np.cumsum(steps, axis=1) + [103.8, 1.35]
+    polylines = [encode_coordinates(route.round(5).tolist(), 5).decode() for route in routes]
+
+    _, loop_time, loop_peak = measure(lambda: [Router.decode_route_geometry(p) for p in polylines])
+    _, batch_time, batch_peak = measure(lambda: Router.decode_route_geometries(polylines))
+
+    points = num_routes * points_per_route
+    print(f"{num_routes} routes, {points} points")
+    print(f"pypolyline loop : {loop_time:7.3f}s {points / loop_time / 1e6:6.2f}M points/s "
+          f"peak {loop_peak / 2 ** 20:8.1f} MiB")
+    print(f"batch decoder   : {batch_time:7.3f}s {points / batch_time / 1e6:6.2f}M points/s "
+          f"peak {batch_peak / 2 ** 20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:]])
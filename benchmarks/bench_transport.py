@@ -0,0 +1,39 @@
+"""
+Compare requests/sec of bare `requests.get` calls against the shared, pooled `Transport`.
+
+Usage: python -m benchmarks.bench_transport [num_requests]
+"""
+import sys
+import time
+
+import requests
+
+from onemap_py import OneMap, Transport
+from .stub_server import StubServer
+
+
+def bench(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - start)
+
+
+def main(n: int = 2000):
+    with StubServer() as server:
+        url = f"{server.url}/commonapi/search"
+        params = {"searchVal": "STUB", "returnGeom": "Y", "getAddrDetails": "Y", "pageNum": 1}
+
+        bare = bench(lambda: requests.get(url, params=params, timeout=10).json(), n)
+
+        om = OneMap(transport=Transport(timeout=10))
+        om.url = server.url
+        pooled = bench(lambda: om.search("STUB"), n)
+        om.transport.close()
+
+    print(f"bare requests.get : {bare:10.1f} req/s")
+    print(f"shared Transport  : {pooled:10.1f} req/s ({pooled / bare:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:]])
@@ -0,0 +1,122 @@
+"""
+Peak memory (RSS) of downloading and decoding the biggest responses: all planning area boundaries and a large
+theme, served by the local stub server.
+
+Every endpoint is fetched in a fresh process per decoding mode, and the growth of its peak RSS over the RSS
+right before the request is reported:
+
+- `text`: `json.loads(response.text)`, how responses used to be decoded
+- `bytes`: `OneMap.parse_response`, decoding the body straight from bytes (with orjson if installed)
+- `stream`: `iter_planning_areas` / `iter_theme`, decoding one record at a time while downloading
+
+Usage: python -m benchmarks.parse_memory [--areas N] [--records N]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from onemap_py import Client
+from onemap_py.jsonio import orjson
+from .stub_server import StubServer, EndpointConfig
+
+MODES = ["text", "bytes", "stream"]
+ENDPOINTS = ["planning_areas", "theme"]
+
+
+def _rss() -> int:
+    # Current RSS in bytes
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def _reset_peak_rss():
+    # Linux: reset the peak RSS to the current RSS, so that the imports' peak does not hide the request's
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(url: str, endpoint: str, mode: str) -> dict:
+    client = Client("bench@example.com", "password")
+    for om in [client, client.Themes, client.PlanningAreas]:
+        om.url = url
+    client.tokens.url = url
+    client.authenticate()
+
+    if endpoint == "planning_areas":
+        path, params, key = "/privateapi/popapi/getAllPlanningarea", {"token": client.token, "year": 2014}, \
+            "SearchResults"
+        stream = client.PlanningAreas.iter_planning_areas
+    else:
+        path, params, key = "/privateapi/themesvc/retrieveTheme", {"token": client.token, "queryName": "stub"}, \
+            "SrchResults"
+        stream = lambda: client.Themes.iter_theme("stub")
+
+    _reset_peak_rss()
+    before = _rss()
+    start = time.perf_counter()
+    if mode == "stream":
+        records = stream()
+    else:
+        response = client.transport.get(url + path, params=params)
+        document = json.loads(response.text) if mode == "text" else client.parse_response(response)
+        # The theme's first record is its metadata, which `iter_theme` skips
+        records = iter(document[key][1:] if endpoint == "theme" else document[key])
+    # Consume the records one by one, as a caller writing them out would
+    size = sum(len(json.dumps(record)) for record in records)
+    return {"peak_growth": _peak_rss() - before, "seconds": time.perf_counter() - start, "size": size}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak RSS of decoding the biggest OneMap responses")
+    parser.add_argument("--areas", type=int, default=2000, help="Number of planning areas in the stub response")
+    parser.add_argument("--records", type=int, default=200000, help="Number of theme records in the stub response")
+    parser.add_argument("--child", nargs=3, metavar=("URL", "ENDPOINT", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return None
+
+    config = {"popapi": EndpointConfig(payload_size=args.areas), "themesvc": EndpointConfig(payload_size=args.records)}
+    results = {}
+    print(f"orjson: {'yes' if orjson is not None else 'no'}")
+    with StubServer(config, process=True) as server:
+        for endpoint in ENDPOINTS:
+            # The first run warms up the stub server, which builds every response body once
+            for mode in ["bytes"] + MODES:
+                output = subprocess.run([sys.executable, "-m", "benchmarks.parse_memory",
+                                         "--child", server.url, endpoint, mode],
+                                        check=True, capture_output=True, text=True).stdout
+                results[(endpoint, mode)] = json.loads(output)
+
+    print(f"{'endpoint':<16}{'mode':<8}{'peak RSS growth MiB':>20}{'vs text':>9}{'seconds':>9}")
+    for endpoint in ENDPOINTS:
+        baseline = results[(endpoint, "text")]["peak_growth"]
+        for mode in MODES:
+            result = results[(endpoint, mode)]
+            print(f"{endpoint:<16}{mode:<8}{result['peak_growth'] / 2 ** 20:>20.1f}"
+                  f"{result['peak_growth'] / baseline:>9.2f}{result['seconds']:>9.2f}")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
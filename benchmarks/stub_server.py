@@ -0,0 +1,251 @@
+"""
+Local stand-in for the OneMap API, used by the benchmarks.
+
+Every endpoint group (search, convert, revgeocode, routing, popapi, themesvc) can be given its own latency,
+error rate and payload size:
+
+    config = {"search": EndpointConfig(latency=0.02, error_rate=0.01, payload_size=45)}
+    with StubServer(config) as server:
+        client.url = server.url
+"""
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from pypolyline.util import encode_coordinates
+
+PAGE_SIZE = 10
+
+# Endpoint group -> path fragment identifying its endpoints
+ENDPOINTS = {
+    "auth": "/privateapi/auth",
+    "search": "/commonapi/search",
+    "convert": "/commonapi/convert",
+    "revgeocode": "/privateapi/commonsvc/revgeocode",
+    "routing": "/privateapi/routingsvc",
+    "popapi": "/privateapi/popapi",
+    "themesvc": "/privateapi/themesvc",
+}
+
+
+class EndpointConfig(object):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 payload_size: int = 1, error_status: int = 503):
+        """
+
+        :param latency: Seconds to wait before responding
+        :param jitter: Up to this many seconds are added to `latency` at random
+        :param error_rate: Fraction of requests answered with `error_status`
+        :param payload_size: Size of the response: total number of results for search (in pages of 10),
+            records for revgeocode, themesvc and popapi, points of the route geometry for routing,
+            and number of planning areas for the planning area boundaries
+        :param error_status: HTTP status of failed requests
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+        self.error_status = error_status
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _search_page(total: int, page: int) -> dict:
+    pages = max(1, math.ceil(total / PAGE_SIZE))
+    results = [{"SEARCHVAL": f"STUB {i}", "BLK_NO": str(i), "ROAD_NAME": "STUB ROAD", "BUILDING": "STUB",
+                "ADDRESS": f"{i} STUB ROAD SINGAPORE {i:06d}", "POSTAL": f"{i:06d}",
+                "X": "28983.788", "Y": "33554.502", "LATITUDE": "1.3", "LONGITUDE": "103.8"}
+               for i in range((page - 1) * PAGE_SIZE, min(total, page * PAGE_SIZE))]
+    return {"found": total, "totalNumPages": pages, "pageNum": page, "results": results}
+
+
+def _route(points: int) -> dict:
+    coordinates = [(103.8 + 0.0001 * i, 1.3 + 0.00005 * math.sin(0.1 * i)) for i in range(max(2, points))]
+    geometry = encode_coordinates(coordinates, 5)
+    return {"status_message": "Found route between points", "status": 0,
+            "route_geometry": geometry.decode() if isinstance(geometry, bytes) else geometry,
+            "route_summary": {"total_time": 60 * points, "total_distance": 10 * points}}
+
+
+def _planning_areas(count: int, vertices: int = 256) -> dict:
+    # Circles on a grid over Singapore, one per planning area
+    side = max(1, math.ceil(math.sqrt(count)))
+    width, height = 0.4 / side, 0.2 / side
+    records = []
+    for i in range(count):
+        cx, cy = 103.6 + width * (i % side + 0.5), 1.25 + height * (i // side + 0.5)
+        ring = [[cx + 0.45 * width * math.cos(2 * math.pi * k / vertices),
+                 cy + 0.45 * height * math.sin(2 * math.pi * k / vertices)] for k in range(vertices)]
+        ring.append(ring[0])
+        records.append({"pln_area_n": f"AREA {i}",
+                        "geojson": json.dumps({"type": "MultiPolygon", "coordinates": [[ring]]})})
+    return {"SearchResults": records}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections alive
+    protocol_version = "HTTP/1.1"
+    # Avoid Nagle/delayed-ACK stalls on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def _group(self, path: str):
+        for group, fragment in ENDPOINTS.items():
+            if fragment in path:
+                return group
+        return None
+
+    def _respond(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        group = self._group(url.path)
+        config = self.server.config.get(group, self.server.default)
+
+        if config.latency or config.jitter:
+            time.sleep(config.latency + random.uniform(0, config.jitter))
+        if config.error_rate and random.random() < config.error_rate:
+            self._respond(config.error_status, b'"Service Unavailable"')
+            return
+
+        body = self.server.body(group, url.path, params, config)
+        if body is None:
+            self._respond(404, b'"Not Found"')
+        else:
+            self._respond(200, body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self._handle()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubResponses(object):
+    """
+    Builds response bodies once per distinct request and then reuses them, so the server costs little time
+    compared to the client being measured
+    """
+    def __init__(self):
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, group: str, path: str, params: dict, config: EndpointConfig):
+        key = (path, params.get("pageNum") if group == "search" else None)
+        with self._lock:
+            body = self._bodies.get(key)
+        if body is None:
+            body = self._build(group, path, params, config)
+            if body is not None:
+                body = json.dumps(body).encode()
+                with self._lock:
+                    self._bodies[key] = body
+        return body
+
+    @staticmethod
+    def _build(group: str, path: str, params: dict, config: EndpointConfig):
+        size = config.payload_size
+        if group == "auth":
+            return {"access_token": "stub-token", "expiry_timestamp": str(int(time.time()) + 3 * 24 * 3600)}
+        if group == "search":
+            return _search_page(size, int(params.get("pageNum", 1)))
+        if group == "convert":
+            return {"latitude": 1.3, "longitude": 103.8, "X": 28983.788, "Y": 33554.502}
+        if group == "revgeocode":
+            return {"GeocodeInfo": [{"BUILDINGNAME": f"STUB {i}", "BLOCK": str(i), "ROAD": "STUB ROAD",
+                                     "POSTALCODE": f"{i:06d}", "XCOORD": "28983.788", "YCOORD": "33554.502",
+                                     "LATITUDE": "1.3", "LONGITUDE": "103.8"} for i in range(size)]}
+        if group == "routing":
+            return _route(size)
+        if group == "popapi":
+            if path.endswith("getAllPlanningarea"):
+                return _planning_areas(size)
+            return [{"planning_area": f"AREA {i}", "year": 2010, "value": i} for i in range(size)]
+        if group == "themesvc":
+            return {"SrchResults": [{"FeatCount": size, "Theme_Name": "Stub", "Category": "Stub", "Owner": "Stub"}]
+                    + [{"NAME": f"STUB {i}", "LatLng": "1.3,103.8", "ICON_NAME": "stub.png"} for i in range(size)]}
+        return None
+
+
+def _make_httpd(config: dict, default: EndpointConfig, host: str, port: int) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), StubHandler)
+    httpd.daemon_threads = True
+    httpd.config = dict(config or {})
+    httpd.default = default if default is not None else EndpointConfig()
+    httpd.body = StubResponses()
+    return httpd
+
+
+def _serve(config: dict, default: EndpointConfig, host: str, port: int, conn):
+    httpd = _make_httpd(config, default, host, port)
+    conn.send(httpd.server_address[:2])
+    httpd.serve_forever()
+
+
+class StubServer(object):
+    """
+    Threaded local HTTP server answering like OneMap, run as a context manager.
+
+    With `process=True` it runs in a separate process, so that it neither competes with the client being
+    measured for the GIL nor shows up in the client's memory measurements.
+    """
+    def __init__(self, config: dict = None, default: EndpointConfig = None,
+                 host: str = "127.0.0.1", port: int = 0, process: bool = False):
+        """
+
+        :param config: Endpoint group (see `ENDPOINTS`) -> `EndpointConfig`
+        :param default: Configuration of endpoint groups missing from `config`
+        :param process: Serve from a separate process instead of a thread
+        """
+        self.config = config
+        self.default = default
+        self.host = host
+        self.port = port
+        self.process = process
+        self.address = None
+        self._httpd = None
+        self._worker = None
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        if self.process:
+            parent, child = multiprocessing.Pipe()
+            self._worker = multiprocessing.Process(target=_serve, daemon=True,
+                                                   args=(self.config, self.default, self.host, self.port, child))
+            self._worker.start()
+            self.address = tuple(parent.recv())
+        else:
+            self._httpd = _make_httpd(self.config, self.default, self.host, self.port)
+            self.address = self._httpd.server_address[:2]
+            self._worker = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            self._worker.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.process:
+            self._worker.terminate()
+            self._worker.join()
+        else:
+            self._httpd.shutdown()
+            self._httpd.server_close()
@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark suite against a local OneMap stub server.
+
+Measures throughput, latency percentiles and peak memory of common workloads, and saves the results as JSON
+so they can be compared between versions:
+
+    python -m benchmarks.suite --out before.json
+    # ... change things ...
+    python -m benchmarks.suite --out after.json --compare before.json
+
+Usage: python -m benchmarks.suite [--scale N] [--latency S] [--error-rate R] [--config config.json]
+                                  [--only scenario ...] [--no-memory] [--out results.json] [--compare old.json]
+
+`--config` is a JSON object of endpoint group -> `EndpointConfig` arguments, overriding the defaults, e.g.
+`{"routing": {"latency": 0.05, "payload_size": 2000}}`.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from onemap_py import Client, Transport, Metrics, RequestPolicy, Backoff, OneMapError
+from .stub_server import StubServer, EndpointConfig
+
+# Endpoint group -> default stub configuration, `latency` and `error_rate` are overridden from the command line
+DEFAULT_PAYLOADS = {
+    "search": 45,
+    "convert": 1,
+    "revgeocode": 10,
+    "routing": 500,
+    "popapi": 55,
+    "themesvc": 200,
+}
+
+
+def make_client(url: str, metrics: Metrics, max_workers: int) -> Client:
+    transport = Transport(timeout=10, pool_maxsize=max_workers, metrics=metrics,
+                          policy=RequestPolicy(retry=Backoff(max_retries=3, base=0.01)))
+    client = Client("bench@example.com", "password", transport=transport)
+    for om in [client, client.Themes, client.PlanningAreas, client.Router, client.Population]:
+        om.url = url
+    client.tokens.url = url
+    client.authenticate()
+    return client
+
+
+def _guarded(fn):
+    # Count failures instead of aborting the scenario
+    try:
+        fn()
+        return 0
+    except OneMapError:
+        return 1
+
+
+def single_search(client: Client, scale: int, max_workers: int):
+    n = 200 * scale
+    return n, sum(_guarded(lambda: client.search("STUB")) for _ in range(n))
+
+
+def concurrent_search(client: Client, scale: int, max_workers: int):
+    n = 1000 * scale
+    with ThreadPoolExecutor(max_workers) as pool:
+        errors = sum(pool.map(lambda i: _guarded(lambda: client.search(str(i))), range(n)))
+    return n, errors
+
+
+def reverse_geocode(client: Client, scale: int, max_workers: int):
+    n = 500 * scale
+    with ThreadPoolExecutor(max_workers) as pool:
+        errors = sum(pool.map(lambda i: _guarded(lambda: client.reverse_geocode(latlng=(1.3, 103.8))), range(n)))
+    return n, errors
+
+
+def pagination(client: Client, scale: int, max_workers: int):
+    n = 20 * scale
+    errors = 0
+    for _ in range(n):
+        try:
+            client.search_all("STUB", max_workers=max_workers)
+        except OneMapError:
+            errors += 1
+    return n, errors
+
+
+def bulk_geocode(client: Client, scale: int, max_workers: int):
+    queries = [f"{i:06d}" for i in range(2000 * scale)]
+    errors = sum(result.status == "error" for result in client.bulk_geocode(queries, max_workers=max_workers))
+    return len(queries), errors
+
+
+def route_matrix(client: Client, scale: int, max_workers: int):
+    size = 10 * scale
+    points = [(1.3 + 0.001 * i, 103.8 + 0.001 * i) for i in range(size)]
+    matrix = client.Router.route_matrix(points, points, "drive", max_workers=max_workers, skip_diagonal=True)
+    # Cells without a route are NaN
+    return size * (size - 1), int(np.isnan(matrix.time).sum())
+
+
+def planning_areas(client: Client, scale: int, max_workers: int):
+    n = 5 * scale
+    errors = 0
+    for _ in range(n):
+        try:
+            client.PlanningAreas.build_index(year=2014)
+        except OneMapError:
+            errors += 1
+    return n, errors
+
+
+SCENARIOS = {
+    "single_search": single_search,
+    "concurrent_search": concurrent_search,
+    "reverse_geocode": reverse_geocode,
+    "pagination": pagination,
+    "bulk_geocode": bulk_geocode,
+    "route_matrix": route_matrix,
+    "planning_areas": planning_areas,
+}
+
+
+def run_scenario(name: str, url: str, scale: int, max_workers: int, memory: bool) -> dict:
+    scenario = SCENARIOS[name]
+
+    metrics = Metrics()
+    client = make_client(url, metrics, max_workers)
+    metrics.reset()
+    start = time.perf_counter()
+    ops, errors = scenario(client, scale, max_workers)
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    snapshot = metrics.snapshot()
+    requests = sum(s["requests"] for s in snapshot.values())
+    result = {"ops": ops,
+              "errors": errors,
+              "seconds": elapsed,
+              "ops_per_sec": ops / elapsed,
+              "requests": requests,
+              "requests_per_sec": requests / elapsed,
+              "retries": sum(s["retries"] for s in snapshot.values()),
+              "bytes": sum(s["bytes"] for s in snapshot.values()),
+              "endpoints": {endpoint: {"requests": s["requests"],
+                                       "latency": s["latency"],
+                                       "parse": s["parse"]} for endpoint, s in snapshot.items()}}
+
+    if memory:
+        # Separate run, tracing allocations slows down the timing considerably
+        client = make_client(url, None, max_workers)
+        tracemalloc.start()
+        scenario(client, scale, max_workers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        client.close()
+        result["peak_memory_bytes"] = peak
+
+    return result
+
+
+def stub_config(latency: float, error_rate: float, overrides: dict = None) -> dict:
+    config = {group: EndpointConfig(latency=latency, error_rate=error_rate, payload_size=size)
+              for group, size in DEFAULT_PAYLOADS.items()}
+    for group, kwargs in (overrides or {}).items():
+        config[group] = EndpointConfig(**dict(config.get(group, EndpointConfig()).to_dict(), **kwargs))
+    return config
+
+
+def compare(results: dict, baseline: dict):
+    print(f"\n{'scenario':<20}{'ops/s':>12}{'baseline':>12}{'ratio':>8}{'peak MiB':>10}{'baseline':>10}")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["ops_per_sec"] / old["ops_per_sec"] if old["ops_per_sec"] else float("nan")
+        mem = result.get("peak_memory_bytes", float("nan")) / 2 ** 20
+        old_mem = old.get("peak_memory_bytes", float("nan")) / 2 ** 20
+        print(f"{name:<20}{result['ops_per_sec']:>12.1f}{old['ops_per_sec']:>12.1f}{ratio:>8.2f}"
+              f"{mem:>10.1f}{old_mem:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark onemap_py against a local OneMap stub server")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier of every scenario's size")
+    parser.add_argument("--latency", type=float, default=0.002, help="Stub server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of failed stub responses")
+    parser.add_argument("--config", help="JSON file of per endpoint group stub configuration")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrency of the concurrent scenarios")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), help="Scenarios to run")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory measurements")
+    parser.add_argument("--out", help="Path to save the results to as JSON")
+    parser.add_argument("--compare", help="Results JSON of a previous run to compare against")
+    args = parser.parse_args(argv)
+    # Failures are counted per scenario instead
+    logging.getLogger("onemap_py").setLevel(logging.ERROR)
+
+    overrides = None
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+    config = stub_config(args.latency, args.error_rate, overrides)
+
+    results = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+               "python": sys.version.split()[0],
+               "platform": platform.platform(),
+               "scale": args.scale,
+               "workers": args.workers,
+               "stub": {group: c.to_dict() for group, c in config.items()},
+               "results": {}}
+
+    with StubServer(config, process=True) as server:
+        for name in args.only or SCENARIOS:
+            result = run_scenario(name, server.url, args.scale, args.workers, not args.no_memory)
+            results["results"][name] = result
+            latency = max(result["endpoints"].values(), key=lambda s: s["requests"])["latency"]
+            peak = f"{result['peak_memory_bytes'] / 2 ** 20:8.1f} MiB" if "peak_memory_bytes" in result else ""
+            print(f"{name:<20}{result['ops_per_sec']:>10.1f} ops/s  p50 {latency['p50'] * 1000:7.2f} ms"
+                  f"  p99 {latency['p99'] * 1000:7.2f} ms  errors {result['errors']:>5}  {peak}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
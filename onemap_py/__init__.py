@@ -1,21 +1,63 @@
 from .base import OneMap
 from .themes import Themes
 from .planning_areas import PlanningAreas
-from .population import Population
+from .geometry import PlanningAreaBoundaries
+from .population import Population, PopulationCube
 from .routing import Router
+from .transport import Transport
+from .auth import TokenProvider
+from .cache import ResponseCache, MemoryCache, SQLiteCache
+from .ratelimit import RateLimiter, TokenBucket
+from .policy import RequestPolicy, Backoff, CircuitBreaker
+from .metrics import Metrics
+from .exceptions import OneMapError, RetryError, CircuitOpenError, PostalCodeNotFoundError
+from .snapshot import Snapshot, export_snapshot, load_snapshot
+from .aio import AsyncClient, AsyncTransport
 
 
 class Client(OneMap):
-    def __init__(self, email = None, password = None, timeout = 10):
-        super().__init__(email, password, timeout)
-        self.Themes = Themes()
-        self.PlanningAreas = PlanningAreas()
-        self.Router = Router()
-        self.Population = Population()
+    def __init__(self, email = None, password = None, timeout = 10, transport: Transport = None,
+                 tokens: TokenProvider = None, snapshot=None):
+        """
+
+        :param email: OneMap account email
+        :param password: OneMap account password
+        :param timeout: Timeout (in seconds) applied to every request
+        :param transport: (Optional) Transport to send requests through, e.g. to configure the connection pool size.
+            A new one is created if not provided. It is shared with `Themes`, `PlanningAreas`, `Router` and `Population`
+        :param tokens: (Optional) `TokenProvider` holding the access token, e.g. to persist it with `token_path`.
+            A new one is created if not provided. It is shared with every module, so they authenticate only once
+        :param snapshot: (Optional) `Snapshot`, or path of a file written by `export_snapshot`. Planning areas,
+            population data and themes in it are then served locally, everything else from the API
+        """
+        super().__init__(email, password, timeout, transport, tokens)
+        self.Themes = Themes(timeout=timeout, transport=self.transport, tokens=self.tokens)
+        self.PlanningAreas = PlanningAreas(timeout=timeout, transport=self.transport, tokens=self.tokens)
+        self.Router = Router(timeout=max(timeout, 30), transport=self.transport, tokens=self.tokens)
+        self.Population = Population(timeout=timeout, transport=self.transport, tokens=self.tokens)
+        if snapshot is not None:
+            self.use_snapshot(snapshot)
+
+    def use_snapshot(self, snapshot):
+        """
+        Serve planning areas, population data and themes from `snapshot` from now on, None to go back to the API
+        :param snapshot: `Snapshot`, path of a file written by `export_snapshot`, or None
+        """
+        if isinstance(snapshot, str):
+            snapshot = load_snapshot(snapshot)
+        for om in [self, self.Themes, self.PlanningAreas, self.Router, self.Population]:
+            om.snapshot = snapshot
+
+    def export_snapshot(self, path: str, **kwargs) -> Snapshot:
+        """
+        Download planning areas, population data and themes into a snapshot file, see `snapshot.export_snapshot`
+        """
+        return export_snapshot(self, path, **kwargs)
 
     def authenticate(self):
+        # Modules share the token provider, so they are all authenticated at once
         self.check_auth_and_authenticate()
-        for module in [self.Themes, self.PlanningAreas, self.Router, self.Population]:
-            # Update authenticated status
-            module.token = self.token
-            module.authenticated = self.authenticated
+
+    def close(self):
+        # Release pooled connections held by the shared transport
+        self.transport.close()
@@ -0,0 +1,549 @@
+import asyncio
+from urllib.parse import urlsplit
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+from . import crs
+from .auth import TokenProvider
+from .base import OneMap
+from .cache import MemoryCache, ResponseCache
+from .exceptions import OneMapError
+from .geocoding import AsyncPostalResolver, ReverseGeocoder
+from .geometry import PlanningAreaBoundaries
+from .metrics import Metrics, RequestEvent
+from .policy import RequestPolicy
+from .themes import Themes
+from .planning_areas import PlanningAreas
+from .population import Population, PopulationCube
+from .routing import Router
+from .spatial import PlanningAreaIndex, ThemeIndex
+
+
+class AsyncTransport(object):
+    """
+    asyncio counterpart of `Transport`, backed by a single `httpx.AsyncClient`.
+
+    A semaphore bounds the number of requests in flight, so that thousands of tasks can be scheduled
+    at once without opening thousands of connections.
+    """
+    def __init__(self, timeout: float = 10, max_concurrency: int = 100,
+                 max_connections: int = 100, max_keepalive_connections: int = 20,
+                 cache: ResponseCache = None, policy: RequestPolicy = None, metrics: Metrics = None):
+        """
+
+        :param timeout: Default timeout (in seconds) applied to every request that does not specify its own
+        :param max_concurrency: Maximum number of requests in flight at any one time
+        :param max_connections: Maximum number of open connections in the pool
+        :param max_keepalive_connections: Maximum number of idle connections kept alive in the pool
+        :param cache: (Optional) Cache for responses of read-only endpoints, may be shared with a `Transport`
+        :param policy: (Optional) Rate limits, retries and circuit breaker applied to every request,
+            may be shared with a `Transport`
+        :param metrics: (Optional) Per-endpoint request metrics, may be shared with a `Transport`
+        """
+        if httpx is None:
+            raise ImportError("AsyncTransport requires `httpx`, install it with `pip install onemap-py[async]`")
+
+        self.timeout = timeout
+        self.cache = cache
+        self.policy = policy
+        self.metrics = metrics
+        self.max_concurrency = max_concurrency
+        self.client = httpx.AsyncClient(timeout=timeout,
+                                        limits=httpx.Limits(max_connections=max_connections,
+                                                            max_keepalive_connections=max_keepalive_connections))
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created lazily so that it is bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def request(self, method: str, url: str, timeout: float = None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        if self.policy is None:
+            return await self._request(method, url, timeout, **kwargs)
+        return await self.policy.send_async(url, lambda: self._request(method, url, timeout, **kwargs),
+                                            errors=(httpx.TransportError,), on_retry=self._on_retry)
+
+    def _on_retry(self, url: str):
+        if self.metrics is not None:
+            self.metrics.record_retry(urlsplit(url).path)
+
+    async def _request(self, method: str, url: str, timeout: float, **kwargs):
+        async with self.semaphore:
+            return await self.client.request(method, url, timeout=timeout, **kwargs)
+
+    async def get(self, url: str, params: dict = None, timeout: float = None, **kwargs):
+        if params is not None:
+            # `requests` drops None-valued parameters, `httpx` would send them as empty strings
+            params = {k: v for k, v in params.items() if v is not None}
+        return await self.request("GET", url, params=params, timeout=timeout, **kwargs)
+
+    async def post(self, url: str, json: dict = None, timeout: float = None, **kwargs):
+        return await self.request("POST", url, json=json, timeout=timeout, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _SyncOnly(object):
+    """
+    Hides an attribute of the synchronous client that is built on threads or blocking I/O, and so cannot work on
+    an event loop: using it raises a `TypeError` instead of blocking the loop or returning un-awaited coroutines.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        raise TypeError(f"`{self.name}` runs on threads and is only available on the synchronous `Client`, "
+                        f"not on {type(instance).__name__}")
+
+
+class AsyncOneMap(OneMap):
+    """
+    Awaitable version of `OneMap`. Every public method is a coroutine returning the same dict as its
+    synchronous counterpart.
+    """
+    bulk_geocode = _SyncOnly()
+    reverse_geocoder = _SyncOnly()
+    _stream = _SyncOnly()
+    _send_stream = _SyncOnly()
+
+    def __init__(self, email = None, password = None, timeout = 10, transport: AsyncTransport = None,
+                 tokens: TokenProvider = None):
+        if transport is None:
+            transport = AsyncTransport(timeout=timeout)
+        if tokens is None:
+            tokens = TokenProvider(email, password, transport=transport, timeout=timeout)
+        # Not super(): in the module subclasses below the next class in the MRO is the synchronous module
+        OneMap.__init__(self, email, password, timeout, transport, tokens)
+
+    async def _get(self, endpoint: str, params: dict = None):
+        url = f"{self.url}{endpoint}"
+        with RequestEvent(self.transport.metrics, endpoint, params) as event:
+            response = await self._fetch(url, endpoint, params)
+
+            if params is not None and "token" in params and self._token_rejected(response):
+                self.logger.warning("Token rejected, refreshing")
+                params = dict(params, token=await self.tokens.refresh_async(stale_token=params["token"]))
+                response = await self._fetch(url, endpoint, params)
+
+            event.received(response)
+            return self.parse_response(response)
+
+    async def _fetch(self, url: str, endpoint: str, params: dict = None):
+        cache = self.transport.cache
+        ttl = None if cache is None else cache.ttl_for(endpoint)
+        if ttl is None:
+            return await self._send(url, params)
+        return await cache.afetch(cache.key(url, params), ttl, lambda: self._send(url, params))
+
+    async def _send(self, url: str, params: dict = None):
+        response = await self.transport.get(url=url, params=params, timeout=self.timeout)
+        self.logger.debug(f"GET {response.url}")
+
+        return response
+
+    async def _authenticate(self, email: str = None, password: str = None,
+                            auth_endpoint: str = "/privateapi/auth/post/getToken"):
+        await self.tokens.authenticate_async(email, password, auth_endpoint)
+
+    async def check_auth_and_authenticate(self):
+        if not self.authenticated:
+            self.logger.warning("Proceeding to authenticate")
+        # Refreshes the shared token if missing or about to expire, once across all tasks
+        await self.tokens.get_token_async()
+
+    async def search(self, search_val: str = None,
+                     return_geometry:str = "Y", get_address_details:str = "Y",
+                     page_num: int = 1,
+                     search_endpoint='/commonapi/search'):
+        payload = {"searchVal": search_val,
+                   "returnGeom": return_geometry,
+                   "getAddrDetails": get_address_details,
+                   "pageNum": page_num}
+
+        return await self._get(search_endpoint, payload)
+
+    async def iter_search(self, search_val: str = None,
+                          return_geometry: str = "Y", get_address_details: str = "Y",
+                          max_results: int = None, max_workers: int = 4,
+                          search_endpoint='/commonapi/search'):
+        """
+        Async generator over the results of every page of a search, see `OneMap.iter_search`
+        """
+        async def fetch(page_num):
+            page = await self.search(search_val, return_geometry, get_address_details, page_num, search_endpoint)
+            return self._check_search_page(page)
+
+        first_page = await fetch(1)
+        pages = iter(self._search_pages(first_page, max_results))
+        in_flight = [asyncio.ensure_future(fetch(page_num)) for _, page_num in zip(range(max_workers), pages)]
+
+        yielded = 0
+        page = first_page
+        try:
+            while True:
+                for result in page["results"]:
+                    if max_results is not None and yielded >= max_results:
+                        return
+                    yield result
+                    yielded += 1
+                if not in_flight:
+                    return
+                page = await in_flight.pop(0)
+                for page_num in pages:
+                    in_flight.append(asyncio.ensure_future(fetch(page_num)))
+                    break
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def search_all(self, search_val: str = None,
+                         return_geometry: str = "Y", get_address_details: str = "Y",
+                         max_results: int = None, max_workers: int = 4,
+                         search_endpoint='/commonapi/search'):
+        return [result async for result in self.iter_search(search_val, return_geometry, get_address_details,
+                                                            max_results, max_workers, search_endpoint)]
+
+    async def convert_coordinates(self, source: str, target: str,
+                                  x: float = None, y: float = None,
+                                  lat: float = None, lng: float = None,
+                                  endpoint = "/commonapi/convert/",
+                                  offline: bool = False):
+        if offline:
+            return crs.convert_coordinates(source, target, x, y, lat, lng)
+
+        final_endpoint, payload = self._convert_coordinates_request(source, target, x, y, lat, lng, endpoint)
+
+        return await self._get(final_endpoint, payload)
+
+    async def reverse_geocode(self, radius: int = 10, xy: Tuple[float, float] = None,
+                              latlng: Tuple[float, float] = None,
+                              address_type: str = "All",
+                              other_features: str = "Y",
+                              endpoint = '/privateapi/commonsvc/revgeocode'):
+        await self.check_auth_and_authenticate()
+
+        endpoint, payload = self._reverse_geocode_request(radius, xy, latlng, address_type, other_features, endpoint)
+
+        return await self._get(endpoint, payload)
+
+    async def reverse_geocode_many(self, points, radius: int = 10, xy: bool = False, cell_size: float = None,
+                                   address_type: str = "All", other_features: str = "Y") -> list:
+        """
+        Awaitable version of `OneMap.reverse_geocode_many`, concurrency is bounded by the transport.
+        Cells are de-duplicated within a call, attach a `ResponseCache` to the transport to also reuse them across
+        calls
+        """
+        cell_size = ReverseGeocoder.cell_size_for(radius, cell_size)
+        unique, inverse = np.unique(ReverseGeocoder.cells(points, xy, cell_size), axis=0, return_inverse=True)
+        await self.check_auth_and_authenticate()
+
+        async def resolve(cell):
+            response = await self.reverse_geocode(radius, address_type=address_type, other_features=other_features,
+                                                  **ReverseGeocoder.centre(cell, xy, cell_size))
+            try:
+                return ReverseGeocoder.check(cell, xy, response)
+            except ValueError as e:
+                return e
+
+        results = await asyncio.gather(*[resolve(cell) for cell in unique.tolist()])
+
+        return [results[i] for i in inverse.ravel()]
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncThemes(AsyncOneMap, Themes):
+    def __init__(self, timeout = 10, transport: AsyncTransport = None, tokens: TokenProvider = None):
+        AsyncOneMap.__init__(self, timeout=timeout, transport=transport, tokens=tokens)
+
+    async def get_theme_info(self, theme_name: str,
+                             endpoint: str = "/privateapi/themesvc/getThemeInfo"):
+        await self.check_auth_and_authenticate()
+
+        return await self._get(endpoint, {"token": self.token, "queryName": theme_name})
+
+    async def get_all_themes_info(self, more_info = "Y",
+                                  theme_endpoint: str = "/privateapi/themesvc/getAllThemesInfo"):
+        await self.check_auth_and_authenticate()
+
+        return await self._get(theme_endpoint, {"token": self.token, "moreInfo": more_info})
+
+    async def retrieve_theme(self, theme: str, bbox: Tuple[Tuple[float, float], Tuple[float, float]] = None,
+                             endpoint="/privateapi/themesvc/retrieveTheme"):
+        await self.check_auth_and_authenticate()
+
+        response = await self._get(endpoint, self._retrieve_theme_payload(theme, bbox))
+
+        return self._split_theme_results(response)
+
+    async def iter_theme(self, theme: str, bbox: Tuple[Tuple[float, float], Tuple[float, float]] = None,
+                         endpoint="/privateapi/themesvc/retrieveTheme"):
+        """
+        Async generator over the results of `retrieve_theme`. Unlike `Themes.iter_theme` the response is not
+        streamed, it is downloaded whole first
+        :raises OneMapError: If the request failed
+        """
+        response = await self.retrieve_theme(theme, bbox, endpoint)
+        if not isinstance(response, tuple):
+            raise OneMapError(f"Failed to retrieve theme {theme}: {response}")
+        for record in response[1]:
+            yield record
+
+    async def get_list_of_available_themes(self):
+        themes = await self.get_all_themes_info()
+
+        return self._theme_query_names(themes)
+
+    async def build_index(self, theme: str, **kwargs) -> ThemeIndex:
+        response = await self.retrieve_theme(theme)
+        if not isinstance(response, tuple):
+            raise ValueError(f"Failed to retrieve theme {theme}: {response}")
+
+        return ThemeIndex(response[1], response[0], theme=theme, **kwargs)
+
+
+class AsyncPlanningAreas(AsyncOneMap, PlanningAreas):
+    def __init__(self, timeout = 10, transport: AsyncTransport = None, tokens: TokenProvider = None):
+        AsyncOneMap.__init__(self, timeout=timeout, transport=transport, tokens=tokens)
+        self.supported_years = [1998, 2008, 2014]
+
+    async def get_all_planning_areas(self, year: int = 2014, names_only: bool = False,
+                                     endpoint = "/privateapi/popapi/getAllPlanningarea"):
+        if names_only:
+            endpoint = "/privateapi/popapi/getPlanningareaNames"
+
+        await self.check_auth_and_authenticate()
+
+        return await self._get(endpoint, {"token": self.token, "year": year})
+
+    async def iter_planning_areas(self, year: int = 2014, endpoint="/privateapi/popapi/getAllPlanningarea"):
+        """
+        Async generator over the planning areas of `get_all_planning_areas`. Unlike
+        `PlanningAreas.iter_planning_areas` the response is not streamed, it is downloaded whole first
+        :raises OneMapError: If the request failed
+        """
+        response = await self.get_all_planning_areas(year=year, endpoint=endpoint)
+        if not isinstance(response, dict) or "SearchResults" not in response:
+            raise OneMapError(f"Failed to get planning areas: {response}")
+        for record in response["SearchResults"]:
+            yield record
+
+    async def get_boundaries(self, year: int = 2014) -> PlanningAreaBoundaries:
+        return PlanningAreaBoundaries.from_records([record async for record in self.iter_planning_areas(year)],
+                                                   year=year)
+
+    async def build_index(self, year: int = 2014, **kwargs) -> PlanningAreaIndex:
+        return PlanningAreaIndex.from_boundaries(await self.get_boundaries(year), **kwargs)
+
+    async def find_planning_area(self, lat: float, lng: float, year: int = 2014,
+                                 endpoint = "/privateapi/popapi/getPlanningarea"):
+        await self.check_auth_and_authenticate()
+
+        return await self._get(endpoint, {"token": self.token,
+                                          "lat": lat,
+                                          "lng": lng,
+                                          "year": year})
+
+
+class AsyncPopulation(AsyncOneMap, Population):
+    def __init__(self, timeout = 10, transport: AsyncTransport = None, tokens: TokenProvider = None):
+        AsyncOneMap.__init__(self, timeout=timeout, transport=transport, tokens=tokens)
+
+    async def get_population_data(self,
+                                  data_type: str,
+                                  year: int,
+                                  planning_area: str,
+                                  endpoint="/privateapi/popapi"):
+        error = self._check_data_type(data_type)
+        if error is not None:
+            return error
+
+        await self.check_auth_and_authenticate()
+
+        return await self._get(f"{endpoint}{self.data_to_endpoint[data_type]}",
+                               {"token": self.token,
+                                "year": year,
+                                "planningArea": planning_area})
+
+    async def get_population_by_gender(self,
+                                       data_type: str,
+                                       year: int,
+                                       planning_area: str,
+                                       gender: str = None,
+                                       endpoint="/privateapi/popapi"):
+        error = self._check_data_type(data_type)
+        if error is not None:
+            return error
+
+        await self.check_auth_and_authenticate()
+
+        return await self._get(f"{endpoint}{self.data_to_endpoint[data_type]}",
+                               {"token": self.token,
+                                "year": year,
+                                "planningArea": planning_area,
+                                "gender": gender})
+
+    async def fetch_cube(self, data_types, years, planning_areas=None, by_gender: bool = False,
+                         genders=("male", "female"), cube: PopulationCube = None,
+                         planning_area_year: int = 2014) -> PopulationCube:
+        """
+        Awaitable version of `Population.fetch_cube`, concurrency is bounded by the transport
+        """
+        data_types = self._cube_data_types(data_types)
+        await self.check_auth_and_authenticate()
+
+        if planning_areas is None:
+            planning_area_source = AsyncPlanningAreas(timeout=self.timeout, transport=self.transport,
+                                                      tokens=self.tokens)
+            planning_area_source.url = self.url
+            names = await planning_area_source.get_all_planning_areas(year=planning_area_year, names_only=True)
+            if not isinstance(names, list):
+                raise ValueError(f"Failed to list planning areas: {names}")
+            planning_areas = [area["pln_area_n"] for area in names]
+
+        cube = cube if cube is not None else PopulationCube()
+        missing = self._cube_missing(cube, data_types, years, planning_areas, by_gender, genders)
+
+        async def fetch(cell):
+            data_type, year, planning_area, gender = cell
+            try:
+                if gender:
+                    return await self.get_population_by_gender(data_type, year, planning_area, gender)
+                return await self.get_population_data(data_type, year, planning_area)
+            except Exception as e:
+                self.logger.warning(f"Failed to fetch population data {cell}: {e}")
+                return None
+
+        for cell, response in zip(missing, await asyncio.gather(*[fetch(cell) for cell in missing])):
+            cube.add(cell, response)
+
+        return cube
+
+
+class AsyncRouter(AsyncOneMap, Router):
+    def __init__(self, email = None, password = None, timeout = 30, transport: AsyncTransport = None,
+                 tokens: TokenProvider = None):
+        AsyncOneMap.__init__(self, email, password, timeout, transport, tokens)
+        self.resolver = AsyncPostalResolver(self)
+        self.route_memo = MemoryCache(self.route_memo_size)
+
+    async def route(self, start_point: Tuple[float, float], end_point: Tuple[float, float], route_type: str,
+                    date: str = None, time: str = None,
+                    mode: str = None, max_walk_distance: int = None, num_itineraries: int = None,
+                    endpoint = "/privateapi/routingsvc/route"):
+        self._check_route_type(route_type)
+
+        await self.check_auth_and_authenticate()
+
+        payload = self._route_payload(start_point, end_point, route_type, date, time, mode,
+                                      max_walk_distance, num_itineraries)
+
+        return await self._get(endpoint, payload)
+
+    async def route_from_postal(self, start_postal: str, end_postal: str, route_type: str,
+                                date: str = None, time: str = None,
+                                mode: str = None, max_walk_distance: int = None, num_itineraries: int = None):
+        await self.check_auth_and_authenticate()
+
+        if len(start_postal) + len(end_postal) != 12:
+            raise ValueError("Please provide valid postal codes, which contain 6 digits each")
+
+        # Start and end are looked up concurrently, and memoized by self.resolver
+        points = await self.resolver.resolve_many([start_postal, end_postal])
+        start_point = self._resolved_point(points, start_postal, "starting")
+        end_point = self._resolved_point(points, end_postal, "destination")
+
+        return await self.route(start_point, end_point, route_type, date, time, mode,
+                                max_walk_distance, num_itineraries)
+
+    async def route_from_postal_many(self, postal_pairs, route_type: str,
+                                     date: str = None, time: str = None,
+                                     mode: str = None, max_walk_distance: int = None, num_itineraries: int = None):
+        self._check_route_type(route_type)
+        await self.check_auth_and_authenticate()
+
+        postal_pairs = list(postal_pairs)
+        points = await self.resolver.resolve_many([postal for pair in postal_pairs for postal in pair])
+
+        async def route(pair):
+            error = self._unresolved_postal_error(pair, points)
+            if error is not None:
+                return error
+            return await self.route(points[pair[0]], points[pair[1]], route_type, date, time, mode,
+                                    max_walk_distance, num_itineraries)
+
+        return await asyncio.gather(*[route(pair) for pair in postal_pairs])
+
+    async def route_matrix(self, origins, destinations, route_type: str,
+                           date: str = None, time: str = None,
+                           mode: str = None, max_walk_distance: int = None, num_itineraries: int = None,
+                           skip_diagonal: bool = False, keep_geometry: bool = False,
+                           endpoint = "/privateapi/routingsvc/route"):
+        """
+        Awaitable version of `Router.route_matrix`, concurrency is bounded by the transport
+        """
+        self._check_route_type(route_type)
+        await self.check_auth_and_authenticate()
+
+        origins, destinations, cells = self._matrix_cells(origins, destinations, skip_diagonal)
+        params = (route_type, date, time, mode, max_walk_distance, num_itineraries, endpoint)
+        routes = self._recall_routes(cells, params)
+        pending = [pair for pair in cells if pair not in routes]
+        responses = await asyncio.gather(*[self.route(origin, destination, route_type, date, time, mode,
+                                                      max_walk_distance, num_itineraries, endpoint)
+                                           for origin, destination in pending], return_exceptions=True)
+
+        routes.update(self._memoize_routes(pending, responses, params))
+        return self._build_matrix(origins, destinations, cells, [routes[pair] for pair in cells],
+                                  skip_diagonal, keep_geometry)
+
+
+class AsyncClient(AsyncOneMap):
+    """
+    asyncio counterpart of `Client`. All modules share one `AsyncTransport`, and therefore one connection pool
+    and one concurrency limit.
+
+        async with AsyncClient(email, password) as client:
+            await client.authenticate()
+            results = await asyncio.gather(*[client.search(i) for i in postal_codes])
+    """
+    def __init__(self, email = None, password = None, timeout = 10, transport: AsyncTransport = None,
+                 max_concurrency: int = 100, tokens: TokenProvider = None):
+        if transport is None:
+            transport = AsyncTransport(timeout=timeout, max_concurrency=max_concurrency)
+        super().__init__(email, password, timeout, transport, tokens)
+        self.Themes = AsyncThemes(timeout=timeout, transport=self.transport, tokens=self.tokens)
+        self.PlanningAreas = AsyncPlanningAreas(timeout=timeout, transport=self.transport, tokens=self.tokens)
+        self.Router = AsyncRouter(timeout=max(timeout, 30), transport=self.transport, tokens=self.tokens)
+        self.Population = AsyncPopulation(timeout=timeout, transport=self.transport, tokens=self.tokens)
+
+    async def authenticate(self):
+        # Modules share the token provider, so they are all authenticated at once
+        await self.check_auth_and_authenticate()
@@ -1,6 +1,208 @@
+import asyncio
 import requests
 import json
 import logging
+import os
+import threading
+import time
+import getpass
+
+from . import jsonio
+
+# OneMap tokens are valid for 3 days, used if a token response has no expiry
+DEFAULT_TOKEN_LIFETIME = 3 * 24 * 60 * 60
+
+
+class TokenProvider(object):
+    """
+    Holds the OneMap access token shared by `OneMap` and all of its modules.
+
+    The token's expiry is tracked and it is refreshed shortly before it expires. Refreshes are single-flight:
+    however many threads find the token stale at once, only one of them authenticates and the others reuse
+    its token. `get_token_async` does the same for asyncio tasks, through an `AsyncTransport`.
+
+    Optionally the token is persisted to `token_path`, so that new processes start without authenticating again.
+    """
+    def __init__(self, email: str = None, password: str = None,
+                 url: str = "https://developers.onemap.sg",
+                 auth_endpoint: str = "/privateapi/auth/post/getToken",
+                 transport=None, timeout: float = 10, refresh_margin: float = 600,
+                 token_path: str = None, interactive: bool = True):
+        """
+
+        :param email: OneMap account email
+        :param password: OneMap account password
+        :param url: OneMap base URL
+        :param auth_endpoint: Parameterized in case OneMap changes it
+        :param transport: (Optional) `Transport` or `AsyncTransport` to authenticate through, plain `requests`
+            if not provided
+        :param timeout: Timeout (in seconds) of the authentication request
+        :param refresh_margin: Refresh the token this many seconds before it expires
+        :param token_path: (Optional) JSON file to persist the token to, and to load it from if still valid
+        :param interactive: If credentials are missing, prompt for them (True) or raise a ValueError (False)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.email = email
+        self.password = password
+        self.url = url
+        self.auth_endpoint = auth_endpoint
+        self.transport = transport
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.token_path = token_path
+        self.interactive = interactive
+
+        self.token = None
+        self.expires_at = None
+        self.authenticated = False
+        self.refresh_count = 0
+        self._lock = threading.RLock()
+        self._async_lock = None
+
+        if token_path is not None:
+            self._load()
+
+    def needs_refresh(self) -> bool:
+        if not self.authenticated:
+            return True
+        # Tokens set by hand have no known expiry, they are only refreshed once rejected
+        return self.expires_at is not None and time.time() >= self.expires_at - self.refresh_margin
+
+    def get_token(self) -> str:
+        """
+        :return: A valid token, authenticating first if there is none or it is about to expire
+        """
+        if self.needs_refresh():
+            with self._lock:
+                # Another thread may have refreshed it while we were waiting for the lock
+                if self.needs_refresh():
+                    self.authenticate()
+        return self.token
+
+    def refresh(self, stale_token: str = None) -> str:
+        """
+        Replace a token that was rejected by the API
+        :param stale_token: The rejected token. If the current token is already a different one, it is returned
+            without authenticating again
+        :return: A new token
+        """
+        with self._lock:
+            if self.token != stale_token and not self.needs_refresh():
+                return self.token
+            self.authenticate()
+        return self.token
+
+    @property
+    def async_lock(self):
+        # Created lazily so that it is bound to the running event loop
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    async def get_token_async(self) -> str:
+        """
+        asyncio counterpart of `get_token`
+        """
+        if self.needs_refresh():
+            async with self.async_lock:
+                if self.needs_refresh():
+                    await self.authenticate_async()
+        return self.token
+
+    async def refresh_async(self, stale_token: str = None) -> str:
+        """
+        asyncio counterpart of `refresh`
+        """
+        async with self.async_lock:
+            if self.token != stale_token and not self.needs_refresh():
+                return self.token
+            await self.authenticate_async()
+        return self.token
+
+    def _credentials(self, email: str = None, password: str = None):
+        email = email if email is not None else self.email
+        password = password if password is not None else self.password
+        if email is None or password is None:
+            if not self.interactive:
+                raise ValueError("Please provide both email and password")
+            if email is None:
+                email = input("Email: ")
+            if password is None:
+                password = getpass.getpass("Password: ")
+
+        return {"email": email, "password": password}
+
+    def authenticate(self, email: str = None, password: str = None, auth_endpoint: str = None):
+        """
+        Request a new token
+        :return: Response of the authentication request
+        """
+        credentials = self._credentials(email, password)
+        url = f"{self.url}{auth_endpoint or self.auth_endpoint}"
+
+        with self._lock:
+            if self.transport is None:
+                response = requests.post(url=url, json=credentials, timeout=self.timeout)
+            else:
+                response = self.transport.post(url=url, json=credentials, timeout=self.timeout)
+            self._handle_response(response)
+
+        return response
+
+    async def authenticate_async(self, email: str = None, password: str = None, auth_endpoint: str = None):
+        """
+        asyncio counterpart of `authenticate`, `transport` must be an `AsyncTransport`
+        """
+        credentials = self._credentials(email, password)
+        url = f"{self.url}{auth_endpoint or self.auth_endpoint}"
+
+        response = await self.transport.post(url=url, json=credentials, timeout=self.timeout)
+        with self._lock:
+            self._handle_response(response)
+
+        return response
+
+    def _handle_response(self, response):
+        err_msg = "Failed to authenticate, please check credentials"
+        if response.status_code != 200:
+            self.logger.error(err_msg)
+            raise ValueError(err_msg)
+        try:
+            self._set(jsonio.loads(response.content))
+        except (KeyError, ValueError):
+            self.logger.error(err_msg)
+            raise ValueError(err_msg)
+
+        self.logger.info("Successful authentication")
+        self.refresh_count += 1
+        if self.token_path is not None:
+            self._save()
+
+    def _set(self, token_response: dict):
+        token = token_response["access_token"]
+        try:
+            expires_at = float(token_response["expiry_timestamp"])
+        except (KeyError, TypeError, ValueError):
+            expires_at = time.time() + DEFAULT_TOKEN_LIFETIME
+        self.token = token
+        self.expires_at = expires_at
+        self.authenticated = True
+
+    def _save(self):
+        with open(self.token_path, "w") as f:
+            json.dump({"access_token": self.token, "expiry_timestamp": self.expires_at}, f)
+
+    def _load(self):
+        if not os.path.exists(self.token_path):
+            return
+        try:
+            with open(self.token_path) as f:
+                self._set(json.load(f))
+        except (KeyError, ValueError):
+            self.logger.warning(f"Ignoring unreadable token file {self.token_path}")
+            return
+        if self.needs_refresh():
+            self.token, self.expires_at, self.authenticated = None, None, False
 
 
 def authenticate(email: str = None, password: str = None, keep_token=True,
@@ -13,13 +215,14 @@ def authenticate(email: str = None, password: str = None, keep_token=True,
         else:
             raise ValueError("Please provide both email and password")
 
+    # Returns the response whatever its status, unlike `TokenProvider.authenticate` which raises on failure
     response = requests.post(url=auth_url,
                              json={"email": email,
                                    "password": password})
 
     if response.status_code == 200 and keep_token:
-        # Store response text in local json
-        json.dump(obj=json.loads(response.text),
-                  fp=open("token.json", "w"))
+        # Same format as `TokenProvider(token_path="token.json")` reads
+        with open("token.json", "w") as f:
+            json.dump(obj=json.loads(response.text), fp=f)
 
     return response
@@ -1,59 +1,176 @@
 import logging
-import json
-import requests
-import getpass
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
+from . import crs, geocoding, jsonio
+from .auth import TokenProvider
+from .exceptions import OneMapError
+from .metrics import RequestEvent
+from .transport import Transport
+
+# Body of a 200 response rejecting an invalid or expired token, e.g. {"error": "Invalid token"}: nothing but an error
+# message about the token
+_TOKEN_ERROR = re.compile(rb'\s*\{\s*"error"\s*:\s*"[^"]*\btoken\b[^"]*"\s*\}\s*', re.IGNORECASE)
+
 
 class OneMap(object):
-    def __init__(self, email = None, password = None, timeout = 10):
+    def __init__(self, email = None, password = None, timeout = 10, transport: Transport = None,
+                 tokens: TokenProvider = None):
         self.logger = logging.getLogger(__name__)
-        self.token = None
-        self.authenticated = False
         self.url = "https://developers.onemap.sg"
         self.email = email
         self.password = password
         self.timeout = timeout
+        if transport is None:
+            transport = Transport(timeout=timeout)
+        self.transport = transport
+        if tokens is None:
+            tokens = TokenProvider(email, password, url=self.url, transport=transport, timeout=timeout)
+        self.tokens = tokens
+        self._reverse_geocoder = None
+        # Serves static datasets locally when set, see `snapshot.Snapshot`
+        self.snapshot = None
+
+    @property
+    def token(self):
+        return self.tokens.token
+
+    @token.setter
+    def token(self, token):
+        self.tokens.token = token
+
+    @property
+    def reverse_geocoder(self) -> geocoding.ReverseGeocoder:
+        # Created on first use, rather than for every module instance
+        if self._reverse_geocoder is None:
+            self._reverse_geocoder = geocoding.ReverseGeocoder(self)
+        return self._reverse_geocoder
+
+    @reverse_geocoder.setter
+    def reverse_geocoder(self, reverse_geocoder: geocoding.ReverseGeocoder):
+        self._reverse_geocoder = reverse_geocoder
+
+    @property
+    def authenticated(self):
+        return not self.tokens.needs_refresh()
+
+    @authenticated.setter
+    def authenticated(self, authenticated):
+        self.tokens.authenticated = authenticated
 
     @staticmethod
     def parse_response(response):
         if response.status_code == 200:
-            response = json.loads(response.text)
+            # From bytes: `response.text` would first copy (and maybe sniff the encoding of) the whole body
+            response = jsonio.loads(response.content)
         else:
             response = f"{response.status_code} - {response.text}"
 
         return response
 
-    def _authenticate(self, email: str = None, password: str = None,
-                     auth_endpoint: str = "/privateapi/auth/post/getToken"):
-        if email is None:
-            # Check if self.email is also None
-            if self.email is None:
-                email = input("Email: ")
-            else:
-                email = self.email
-        if password is None:
-            if self.password is None:
-                password = getpass.getpass("Password: ")
-            else:
-                password = self.password
-
-        response = requests.post(url=f"{self.url}{auth_endpoint}",
-                                 json={"email": email,
-                                       "password": password})
-        err_msg = "Failed to authenticate, please check credentials"
-        if response.status_code == 200:
+    def _get(self, endpoint: str, params: dict = None):
+        """
+        Send a GET request to `endpoint` through the shared transport and parse the response.
+        Responses of read-only endpoints are served from the transport's cache, if it has one,
+        and the request is recorded in the transport's metrics, if it has any
+        :param endpoint: Path relative to self.url
+        :param params: Query string parameters
+        :return: Parsed response, see `parse_response`
+        """
+        url = f"{self.url}{endpoint}"
+        with RequestEvent(self.transport.metrics, endpoint, params) as event:
+            response = self._fetch(url, endpoint, params)
+
+            if params is not None and "token" in params and self._token_rejected(response):
+                # Token expired or was revoked: refresh it (once across all threads) and retry once
+                self.logger.warning("Token rejected, refreshing")
+                params = dict(params, token=self.tokens.refresh(stale_token=params["token"]))
+                response = self._fetch(url, endpoint, params)
+
+            event.received(response)
+            return self.parse_response(response)
+
+    def _stream(self, endpoint: str, params: dict = None, key: str = None, chunk_size: int = 65536):
+        """
+        Send a GET request to `endpoint` and decode the records of the response's array one at a time, while the
+        body is being downloaded. Bypasses the transport's cache.
+        :param endpoint: Path relative to self.url
+        :param params: Query string parameters
+        :param key: Key of the array of records in the response, None if the response itself is the array
+        :param chunk_size: Number of bytes to read from the connection at a time
+        :return: Generator of the records
+        :raises OneMapError: If the request failed or the response has no such array
+        """
+        url = f"{self.url}{endpoint}"
+        # The metrics' parse time also covers the time spent by the consumer between records
+        with RequestEvent(self.transport.metrics, endpoint, params) as event:
+            response, chunks, head = self._send_stream(url, params, chunk_size)
+            if params is not None and "token" in params and self._token_rejected(response, head):
+                self.logger.warning("Token rejected, refreshing")
+                response.close()
+                params = dict(params, token=self.tokens.refresh(stale_token=params["token"]))
+                response, chunks, head = self._send_stream(url, params, chunk_size)
+
+            event.received(response, streamed=True)
+            event.bytes = len(head)
             try:
-                self.token = json.loads(response.text)['access_token']
-                self.logger.info("Successful authentication")
-                self.authenticated = True
-            except KeyError:
-                self.logger.exception(err_msg)
-                raise ValueError(err_msg)
+                if response.status_code != 200:
+                    raise OneMapError(f"{response.status_code} - {(head + b''.join(chunks)).decode(errors='replace')}")
 
-        else:
-            self.logger.exception(err_msg)
-            raise ValueError(err_msg)
+                def counted():
+                    yield head
+                    for chunk in chunks:
+                        event.bytes += len(chunk)
+                        yield chunk
+
+                yield from jsonio.iter_items(counted(), key)
+            except ValueError as e:
+                raise OneMapError(str(e)) from e
+            finally:
+                response.close()
+
+    def _send_stream(self, url: str, params: dict = None, chunk_size: int = 65536):
+        response = self.transport.get(url=url, params=params, timeout=self.timeout, stream=True)
+        self.logger.debug(f"GET {response.url}")
+        chunks = response.iter_content(chunk_size)
+        # The start of the body tells whether the token was rejected
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= 128:
+                break
+
+        return response, chunks, head
+
+    def _fetch(self, url: str, endpoint: str, params: dict = None):
+        cache = self.transport.cache
+        ttl = None if cache is None else cache.ttl_for(endpoint)
+        if ttl is None:
+            return self._send(url, params)
+        return cache.fetch(cache.key(url, params), ttl, lambda: self._send(url, params))
+
+    @staticmethod
+    def _token_rejected(response, head: bytes = None) -> bool:
+        if response.status_code == 401:
+            return True
+        if response.status_code != 200:
+            return False
+        # OneMap also reports invalid or expired tokens as a 200 with a short `error` body. `head` is the start of a
+        # streamed body: it only matches if it is the whole (short) body
+        body = response.content if head is None else head
+        return len(body) <= 512 and _TOKEN_ERROR.fullmatch(body) is not None
+
+    def _send(self, url: str, params: dict = None):
+        response = self.transport.get(url=url, params=params, timeout=self.timeout)
+        self.logger.debug(f"GET {response.url}")
+
+        return response
+
+    def _authenticate(self, email: str = None, password: str = None,
+                     auth_endpoint: str = "/privateapi/auth/post/getToken"):
+        self.tokens.authenticate(email, password, auth_endpoint)
 
     def search(self, search_val: str = None,
                return_geometry:str = "Y", get_address_details:str = "Y",
@@ -73,26 +190,127 @@ class OneMap(object):
                    "getAddrDetails": get_address_details,
                    "pageNum": page_num}
 
-        response = requests.get(url=f"{self.url}{search_endpoint}",
-                                params=payload,
-                                timeout = self.timeout)
-
-        self.logger.debug(f"Search URL: {response.url}")
         self.logger.debug(f"Search Value: {search_val}")
 
-        response = self.parse_response(response)
+        response = self._get(search_endpoint, payload)
 
         return response
 
+    @staticmethod
+    def _check_search_page(page):
+        if not isinstance(page, dict) or "results" not in page:
+            raise ValueError(f"Search failed: {page}")
+        return page
+
+    @staticmethod
+    def _search_pages(first_page: dict, max_results: int = None):
+        """
+        :return: Page numbers still to be fetched after `first_page`, given an optional `max_results` limit
+        """
+        last_page = int(first_page.get("totalNumPages", 1))
+        page_size = len(first_page["results"])
+        if max_results is not None and page_size > 0:
+            last_page = min(last_page, math.ceil(max_results / page_size))
+
+        return range(2, last_page + 1)
+
+    def iter_search(self, search_val: str = None,
+                    return_geometry: str = "Y", get_address_details: str = "Y",
+                    max_results: int = None, max_workers: int = 4,
+                    search_endpoint='/commonapi/search'):
+        """
+        Generator over the results of every page of a search, in order.
+        After the first page, up to `max_workers` of the following pages are fetched concurrently ahead of
+        the consumer. Fetching stops as soon as `max_results` results were yielded or the generator is closed.
+
+        :param search_val: string to search for
+        :param return_geometry: Y/N whether to return the geometry of each result
+        :param get_address_details: Y/N whether to return the address details of each result
+        :param max_results: (Optional) Stop after this many results
+        :param max_workers: Maximum number of pages fetched concurrently
+        :param search_endpoint: endpoint to hit for searching (parameterized in case OneMap changes it)
+        :return: Generator of result dictionaries
+        """
+        pages = self._iter_search_pages(search_val, return_geometry, get_address_details,
+                                        max_results, max_workers, search_endpoint)
+        yielded = 0
+        try:
+            for page in pages:
+                for result in page["results"]:
+                    if max_results is not None and yielded >= max_results:
+                        return
+                    yield result
+                    yielded += 1
+        finally:
+            # Stops any page fetches still in flight
+            pages.close()
+
+    def _iter_search_pages(self, search_val, return_geometry, get_address_details,
+                           max_results, max_workers, search_endpoint):
+        def fetch(page_num):
+            page = self.search(search_val, return_geometry, get_address_details, page_num, search_endpoint)
+            return self._check_search_page(page)
+
+        first_page = fetch(1)
+        yield first_page
+
+        pages = iter(self._search_pages(first_page, max_results))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        in_flight = [executor.submit(fetch, page_num) for _, page_num in zip(range(max_workers), pages)]
+        try:
+            while in_flight:
+                page = in_flight.pop(0).result()
+                # Keep the window full while the consumer works through this page
+                for page_num in pages:
+                    in_flight.append(executor.submit(fetch, page_num))
+                    break
+                yield page
+        finally:
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def search_all(self, search_val: str = None,
+                   return_geometry: str = "Y", get_address_details: str = "Y",
+                   max_results: int = None, max_workers: int = 4,
+                   search_endpoint='/commonapi/search'):
+        """
+        List of the results of every page of a search, see `iter_search`
+        """
+        return list(self.iter_search(search_val, return_geometry, get_address_details,
+                                     max_results, max_workers, search_endpoint))
+
+    def bulk_geocode(self, queries, max_workers: int = 8, rate: float = None, checkpoint: str = None,
+                     **search_kwargs):
+        """
+        Geocode many addresses or postal codes concurrently, see `geocoding.bulk_geocode`
+        :return: Generator of `GeocodeResult(input, best_match, status)` in completion order
+        """
+        return geocoding.bulk_geocode(self, queries, max_workers, rate, checkpoint, **search_kwargs)
+
+    def reverse_geocode_many(self, points, radius: int = 10, xy: bool = False, cell_size: float = None,
+                             address_type: str = "All", other_features: str = "Y", max_workers: int = 8) -> list:
+        """
+        Reverse geocode many points concurrently, snapping them to a grid of `cell_size` metres (`radius / 4` if not
+        provided) and calling the API once per distinct cell, see `geocoding.ReverseGeocoder`
+        :param points: (n, 2) array-like of (lat, lng), or of SVY21 (X, Y) if `xy`
+        :return: List with the response of every point's cell, in the order of `points`, or the `ValueError`
+            raised for it
+        """
+        return self.reverse_geocoder.reverse_geocode_many(points, radius, xy, cell_size, address_type,
+                                                          other_features, max_workers)
+
     def check_auth_and_authenticate(self):
         if not self.authenticated:
             self.logger.warning("Proceeding to authenticate")
-            self._authenticate()
+        # Refreshes the shared token if missing or about to expire
+        self.tokens.get_token()
 
     def convert_coordinates(self, source: str, target: str,
                             x: float = None, y: float = None,
                             lat: float = None, lng: float = None,
-                            endpoint = "/commonapi/convert/"):
+                            endpoint = "/commonapi/convert/",
+                            offline: bool = False):
         """
         Method to convert between coordinate reference systems (CRS)
         :param source: Source CRS, one of "WGS84", "SVY21", "EPSG3857"
@@ -102,8 +320,22 @@ class OneMap(object):
         :param lat: Latitude for source CRS WGS84
         :param lng: Longitude for source CRS WGS84
         :param endpoint: Parameterized for easy maintenance if OneMap API changes
+        :param offline: If True, convert locally without calling the API, see `onemap_py.crs`
         :return: Dictionary containing either X, Y or latitude, longitude depending on source/target CRS
         """
+        if offline:
+            return crs.convert_coordinates(source, target, x, y, lat, lng)
+
+        final_endpoint, payload = self._convert_coordinates_request(source, target, x, y, lat, lng, endpoint)
+
+        response = self._get(final_endpoint, payload)
+
+        return response
+
+    def _convert_coordinates_request(self, source: str, target: str,
+                                     x: float = None, y: float = None,
+                                     lat: float = None, lng: float = None,
+                                     endpoint = "/commonapi/convert/"):
         supported_crs = {
             "WGS84": "4326",
             "SVY21": "3414",
@@ -130,13 +362,7 @@ class OneMap(object):
                        'longitude': lng}
         final_endpoint = f"{endpoint}/{supported_crs[source]}to{supported_crs[target]}"
 
-        response = requests.get(url = f"{self.url}{final_endpoint}",
-                                params = payload,
-                                timeout = self.timeout)
-
-        response = self.parse_response(response)
-
-        return response
+        return final_endpoint, payload
 
     def reverse_geocode(self, radius: int = 10, xy: Tuple[float, float] = None,
                         latlng: Tuple[float, float] = None,
@@ -159,6 +385,17 @@ class OneMap(object):
 
         self.check_auth_and_authenticate()
 
+        endpoint, payload = self._reverse_geocode_request(radius, xy, latlng, address_type, other_features, endpoint)
+
+        response = self._get(endpoint, payload)
+
+        return response
+
+    def _reverse_geocode_request(self, radius: int = 10, xy: Tuple[float, float] = None,
+                                 latlng: Tuple[float, float] = None,
+                                 address_type: str = "All",
+                                 other_features: str = "Y",
+                                 endpoint = '/privateapi/commonsvc/revgeocode'):
         # Use latlng as default
         if latlng is not None:
             payload = {
@@ -180,10 +417,4 @@ class OneMap(object):
         else:
             raise ValueError("You must provide one of `latlng` or `xy`")
 
-        response = requests.get(url = f"{self.url}{endpoint}",
-                                params = payload,
-                                timeout = self.timeout)
-
-        response = self.parse_response(response)
-
-        return response
+        return endpoint, payload
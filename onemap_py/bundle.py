@@ -0,0 +1,71 @@
+"""
+Single-file container of NumPy arrays plus a JSON header, whose arrays can be memory-mapped back.
+
+Layout: an 8-byte magic, the header length (uint64, little-endian), the JSON header, then every array in
+little-endian byte order, each starting on a 64-byte boundary.
+"""
+import json
+import struct
+
+import numpy as np
+
+ALIGNMENT = 64
+
+
+def _aligned(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def write(path: str, magic: bytes, header: dict, arrays: dict):
+    """
+    :param path: File to write
+    :param magic: 8 bytes identifying the kind of file
+    :param header: JSON-serializable metadata
+    :param arrays: Name -> NumPy array (not of dtype object)
+    """
+    specs, contiguous = {}, {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        contiguous[name] = array
+        specs[name] = {"dtype": array.dtype.str, "shape": array.shape, "offset": offset}
+        offset += _aligned(array.nbytes)
+    encoded = json.dumps(dict(header, arrays=specs)).encode()
+    start = _aligned(len(magic) + 8 + len(encoded))
+
+    with open(path, "wb") as f:
+        f.write(magic + struct.pack("<Q", len(encoded)) + encoded)
+        for name, array in contiguous.items():
+            f.seek(start + specs[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+
+
+def read(path: str, magic: bytes, mmap_mode: str = "r"):
+    """
+    :param path: File written by `write`
+    :param magic: Expected magic
+    :param mmap_mode: Memory-map mode (see `numpy.memmap`), None to read the arrays into memory instead
+    :return: (header, arrays)
+    :raises ValueError: If the file does not start with `magic`
+    """
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a {magic.rstrip(bytes(1)).decode()} file")
+        length, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    start = _aligned(len(magic) + 8 + length)
+
+    arrays = {}
+    for name, spec in header.pop("arrays").items():
+        shape, dtype = tuple(spec["shape"]), np.dtype(spec["dtype"])
+        count = int(np.prod(shape))
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        elif mmap_mode is None:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=count, offset=start + spec["offset"]).reshape(shape)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=start + spec["offset"], shape=shape)
+
+    return header, arrays
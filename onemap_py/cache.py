@@ -0,0 +1,311 @@
+"""
+Response caching for read-only OneMap endpoints.
+
+`ResponseCache` decides what is cached and for how long, and stores raw response bodies in a pluggable
+backend: `MemoryCache` (in-process LRU) or `SQLiteCache` (on-disk LRU, shared between processes).
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlencode
+
+DAY = 24 * 60 * 60
+
+# Endpoint path fragment -> time to live (in seconds). Endpoints not listed here are never cached.
+DEFAULT_TTLS = {
+    "/commonapi/search": DAY,
+    "/commonapi/convert": 30 * DAY,
+    "/privateapi/commonsvc/revgeocode": DAY,
+    "/privateapi/popapi": 30 * DAY,
+    "/privateapi/themesvc": DAY,
+}
+
+# Request parameters that must never become part of a cache key
+SECRET_PARAMS = {"token", "email", "password"}
+
+
+class CachedResponse(object):
+    """
+    Minimal stand-in for a `requests.Response`, built from a cached body
+    """
+    status_code = 200
+
+    def __init__(self, content: bytes, url: str = None):
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class MemoryCache(object):
+    """
+    Thread-safe in-memory LRU cache
+    """
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache(object):
+    """
+    On-disk LRU cache backed by a SQLite database, so cached responses survive restarts.
+
+    The number of rows is tracked as they are inserted instead of counted on every write, and recounted every
+    `RECOUNT_EVERY` writes to pick up rows written by other processes sharing the file.
+    """
+    RECOUNT_EVERY = 1024
+
+    def __init__(self, path: str = "onemap_cache.sqlite", maxsize: int = 100000):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._count = len(self)
+        self._writes = 0
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is not None and expires < now:
+                self._count -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return bytes(value)
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                               (key, sqlite3.Binary(value), expires, now))
+            self._writes += 1
+            if self._writes % self.RECOUNT_EVERY == 0:
+                self._count = len(self)
+            elif not exists:
+                self._count += 1
+            if self._count > self.maxsize:
+                evicted = self._conn.execute("DELETE FROM responses WHERE rowid IN "
+                                             "(SELECT rowid FROM responses ORDER BY accessed LIMIT ?)",
+                                             (self._count - self.maxsize,)).rowcount
+                self._count -= evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._count -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._count = 0
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class KeyedLock(object):
+    """
+    One lock per key, created on demand and discarded once nobody holds or waits for it.
+    Used to make sure only one caller at a time fetches a given key.
+
+        with keyed_lock(key):
+            ...
+    """
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _enter(self, key, factory):
+        with self._lock:
+            entry = self._locks.setdefault(key, [factory(), 0])
+            entry[1] += 1
+        return entry
+
+    def _exit(self, key, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    @contextmanager
+    def __call__(self, key):
+        entry = self._enter(key, threading.Lock)
+        try:
+            with entry[0]:
+                yield
+        finally:
+            self._exit(key, entry)
+
+    @asynccontextmanager
+    async def acquire_async(self, key):
+        """
+        asyncio counterpart of `with keyed_lock(key)`
+        """
+        entry = self._enter(("async", key), asyncio.Lock)
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            self._exit(("async", key), entry)
+
+
+class ResponseCache(object):
+    """
+    Caches successful responses of read-only endpoints, keyed on URL and parameters minus any credentials.
+
+    Concurrent misses on the same key are collapsed: only one caller fetches, the others wait for and
+    reuse its result.
+    """
+    def __init__(self, backend=None, ttls: dict = None):
+        """
+
+        :param backend: Storage backend, `MemoryCache` or `SQLiteCache`. Defaults to a `MemoryCache`
+        :param ttls: Endpoint path fragment -> time to live in seconds, overriding `DEFAULT_TTLS`.
+            Map an endpoint to None to stop caching it
+        """
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        self.lock = KeyedLock()
+        self._stats_lock = threading.Lock()
+
+    def ttl_for(self, endpoint: str):
+        """
+        :return: Time to live for `endpoint`, or None if its responses should not be cached
+        """
+        for fragment, ttl in self.ttls.items():
+            if fragment in endpoint:
+                return ttl
+        return None
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> str:
+        if not params:
+            return url
+        items = sorted((k, v) for k, v in params.items() if v is not None and k not in SECRET_PARAMS)
+        return f"{url}?{urlencode(items)}"
+
+    def get(self, key: str):
+        return self.backend.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        self.backend.set(key, value, ttl)
+
+    @staticmethod
+    def cacheable(response) -> bool:
+        # OneMap reports some failures (e.g. an invalid token) as a 200 with an `error` body
+        return response.status_code == 200 and b'"error"' not in response.content[:64]
+
+    def _record(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, key: str, ttl: float, fetch):
+        """
+        Return the cached response for `key`, or call `fetch()` and cache its response if successful
+        :param key: Cache key, see `key`
+        :param ttl: Time to live (in seconds) of a newly cached response
+        :param fetch: Callable sending the request and returning the response
+        :return: Either the response from `fetch()`, or a `CachedResponse`
+        """
+        value = self.backend.get(key)
+        if value is None:
+            with self.lock(key):
+                # Another thread may have fetched it while we were waiting for the lock
+                value = self.backend.get(key)
+                if value is None:
+                    self._record(hit=False)
+                    response = fetch()
+                    if self.cacheable(response):
+                        self.set(key, response.content, ttl)
+                    return response
+        self._record(hit=True)
+        return CachedResponse(value, key)
+
+    async def afetch(self, key: str, ttl: float, fetch):
+        """
+        asyncio counterpart of `fetch`, `fetch()` must return an awaitable
+        """
+        value = self.backend.get(key)
+        if value is None:
+            async with self.lock.acquire_async(key):
+                value = self.backend.get(key)
+                if value is None:
+                    self._record(hit=False)
+                    response = await fetch()
+                    if self.cacheable(response):
+                        self.set(key, response.content, ttl)
+                    return response
+        self._record(hit=True)
+        return CachedResponse(value, key)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self.backend)}
@@ -0,0 +1,665 @@
+"""
+`onemap-py` command line tool: stream a CSV or JSON lines file through search, reverse geocoding, coordinate
+conversion, routing or planning area lookups.
+
+    onemap-py search addresses.csv -o geocoded.jsonl --column address --workers 8 --rate 10
+    onemap-py route trips.csv -o routes.csv --route-type drive
+    onemap-py planning-area points.jsonl -o areas.jsonl --offline
+
+Input rows are read lazily and at most `--workers * 2` of them are in flight at a time, so memory stays flat
+whatever the size of the input. Results are appended to the output as they arrive (in completion order, with
+the `row` number of their input), and the progress is checkpointed next to the output: re-running the same
+command resumes where it stopped, without repeating or duplicating any row.
+
+Credentials are read from `--email` / `--password`, or the ONEMAP_EMAIL / ONEMAP_PASSWORD environment variables.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import crs, jsonio
+from .auth import TokenProvider
+from .exceptions import OneMapError
+from .geocoding import ERROR, FOUND, INVALID, NOT_FOUND, ReverseGeocoder, normalise_query
+from .policy import Backoff, RequestPolicy
+from .ratelimit import RateLimiter
+from .routing import route_summary
+from .transport import Transport
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+CHECKPOINT_VERSION = 1
+
+
+def _value(row, column: str) -> str:
+    if not isinstance(row, dict):
+        raise ValueError(f"Row is not an object: {row!r}")
+    value = row.get(column)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise ValueError(f"Missing {column!r}")
+    return value
+
+
+def _float(row, column: str) -> float:
+    value = _value(row, column)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column!r} is not a number: {value!r}") from None
+
+
+def _first(response, key: str) -> dict:
+    # First item of the list under `key`, or an empty dict
+    items = response.get(key) if isinstance(response, dict) else None
+    return items[0] if isinstance(items, list) and items and isinstance(items[0], dict) else {}
+
+
+class Job(ABC):
+    """
+    One kind of batch job: how a row is turned into an API call, and how its response is summarised.
+
+    `parse` runs in the reading thread, so invalid rows are reported without calling the API, `call` in a worker
+    thread. `columns` are the summary columns added to CSV output, JSON lines output keeps the whole response.
+    """
+    name = None
+    help = None
+    columns = []
+
+    def __init__(self, client, args):
+        """
+
+        :param client: `Client` to call the API with
+        :param args: Parsed command line arguments
+        """
+        self.client = client
+        self.args = args
+
+    @staticmethod
+    def add_arguments(parser):
+        pass
+
+    def needs_token(self) -> bool:
+        """
+        :return: Whether `call` needs an access token, which is then obtained once before the batch starts
+        """
+        return True
+
+    @abstractmethod
+    def parse(self, row) -> tuple:
+        """
+        :return: Arguments of `call` for `row`
+        :raises ValueError: If `row` lacks a valid input
+        """
+
+    @abstractmethod
+    def call(self, *args):
+        """
+        :return: Response of the API
+        """
+
+    def status(self, response) -> str:
+        if isinstance(response, list) or (isinstance(response, dict) and "error" not in response):
+            return OK
+        return ERROR
+
+    def summarise(self, response) -> dict:
+        return {}
+
+
+class SearchJob(Job):
+    name = "search"
+    help = "Geocode addresses or postal codes with `search`, keeping the best match"
+    columns = ["found", "SEARCHVAL", "ADDRESS", "POSTAL", "LATITUDE", "LONGITUDE", "X", "Y"]
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--column", default="query", help="Column of the address or postal code")
+        parser.add_argument("--return-geometry", default="Y", choices=["Y", "N"])
+        parser.add_argument("--address-details", default="Y", choices=["Y", "N"])
+
+    def needs_token(self) -> bool:
+        return False
+
+    def parse(self, row) -> tuple:
+        # Postal codes that lost their leading zero in a spreadsheet are restored
+        query = normalise_query(_value(row, self.args.column))
+        if query is None:
+            raise ValueError(f"Missing {self.args.column!r}")
+        return query,
+
+    def call(self, query: str):
+        return self.client.search(query, return_geometry=self.args.return_geometry,
+                                  get_address_details=self.args.address_details)
+
+    def status(self, response) -> str:
+        if not isinstance(response, dict) or "results" not in response:
+            return ERROR
+        return FOUND if response["results"] else NOT_FOUND
+
+    def summarise(self, response) -> dict:
+        summary = {column: value for column, value in _first(response, "results").items() if column in self.columns}
+        summary["found"] = response.get("found") if isinstance(response, dict) else None
+        return summary
+
+
+class ReverseGeocodeJob(Job):
+    name = "reverse-geocode"
+    help = "Reverse geocode (lat, lng) or SVY21 (X, Y) points, keeping the nearest building"
+    columns = ["BUILDINGNAME", "BLOCK", "ROAD", "POSTALCODE"]
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--lat-column", default="lat")
+        parser.add_argument("--lng-column", default="lng")
+        parser.add_argument("--xy", action="store_true", help="Points are SVY21 (X, Y) in --x-column/--y-column")
+        parser.add_argument("--x-column", default="X")
+        parser.add_argument("--y-column", default="Y")
+        parser.add_argument("--radius", type=int, default=10, help="Search radius in metres")
+        parser.add_argument("--address-type", default="All", choices=["All", "HDB"])
+        parser.add_argument("--other-features", default="Y", choices=["Y", "N"])
+        parser.add_argument("--cell-size", type=float, default=None,
+                            help="Snap points to a grid of this many metres, calling the API once per cell")
+
+    def parse(self, row) -> tuple:
+        if self.args.xy:
+            return _float(row, self.args.x_column), _float(row, self.args.y_column)
+        return _float(row, self.args.lat_column), _float(row, self.args.lng_column)
+
+    def call(self, a: float, b: float):
+        args = self.args
+        if args.cell_size:
+            cell = ReverseGeocoder.cells([(a, b)], xy=args.xy, cell_size=args.cell_size)[0]
+            return self.client.reverse_geocoder.resolve_cell(tuple(cell.tolist()), args.xy, args.cell_size,
+                                                             args.radius, args.address_type, args.other_features)
+        point = {"xy": (a, b)} if args.xy else {"latlng": (a, b)}
+        return self.client.reverse_geocode(args.radius, address_type=args.address_type,
+                                           other_features=args.other_features, **point)
+
+    def status(self, response) -> str:
+        if not isinstance(response, dict) or "error" in response:
+            return ERROR
+        return FOUND if _first(response, "GeocodeInfo") else NOT_FOUND
+
+    def summarise(self, response) -> dict:
+        return {column: value for column, value in _first(response, "GeocodeInfo").items() if column in self.columns}
+
+
+class ConvertJob(Job):
+    name = "convert"
+    help = "Convert coordinates between WGS84, SVY21 and EPSG3857"
+    columns = ["latitude", "longitude", "X", "Y"]
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--source", required=True, choices=crs.SUPPORTED_CRS)
+        parser.add_argument("--target", required=True, choices=crs.SUPPORTED_CRS)
+        parser.add_argument("--lat-column", default="lat", help="Input column if --source is WGS84")
+        parser.add_argument("--lng-column", default="lng", help="Input column if --source is WGS84")
+        parser.add_argument("--x-column", default="X", help="Input column if --source is SVY21 or EPSG3857")
+        parser.add_argument("--y-column", default="Y", help="Input column if --source is SVY21 or EPSG3857")
+        parser.add_argument("--offline", action="store_true", help="Convert locally instead of calling the API")
+
+    def needs_token(self) -> bool:
+        return False
+
+    def parse(self, row) -> tuple:
+        if self.args.source == "WGS84":
+            return _float(row, self.args.lat_column), _float(row, self.args.lng_column)
+        return _float(row, self.args.x_column), _float(row, self.args.y_column)
+
+    def call(self, a: float, b: float):
+        point = {"lat": a, "lng": b} if self.args.source == "WGS84" else {"x": a, "y": b}
+        return self.client.convert_coordinates(self.args.source, self.args.target, offline=self.args.offline,
+                                               **point)
+
+    def summarise(self, response) -> dict:
+        return {column: value for column, value in response.items() if column in self.columns} \
+            if isinstance(response, dict) else {}
+
+
+class RouteJob(Job):
+    name = "route"
+    help = "Route between (lat, lng) start and end points, keeping the total time and distance"
+    columns = ["total_time", "total_distance"]
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--route-type", required=True, choices=["walk", "drive", "cycle", "pt"])
+        parser.add_argument("--start-lat-column", default="start_lat")
+        parser.add_argument("--start-lng-column", default="start_lng")
+        parser.add_argument("--end-lat-column", default="end_lat")
+        parser.add_argument("--end-lng-column", default="end_lng")
+        parser.add_argument("--date", help="YYYY-mm-dd, public transport only")
+        parser.add_argument("--time", help="HH:MM:SS, public transport only")
+        parser.add_argument("--mode", choices=["TRANSIT", "BUS", "RAIL"], help="Public transport only")
+        parser.add_argument("--max-walk-distance", type=int, help="Public transport only")
+        parser.add_argument("--num-itineraries", type=int, help="Public transport only")
+
+    def parse(self, row) -> tuple:
+        args = self.args
+        return ((_float(row, args.start_lat_column), _float(row, args.start_lng_column)),
+                (_float(row, args.end_lat_column), _float(row, args.end_lng_column)))
+
+    def call(self, start, end):
+        args = self.args
+        return self.client.Router.route(start, end, args.route_type, args.date, args.time, args.mode,
+                                        args.max_walk_distance, args.num_itineraries)
+
+    def status(self, response) -> str:
+        try:
+            route_summary(response)
+        except (KeyError, IndexError, TypeError, ValueError):
+            return ERROR
+        return OK
+
+    def summarise(self, response) -> dict:
+        total_time, total_distance, _ = route_summary(response)
+        return {"total_time": total_time, "total_distance": total_distance}
+
+
+class PlanningAreaJob(Job):
+    name = "planning-area"
+    help = "Find the planning area of (lat, lng) points"
+    columns = ["pln_area_n"]
+
+    def __init__(self, client, args):
+        super().__init__(client, args)
+        # Built once, from the snapshot if the client has one
+        self.index = client.PlanningAreas.build_index(year=args.year) if args.offline else None
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument("--lat-column", default="lat")
+        parser.add_argument("--lng-column", default="lng")
+        parser.add_argument("--year", type=int, default=2014, choices=[1998, 2008, 2014])
+        parser.add_argument("--offline", action="store_true",
+                            help="Download the boundaries once and look points up locally")
+
+    def needs_token(self) -> bool:
+        return self.index is None
+
+    def parse(self, row) -> tuple:
+        return _float(row, self.args.lat_column), _float(row, self.args.lng_column)
+
+    def call(self, lat: float, lng: float):
+        if self.index is not None:
+            name = self.index.lookup(lat, lng)
+            return [] if name is None else [{"pln_area_n": name}]
+        return self.client.PlanningAreas.find_planning_area(lat, lng, year=self.args.year)
+
+    def status(self, response) -> str:
+        if not isinstance(response, list):
+            return ERROR
+        return FOUND if response and "pln_area_n" in response[0] else NOT_FOUND
+
+    def summarise(self, response) -> dict:
+        return {"pln_area_n": response[0].get("pln_area_n")} if isinstance(response, list) and response else {}
+
+
+JOBS = {job.name: job for job in [SearchJob, ReverseGeocodeJob, ConvertJob, RouteJob, PlanningAreaJob]}
+
+
+def _format(path: str, fmt: str = None) -> str:
+    if fmt is not None:
+        return fmt
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_rows(f, fmt: str):
+    """
+    :param f: Text file of the input
+    :param fmt: "csv" (with a header) or "jsonl"
+    :return: Generator of the input rows, read lazily
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield jsonio.loads(line)
+        except ValueError:
+            # Reported as an invalid row, rather than aborting the whole job
+            yield line.rstrip("\n")
+
+
+def count_rows(path: str, fmt: str, chunk_size: int = 1 << 20):
+    """
+    Estimate the number of input rows by counting lines, without parsing them
+    :return: Number of rows, or None if `path` is not a regular file
+    """
+    if path == "-" or not os.path.isfile(path):
+        return None
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(0, lines - 1) if fmt == "csv" else lines
+
+
+class Checkpoint(object):
+    """
+    Progress of a batch job: every row before `next_row` is done, and so are the rows in `done`. Their results
+    are the first `offset` bytes of the output.
+
+    Only rows still in flight can be done past `next_row`, so the checkpoint stays small however long the input.
+    It is replaced atomically, so after a crash it still matches the output as of its last `save`.
+    """
+    def __init__(self, path: str, job: dict, next_row: int = 0, done=(), offset: int = 0):
+        """
+
+        :param path: File to save the checkpoint to
+        :param job: Description of the job, a checkpoint is only resumed by the same job
+        """
+        self.path = path
+        self.job = job
+        self.next_row = next_row
+        self.done = set(done)
+        self.offset = offset
+
+    @classmethod
+    def load(cls, path: str, job: dict):
+        """
+        :return: `Checkpoint` saved at `path`, or a new one if there is none
+        :raises ValueError: If it was saved by a different job
+        """
+        if not os.path.exists(path):
+            return cls(path, job)
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("version") != CHECKPOINT_VERSION or state.get("job") != job:
+            raise ValueError(f"Checkpoint {path} is of another job {state.get('job')}, "
+                             f"pass --restart to start over")
+        return cls(path, job, state["next_row"], state["done"], state["offset"])
+
+    def is_done(self, row: int) -> bool:
+        return row < self.next_row or row in self.done
+
+    def complete(self, row: int):
+        self.done.add(row)
+        while self.next_row in self.done:
+            self.done.remove(self.next_row)
+            self.next_row += 1
+
+    def save(self, offset: int):
+        self.offset = offset
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": CHECKPOINT_VERSION, "job": self.job, "next_row": self.next_row,
+                       "done": sorted(self.done), "offset": offset}, f)
+        os.replace(temporary, self.path)
+
+
+class Output(object):
+    """
+    Output file, appended to one result at a time
+    """
+    META = ["row", "status", "error"]
+
+    def __init__(self, path: str, fmt: str, columns, offset: int = 0):
+        """
+
+        :param path: File to write
+        :param fmt: "jsonl" (the input row and the whole response) or "csv" (the input columns and `columns`)
+        :param columns: Summary columns of the job
+        :param offset: Keep the first `offset` bytes of an existing file, written by a previous run
+        """
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.fieldnames = None
+        mode = "r+b" if offset and os.path.exists(path) else "wb"
+        self.f = open(path, mode)
+        if mode == "r+b":
+            if fmt == "csv":
+                self.fieldnames = next(csv.reader([self.f.readline().decode()]))
+            self.f.truncate(offset)
+            self.f.seek(offset)
+
+    def write(self, row: int, status: str, record, response=None, error: str = None, summary: dict = None):
+        """
+        :param row: Number of the input row
+        :param record: Input row
+        :param summary: Summary columns, see `Job.summarise`
+        """
+        if self.fmt == "jsonl":
+            result = {"row": row, "status": status, "input": record, "result": response}
+            if error is not None:
+                result["error"] = error
+            data = json.dumps(result, ensure_ascii=False) + "\n"
+        else:
+            values = dict(record) if isinstance(record, dict) else {}
+            values.update(summary or {})
+            values.update({"row": row, "status": status, "error": error})
+            buffer = io.StringIO()
+            if self.fieldnames is None:
+                # Input columns come from the first row, like the CSV input's header
+                inputs = list(record) if isinstance(record, dict) else []
+                self.fieldnames = list(dict.fromkeys(self.META + inputs + self.columns))
+                csv.writer(buffer).writerow(self.fieldnames)
+            csv.DictWriter(buffer, self.fieldnames, extrasaction="ignore").writerow(values)
+            data = buffer.getvalue()
+        self.f.write(data.encode())
+        self.f.flush()
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+class Progress(object):
+    """
+    Live progress line on stderr: rows done, throughput and ETA
+    """
+    def __init__(self, total: int = None, skipped: int = 0, stream=None, interval: float = 0.5):
+        """
+
+        :param total: Number of input rows, if known
+        :param skipped: Rows already done by a previous run
+        :param stream: Stream to write to, None to keep quiet
+        :param interval: Minimum seconds between updates
+        """
+        self.total = total
+        self.skipped = skipped
+        self.stream = stream
+        self.interval = interval
+        self.counts = {}
+        self.done = 0
+        self.start = time.monotonic()
+        self.shown = 0.0
+
+    def update(self, status: str, force: bool = False):
+        if status is not None:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.done += 1
+        now = time.monotonic()
+        if self.stream is None or (not force and now - self.shown < self.interval):
+            return
+        self.shown = now
+        self.stream.write(f"\r{self.line(now)}\033[K")
+        self.stream.flush()
+
+    def line(self, now: float = None) -> str:
+        elapsed = (time.monotonic() if now is None else now) - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        done = self.skipped + self.done
+        line = f"{done}" + (f"/{self.total}" if self.total is not None else "") + f" rows, {rate:.1f} rows/s"
+        if self.total is not None and rate > 0:
+            line += f", ETA {time.strftime('%H:%M:%S', time.gmtime(max(0, self.total - done) / rate))}"
+        if self.counts:
+            line += " (" + ", ".join(f"{status} {count}" for status, count in sorted(self.counts.items())) + ")"
+        return line
+
+    def close(self):
+        if self.stream is not None:
+            self.update(None, force=True)
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+def run(job: Job, rows, output: Output, checkpoint: Checkpoint, max_workers: int = 8,
+        progress: Progress = None, checkpoint_interval: float = 1.0) -> dict:
+    """
+    Run `job` over `rows`, writing every result to `output` as soon as it arrives
+    :param rows: Iterable of input rows, consumed lazily
+    :param checkpoint: Rows already done are skipped, and it is saved every `checkpoint_interval` seconds
+    :param max_workers: Number of concurrent API calls
+    :return: Status -> number of rows done by this run
+    """
+    progress = progress if progress is not None else Progress()
+    futures = {}
+    saved = time.monotonic()
+
+    def finish(index, record, status, response=None, error=None):
+        nonlocal saved
+        summary = None
+        if response is not None and status not in (ERROR, INVALID):
+            summary = job.summarise(response)
+        output.write(index, status, record, response, error, summary)
+        checkpoint.complete(index)
+        progress.update(status)
+        if time.monotonic() - saved >= checkpoint_interval:
+            checkpoint.save(output.tell())
+            saved = time.monotonic()
+
+    def drain(block):
+        finished, _ = wait(list(futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, record = futures.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                logger.debug(f"Row {index} failed: {e}")
+                finish(index, record, ERROR, error=f"{type(e).__name__}: {e}")
+                continue
+            finish(index, record, job.status(response), response)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for index, record in enumerate(rows):
+            if checkpoint.is_done(index):
+                continue
+            try:
+                args = job.parse(record)
+            except ValueError as e:
+                finish(index, record, INVALID, error=str(e))
+                continue
+            futures[executor.submit(job.call, *args)] = (index, record)
+
+            # Bound the rows in flight, so that the input is only read as fast as it is processed
+            drain(block=len(futures) >= max_workers * 2)
+
+        while futures:
+            drain(block=True)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        checkpoint.save(output.tell())
+        progress.close()
+
+    return progress.counts
+
+
+def _client(args):
+    from . import Client
+
+    limiter = RateLimiter(default=args.rate) if args.rate else None
+    transport = Transport(timeout=args.timeout, pool_maxsize=max(10, args.workers),
+                          policy=RequestPolicy(limiter=limiter, retry=Backoff(max_retries=args.retries)))
+    tokens = TokenProvider(args.email, args.password, transport=transport, timeout=args.timeout,
+                           token_path=args.token_path, interactive=False)
+    return Client(args.email, args.password, timeout=args.timeout, transport=transport, tokens=tokens,
+                  snapshot=args.snapshot)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="onemap-py", description="Run a CSV or JSON lines file through OneMap")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    for name, job in JOBS.items():
+        command = commands.add_parser(name, help=job.help, description=job.help)
+        command.add_argument("input", help="CSV (with a header) or JSON lines file, - for stdin")
+        command.add_argument("-o", "--output", required=True,
+                             help="CSV or JSON lines file to append the results to, as they arrive")
+        command.add_argument("--input-format", choices=["csv", "jsonl"], help="Default: from the file extension")
+        command.add_argument("--output-format", choices=["csv", "jsonl"], help="Default: from the file extension")
+        command.add_argument("--checkpoint", help="Checkpoint file, default: OUTPUT.checkpoint")
+        command.add_argument("--restart", action="store_true", help="Ignore the checkpoint and overwrite OUTPUT")
+        command.add_argument("--workers", type=int, default=8, help="Number of concurrent API calls")
+        command.add_argument("--rate", type=float, help="Maximum API calls per second")
+        command.add_argument("--retries", type=int, default=3,
+                             help="Retries of throttled or failed requests, with exponential backoff")
+        command.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+        command.add_argument("--email", default=os.environ.get("ONEMAP_EMAIL"))
+        command.add_argument("--password", default=os.environ.get("ONEMAP_PASSWORD"))
+        command.add_argument("--token-path", help="File to keep the access token in between runs")
+        command.add_argument("--snapshot", help="Snapshot file to serve planning areas from, see export_snapshot")
+        command.add_argument("--quiet", action="store_true",
+                             help="Do not show progress, which is only shown on a terminal anyway")
+        job.add_arguments(command)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    input_format = _format(args.input, args.input_format)
+    output_format = _format(args.output, args.output_format)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    description = {"command": args.command, "input": os.path.abspath(args.input) if args.input != "-" else "-",
+                   "output_format": output_format}
+
+    try:
+        if args.restart and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        checkpoint = Checkpoint.load(checkpoint_path, description)
+        if not checkpoint.offset and not args.restart and os.path.exists(args.output) \
+                and os.path.getsize(args.output) > 0:
+            raise ValueError(f"{args.output} exists but has no checkpoint, pass --restart to overwrite it")
+        client = _client(args)
+        job = JOBS[args.command](client, args)
+        if job.needs_token():
+            # Missing or wrong credentials fail the whole job here, rather than every row
+            client.tokens.get_token()
+    except (OSError, ValueError, OneMapError) as e:
+        print(f"onemap-py: error: {e}", file=sys.stderr)
+        return 2
+
+    already = checkpoint.next_row + len(checkpoint.done)
+    progress = Progress(count_rows(args.input, input_format), skipped=already,
+                        stream=sys.stderr if not args.quiet and sys.stderr.isatty() else None)
+    output = Output(args.output, output_format, job.columns, checkpoint.offset)
+    f = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8-sig")
+    try:
+        counts = run(job, read_rows(f, input_format), output, checkpoint, max_workers=args.workers,
+                     progress=progress)
+    except KeyboardInterrupt:
+        print(f"Interrupted, re-run the same command to resume from row {checkpoint.next_row}", file=sys.stderr)
+        return 130
+    finally:
+        output.close()
+        if f is not sys.stdin:
+            f.close()
+
+    print(f"Done: {sum(counts.values())} rows " + ", ".join(f"{status} {count}" for status, count in
+                                                              sorted(counts.items())), file=sys.stderr)
+    return 1 if counts.get(ERROR) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
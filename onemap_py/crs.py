@@ -0,0 +1,294 @@
+"""
+Offline conversion between the coordinate reference systems supported by `OneMap.convert_coordinates`:
+WGS84 (EPSG:4326), SVY21 (EPSG:3414) and Web Mercator (EPSG:3857).
+
+SVY21 is a Transverse Mercator projection on the WGS84 ellipsoid, so every conversion is closed-form and
+can be evaluated on whole NumPy arrays at once.
+"""
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_CRS = ["WGS84", "SVY21", "EPSG3857"]
+
+# WGS84 ellipsoid
+_A = 6378137.0
+_F = 1 / 298.257223563
+_B = _A * (1 - _F)
+_E2 = 2 * _F - _F * _F
+_E4 = _E2 * _E2
+_E6 = _E4 * _E2
+
+# SVY21 projection origin, false northing/easting and scale factor
+_ORIGIN_LAT = 1.366666
+_ORIGIN_LNG = 103.833333
+_FALSE_NORTHING = 38744.572
+_FALSE_EASTING = 28001.642
+_K = 1.0
+
+# Meridian distance coefficients
+_A0 = 1 - (_E2 / 4) - (3 * _E4 / 64) - (5 * _E6 / 256)
+_A2 = (3. / 8) * (_E2 + (_E4 / 4) + (15 * _E6 / 128))
+_A4 = (15. / 256) * (_E4 + (3 * _E6 / 4))
+_A6 = 35 * _E6 / 3072
+
+# Footpoint latitude coefficients
+_N = (_A - _B) / (_A + _B)
+_N2 = _N ** 2
+_N3 = _N ** 3
+_N4 = _N ** 4
+_G = _A * (1 - _N) * (1 - _N2) * (1 + (9 * _N2 / 4) + (225 * _N4 / 64)) * (np.pi / 180)
+
+
+def _meridian_distance(lat_rad):
+    return _A * ((_A0 * lat_rad) - (_A2 * np.sin(2 * lat_rad))
+                 + (_A4 * np.sin(4 * lat_rad)) - (_A6 * np.sin(6 * lat_rad)))
+
+
+_ORIGIN_M = _meridian_distance(np.radians(_ORIGIN_LAT))
+
+
+def _rho(sin2_lat):
+    return _A * (1 - _E2) / (1 - _E2 * sin2_lat) ** 1.5
+
+
+def _nu(sin2_lat):
+    return _A / np.sqrt(1 - _E2 * sin2_lat)
+
+
+def wgs84_to_svy21(lat, lng) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Project WGS84 coordinates to SVY21
+    :param lat: Latitude(s) in degrees
+    :param lng: Longitude(s) in degrees
+    :return: (X, Y), i.e. (easting, northing) in metres
+    """
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.asarray(lng, dtype=np.float64)
+
+    sin_lat = np.sin(lat_rad)
+    sin2_lat = sin_lat * sin_lat
+    cos_lat = np.cos(lat_rad)
+    cos2_lat = cos_lat * cos_lat
+    cos3_lat = cos2_lat * cos_lat
+    cos4_lat = cos3_lat * cos_lat
+    cos5_lat = cos4_lat * cos_lat
+    cos6_lat = cos5_lat * cos_lat
+    cos7_lat = cos6_lat * cos_lat
+
+    rho = _rho(sin2_lat)
+    v = _nu(sin2_lat)
+    psi = v / rho
+    psi2 = psi * psi
+    psi3 = psi2 * psi
+    psi4 = psi3 * psi
+    t = np.tan(lat_rad)
+    t2 = t * t
+    t4 = t2 * t2
+    t6 = t4 * t2
+
+    w = np.radians(lng - _ORIGIN_LNG)
+    w2 = w * w
+    w4 = w2 * w2
+    w6 = w4 * w2
+    w8 = w6 * w2
+
+    m = _meridian_distance(lat_rad)
+    v_sin_lat = v * sin_lat
+
+    n_term1 = w2 / 2 * v_sin_lat * cos_lat
+    n_term2 = w4 / 24 * v_sin_lat * cos3_lat * (4 * psi2 + psi - t2)
+    n_term3 = w6 / 720 * v_sin_lat * cos5_lat * ((8 * psi4) * (11 - 24 * t2) - (28 * psi3) * (1 - 6 * t2)
+                                                 + psi2 * (1 - 32 * t2) - psi * 2 * t2 + t4)
+    n_term4 = w8 / 40320 * v_sin_lat * cos7_lat * (1385 - 3111 * t2 + 543 * t4 - t6)
+    northing = _FALSE_NORTHING + _K * (m - _ORIGIN_M + n_term1 + n_term2 + n_term3 + n_term4)
+
+    e_term1 = w2 / 6 * cos2_lat * (psi - t2)
+    e_term2 = w4 / 120 * cos4_lat * ((4 * psi3) * (1 - 6 * t2) + psi2 * (1 + 8 * t2) - psi * 2 * t2 + t4)
+    e_term3 = w6 / 5040 * cos6_lat * (61 - 479 * t2 + 179 * t4 - t6)
+    easting = _FALSE_EASTING + _K * v * w * cos_lat * (1 + e_term1 + e_term2 + e_term3)
+
+    return easting, northing
+
+
+def svy21_to_wgs84(x, y) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Unproject SVY21 coordinates to WGS84
+    :param x: Easting(s) in metres
+    :param y: Northing(s) in metres
+    :return: (latitude, longitude) in degrees
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Footpoint latitude
+    m_prime = _ORIGIN_M + (y - _FALSE_NORTHING) / _K
+    sigma = (m_prime / _G) * (np.pi / 180)
+    lat_prime = (sigma
+                 + ((3 * _N / 2) - (27 * _N3 / 32)) * np.sin(2 * sigma)
+                 + ((21 * _N2 / 16) - (55 * _N4 / 32)) * np.sin(4 * sigma)
+                 + (151 * _N3 / 96) * np.sin(6 * sigma)
+                 + (1097 * _N4 / 512) * np.sin(8 * sigma))
+
+    sin_lat_prime = np.sin(lat_prime)
+    sin2_lat_prime = sin_lat_prime * sin_lat_prime
+    rho_prime = _rho(sin2_lat_prime)
+    v_prime = _nu(sin2_lat_prime)
+    psi = v_prime / rho_prime
+    psi2 = psi * psi
+    psi3 = psi2 * psi
+    psi4 = psi3 * psi
+    t = np.tan(lat_prime)
+    t2 = t * t
+    t4 = t2 * t2
+    t6 = t4 * t2
+
+    e_prime = x - _FALSE_EASTING
+    q = e_prime / (_K * v_prime)
+    q2 = q * q
+    q3 = q2 * q
+    q5 = q3 * q2
+    q7 = q5 * q2
+
+    lat_factor = t / (_K * rho_prime)
+    lat_term1 = lat_factor * (e_prime * q / 2)
+    lat_term2 = lat_factor * (e_prime * q3 / 24) * ((-4 * psi2) + (9 * psi) * (1 - t2) + (12 * t2))
+    lat_term3 = lat_factor * (e_prime * q5 / 720) * ((8 * psi4) * (11 - 24 * t2) - (12 * psi3) * (21 - 71 * t2)
+                                                     + (15 * psi2) * (15 - 98 * t2 + 15 * t4)
+                                                     + (180 * psi) * (5 * t2 - 3 * t4) + 360 * t4)
+    lat_term4 = lat_factor * (e_prime * q7 / 40320) * (1385 - 3633 * t2 + 4095 * t4 + 1575 * t6)
+    lat = lat_prime - lat_term1 + lat_term2 - lat_term3 + lat_term4
+
+    sec_lat_prime = 1. / np.cos(lat_prime)
+    lng_term1 = q * sec_lat_prime
+    lng_term2 = ((q3 * sec_lat_prime) / 6) * (psi + 2 * t2)
+    lng_term3 = ((q5 * sec_lat_prime) / 120) * ((-4 * psi3) * (1 - 6 * t2) + psi2 * (9 - 68 * t2)
+                                                + 72 * psi * t2 + 24 * t4)
+    lng_term4 = ((q7 * sec_lat_prime) / 5040) * (61 + 662 * t2 + 1320 * t4 + 720 * t6)
+    lng = np.radians(_ORIGIN_LNG) + lng_term1 - lng_term2 + lng_term3 - lng_term4
+
+    return np.degrees(lat), np.degrees(lng)
+
+
+def wgs84_to_epsg3857(lat, lng) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Project WGS84 coordinates to Web Mercator
+    :param lat: Latitude(s) in degrees
+    :param lng: Longitude(s) in degrees
+    :return: (X, Y) in metres
+    """
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    x = _A * np.radians(np.asarray(lng, dtype=np.float64))
+    y = _A * np.log(np.tan(np.pi / 4 + lat_rad / 2))
+    return x, y
+
+
+def epsg3857_to_wgs84(x, y) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Unproject Web Mercator coordinates to WGS84
+    :param x: X coordinate(s) in metres
+    :param y: Y coordinate(s) in metres
+    :return: (latitude, longitude) in degrees
+    """
+    lng = np.degrees(np.asarray(x, dtype=np.float64) / _A)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y, dtype=np.float64) / _A)) - np.pi / 2)
+    return lat, lng
+
+
+def convert_many(source: str, target: str, x=None, y=None, lat=None, lng=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert arrays of coordinates between coordinate reference systems
+    :param source: Source CRS, one of "WGS84", "SVY21", "EPSG3857"
+    :param target: Target CRS, one of "WGS84", "SVY21", "EPSG3857"
+    :param x: X coordinates if source CRS is SVY21 or EPSG3857
+    :param y: Y coordinates if source CRS is SVY21 or EPSG3857
+    :param lat: Latitudes for source CRS WGS84
+    :param lng: Longitudes for source CRS WGS84
+    :return: (X, Y) arrays if target is SVY21 or EPSG3857, (latitude, longitude) arrays if target is WGS84
+    """
+    if source not in SUPPORTED_CRS or target not in SUPPORTED_CRS:
+        raise ValueError(f"Coordinate reference {source}->{target} not supported, supported: {SUPPORTED_CRS}")
+
+    if source == "WGS84":
+        if lat is None or lng is None:
+            raise ValueError("lat and lng must both be provided if source is WGS84")
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+    else:
+        if x is None or y is None:
+            raise ValueError("x and y must both be provided if source is one of ['SVY21', 'EPSG3857']")
+        if source == target:
+            return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        if source == "SVY21":
+            lat, lng = svy21_to_wgs84(x, y)
+        else:
+            lat, lng = epsg3857_to_wgs84(x, y)
+
+    if target == "WGS84":
+        return lat, lng
+    if target == "SVY21":
+        return wgs84_to_svy21(lat, lng)
+    return wgs84_to_epsg3857(lat, lng)
+
+
+def convert_coordinates(source: str, target: str,
+                        x: float = None, y: float = None,
+                        lat: float = None, lng: float = None) -> dict:
+    """
+    Offline drop-in for `OneMap.convert_coordinates`, returning the same dictionary as the API
+    :return: {"latitude": ..., "longitude": ...} if target is WGS84, {"X": ..., "Y": ...} otherwise
+    """
+    a, b = convert_many(source, target, x, y, lat, lng)
+    if target == "WGS84":
+        return {"latitude": float(a), "longitude": float(b)}
+    return {"X": float(a), "Y": float(b)}
+
+
+class CoordinateConverter(object):
+    """
+    Converts coordinates locally, optionally cross-checking each result against the OneMap convert endpoint.
+
+    When cross-checking, results that differ from the API by more than `tolerance` metres are logged and
+    the API's answer is returned instead.
+    """
+    def __init__(self, om=None, tolerance: float = 0.5):
+        """
+
+        :param om: (Optional) `OneMap` instance used to cross-check local results against the API
+        :param tolerance: Maximum allowed difference (in metres) between local and API results
+        """
+        self.om = om
+        self.tolerance = tolerance
+
+    def convert(self, source: str, target: str,
+                x: float = None, y: float = None,
+                lat: float = None, lng: float = None) -> dict:
+        result = convert_coordinates(source, target, x, y, lat, lng)
+        if self.om is None:
+            return result
+
+        remote = self.om.convert_coordinates(source, target, x, y, lat, lng)
+        if not isinstance(remote, dict):
+            logger.warning(f"Unable to cross-check {source}->{target} conversion: {remote}")
+            return result
+
+        difference = self._distance(target, result, remote)
+        if difference > self.tolerance:
+            logger.warning(f"Local {source}->{target} conversion differs from OneMap by {difference:.3f}m, "
+                           f"using OneMap result")
+            return remote
+        return result
+
+    def convert_many(self, source: str, target: str, x=None, y=None, lat=None, lng=None):
+        return convert_many(source, target, x, y, lat, lng)
+
+    @staticmethod
+    def _distance(target: str, a: dict, b: dict) -> float:
+        if target == "WGS84":
+            # Roughly metres per degree near the equator
+            return float(np.hypot(float(a["latitude"]) - float(b["latitude"]),
+                                  float(a["longitude"]) - float(b["longitude"])) * 111320)
+        return float(np.hypot(float(a["X"]) - float(b["X"]), float(a["Y"]) - float(b["Y"])))
@@ -0,0 +1,26 @@
+class OneMapError(Exception):
+    """
+    Base class of the errors raised by onemap_py
+    """
+
+
+class RetryError(OneMapError):
+    """
+    A request kept failing (throttled, server error or network error) until its retries were exhausted
+    """
+    def __init__(self, message: str, response=None):
+        super().__init__(message)
+        # Last response received, None if the last attempt raised
+        self.response = response
+
+
+class PostalCodeNotFoundError(OneMapError, ValueError):
+    """
+    A postal code did not return any search results
+    """
+
+
+class CircuitOpenError(OneMapError):
+    """
+    The circuit breaker is open: the API failed repeatedly, so requests fail fast until it is retried
+    """
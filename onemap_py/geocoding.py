@@ -0,0 +1,373 @@
+"""
+Bulk geocoding of addresses and postal codes on top of `OneMap.search`, and bulk reverse geocoding on top of
+`OneMap.reverse_geocode`.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from typing import Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from . import crs
+from .cache import KeyedLock, MemoryCache
+from .exceptions import PostalCodeNotFoundError
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+GeocodeResult = namedtuple("GeocodeResult", ["input", "best_match", "status"])
+
+FOUND = "found"
+NOT_FOUND = "not_found"
+INVALID = "invalid"
+ERROR = "error"
+
+_POSTAL_CODE = re.compile(r"^(?:SINGAPORE\s*|S\s*)?\(?(\d{5,6})\)?$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_query(query):
+    """
+    Normalise a search input so that equivalent inputs are only geocoded once.
+    Postal codes are reduced to their 6 digits, restoring a leading zero lost to e.g. spreadsheets
+    ("18956", "S018956", "Singapore 018956" -> "018956"). Addresses are upper-cased with whitespace collapsed.
+    :return: Normalised query, or None if there is nothing to search for
+    """
+    if query is None:
+        return None
+    if isinstance(query, int):
+        query = str(query)
+    query = _WHITESPACE.sub(" ", str(query)).strip().upper()
+    if not query:
+        return None
+
+    match = _POSTAL_CODE.match(query)
+    if match:
+        return match.group(1).zfill(6)
+    return query
+
+
+def _load_checkpoint(path: str) -> dict:
+    done = {}
+    if path is None or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash may leave a partially written last line
+                continue
+            done[record["query"]] = (record["best_match"], record["status"])
+    return done
+
+
+def bulk_geocode(om, queries, max_workers: int = 8, rate: float = None, checkpoint: str = None,
+                 **search_kwargs):
+    """
+    Geocode many addresses or postal codes, streaming results as they finish.
+
+    Inputs are normalised and de-duplicated, so every distinct query costs at most one `search` call,
+    and is searched concurrently by `max_workers` threads at no more than `rate` calls per second.
+
+    With `checkpoint`, every finished query is appended to a JSON lines file. Re-running with the same file
+    serves those queries from it, so an interrupted job resumes where it stopped. Failed queries are not
+    checkpointed and are retried on resume.
+
+    :param om: `OneMap` (or `Client`) instance to search with
+    :param queries: Iterable of addresses or postal codes, consumed lazily
+    :param max_workers: Number of concurrent searches
+    :param rate: (Optional) Maximum number of searches per second
+    :param checkpoint: (Optional) Path of the JSON lines checkpoint file
+    :param search_kwargs: Passed on to `OneMap.search`
+    :return: Generator of `GeocodeResult(input, best_match, status)`, in completion order. `best_match` is the
+        first search result, `status` one of "found", "not_found", "invalid" or "error"
+    """
+    limiter = TokenBucket(rate) if rate else None
+    done = _load_checkpoint(checkpoint)
+    waiting = {}
+    futures = {}
+
+    def geocode(query):
+        if limiter is not None:
+            limiter.acquire()
+        response = om.search(query, **search_kwargs)
+        if not isinstance(response, dict) or "results" not in response:
+            logger.warning(f"Failed to geocode {query}: {response}")
+            return None, ERROR
+        if not response["results"]:
+            return None, NOT_FOUND
+        return response["results"][0], FOUND
+
+    def drain(block):
+        finished, _ = wait(list(futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            query = futures.pop(future)
+            try:
+                best_match, status = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to geocode {query}: {e}")
+                best_match, status = None, ERROR
+            if status != ERROR:
+                done[query] = (best_match, status)
+                if out is not None:
+                    out.write(json.dumps({"query": query, "best_match": best_match, "status": status}) + "\n")
+                    out.flush()
+            for original in waiting.pop(query):
+                yield GeocodeResult(original, best_match, status)
+
+    out = open(checkpoint, "a") if checkpoint is not None else None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for original in queries:
+            query = normalise_query(original)
+            if query is None:
+                yield GeocodeResult(original, None, INVALID)
+            elif query in done:
+                yield GeocodeResult(original, *done[query])
+            elif query in waiting:
+                waiting[query].append(original)
+            else:
+                waiting[query] = [original]
+                futures[executor.submit(geocode, query)] = query
+
+            # Bound the number of queued searches, so that inputs are only read as fast as they are geocoded
+            yield from drain(block=len(futures) >= max_workers * 2)
+
+        while futures:
+            yield from drain(block=True)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if out is not None:
+            out.close()
+
+
+class PostalResolver(object):
+    """
+    Resolves postal codes to (lat, lng) through `OneMap.search`, remembering every answer.
+
+    Concurrent lookups of the same postal code share a single search. The memo is an in-memory LRU by default;
+    pass a `cache.SQLiteCache` as `backend` to keep it across processes.
+    """
+    def __init__(self, om, backend=None, maxsize: int = 100000):
+        """
+
+        :param om: `OneMap` instance to search with
+        :param backend: (Optional) Cache backend (`MemoryCache` or `SQLiteCache`) to memoize results in
+        :param maxsize: Size of the default in-memory LRU memo
+        """
+        self.om = om
+        self.backend = backend if backend is not None else MemoryCache(maxsize)
+        self.lock = KeyedLock()
+
+    def _lookup(self, postal_code: str):
+        return self._point(postal_code, self.om.search(postal_code))
+
+    @staticmethod
+    def _point(postal_code: str, response):
+        if not isinstance(response, dict) or "results" not in response:
+            # Not memoized, the next lookup tries again
+            raise ValueError(f"Failed to look up postal code {postal_code}: {response}")
+        if not response["results"]:
+            return None
+        result = response["results"][0]
+        return [float(result["LATITUDE"]), float(result["LONGITUDE"])]
+
+    def resolve(self, postal_code: str) -> Tuple[float, float]:
+        """
+        :return: (lat, lng) of the first search result for `postal_code`
+        :raises PostalCodeNotFoundError: If the postal code did not return any results
+        :raises ValueError: If the search failed
+        """
+        key = normalise_query(postal_code)
+        cached = self.backend.get(key)
+        if cached is None:
+            with self.lock(key):
+                cached = self.backend.get(key)
+                if cached is None:
+                    cached = json.dumps(self._lookup(key)).encode()
+                    self.backend.set(key, cached)
+
+        return self._decode(postal_code, cached)
+
+    @staticmethod
+    def _decode(postal_code: str, cached: bytes) -> Tuple[float, float]:
+        point = json.loads(cached)
+        if point is None:
+            raise PostalCodeNotFoundError(f"Postal code {postal_code} did not return any results")
+        return tuple(point)
+
+    def resolve_many(self, postal_codes, max_workers: int = 8) -> dict:
+        """
+        Resolve many postal codes concurrently, each distinct postal code at most once
+        :return: Dictionary of postal code -> (lat, lng), or the exception raised for it
+            (`PostalCodeNotFoundError` if it did not return any results)
+        """
+        def resolve(postal_code):
+            try:
+                return self.resolve(postal_code)
+            except Exception as e:
+                return e
+
+        unique = list(dict.fromkeys(postal_codes))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(unique, executor.map(resolve, unique)))
+
+
+class AsyncPostalResolver(PostalResolver):
+    """
+    asyncio counterpart of `PostalResolver`, searching with an `AsyncOneMap`. Concurrent lookups of the same
+    postal code share a single search, and answers are memoized in the same kinds of backend.
+    """
+    async def resolve(self, postal_code: str) -> Tuple[float, float]:
+        """
+        Awaitable version of `PostalResolver.resolve`
+        """
+        key = normalise_query(postal_code)
+        cached = self.backend.get(key)
+        if cached is None:
+            async with self.lock.acquire_async(key):
+                cached = self.backend.get(key)
+                if cached is None:
+                    cached = json.dumps(self._point(key, await self.om.search(key))).encode()
+                    self.backend.set(key, cached)
+
+        return self._decode(postal_code, cached)
+
+    async def resolve_many(self, postal_codes) -> dict:
+        """
+        Awaitable version of `PostalResolver.resolve_many`, concurrency is bounded by the transport
+        """
+        unique = list(dict.fromkeys(postal_codes))
+        points = await asyncio.gather(*[self.resolve(postal_code) for postal_code in unique], return_exceptions=True)
+        return dict(zip(unique, points))
+
+
+class ReverseGeocoder(object):
+    """
+    Reverse geocodes many points through `OneMap.reverse_geocode`, at most once per grid cell.
+
+    Points are snapped to a square grid of `cell_size` metres in SVY21, and the centre of each distinct cell is
+    reverse geocoded instead of every point. Dense traces (e.g. vehicle telemetry) collapse to a few cells, so
+    this cuts the number of API calls by orders of magnitude. Results are memoized per
+    (cell, radius, address type, other features), and concurrent lookups of the same cell share one call.
+
+    A cell's centre is up to `cell_size / sqrt(2)` metres from the points snapped to it, so `cell_size` must be
+    well below `radius`. It defaults to `radius / 4`, which moves points by at most about 0.18 * `radius`.
+    """
+    def __init__(self, om, backend=None, maxsize: int = 100000):
+        """
+
+        :param om: `OneMap` instance to reverse geocode with
+        :param backend: (Optional) Cache backend (`MemoryCache` or `SQLiteCache`) to memoize results in
+        :param maxsize: Size of the default in-memory LRU memo
+        """
+        self.om = om
+        self.backend = backend if backend is not None else MemoryCache(maxsize)
+        self.lock = KeyedLock()
+
+    @staticmethod
+    def cell_size_for(radius: float, cell_size: float = None) -> float:
+        """
+        :return: `cell_size`, or the default for `radius` if it is None
+        """
+        return radius / 4 if cell_size is None else cell_size
+
+    @staticmethod
+    def cells(points, xy: bool = False, cell_size: float = 2.5) -> np.ndarray:
+        """
+        :param points: (n, 2) array-like of (lat, lng), or of SVY21 (X, Y) if `xy`
+        :return: (n, 2) int64 array of the SVY21 grid cell of every point
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if xy:
+            x, y = points[:, 0], points[:, 1]
+        else:
+            x, y = crs.convert_many("WGS84", "SVY21", lat=points[:, 0], lng=points[:, 1])
+        return np.floor(np.stack([x, y], axis=1) / cell_size).astype(np.int64)
+
+    @staticmethod
+    def centre(cell, xy: bool, cell_size: float) -> dict:
+        """
+        :return: Centre of `cell`, as the `xy` or `latlng` argument of `OneMap.reverse_geocode`
+        """
+        x, y = (cell[0] + 0.5) * cell_size, (cell[1] + 0.5) * cell_size
+        if xy:
+            return {"xy": (round(x, 3), round(y, 3))}
+        lat, lng = crs.svy21_to_wgs84(x, y)
+        return {"latlng": (round(float(lat), 7), round(float(lng), 7))}
+
+    @staticmethod
+    def check(cell, xy: bool, response) -> dict:
+        """
+        :return: `response` of the reverse geocoding of `cell`
+        :raises ValueError: If it is an error
+        """
+        if not isinstance(response, dict) or "error" in response:
+            raise ValueError(f"Failed to reverse geocode {'xy' if xy else 'latlng'} cell {tuple(cell)}: {response}")
+        return response
+
+    def _lookup(self, cell, xy: bool, cell_size: float, radius: int, address_type: str, other_features: str):
+        response = self.om.reverse_geocode(radius, address_type=address_type, other_features=other_features,
+                                           **self.centre(cell, xy, cell_size))
+        # Failures raise, so they are not memoized and the next lookup tries again
+        return self.check(cell, xy, response)
+
+    def resolve_cell(self, cell, xy: bool = False, cell_size: float = None, radius: int = 10,
+                     address_type: str = "All", other_features: str = "Y") -> dict:
+        """
+        :param cell: (i, j) grid cell, see `cells`
+        :param cell_size: Grid cell size in metres, `radius / 4` if not provided
+        :return: Response of `OneMap.reverse_geocode` for the centre of `cell`
+        :raises ValueError: If the request failed
+        """
+        cell_size = self.cell_size_for(radius, cell_size)
+        key = f"{'xy' if xy else 'latlng'}|{cell_size}|{cell[0]}|{cell[1]}|{radius}|{address_type}|{other_features}"
+        cached = self.backend.get(key)
+        if cached is None:
+            with self.lock(key):
+                cached = self.backend.get(key)
+                if cached is None:
+                    cached = json.dumps(self._lookup(cell, xy, cell_size, radius, address_type, other_features))
+                    cached = cached.encode()
+                    self.backend.set(key, cached)
+
+        return json.loads(cached)
+
+    def reverse_geocode_many(self, points, radius: int = 10, xy: bool = False, cell_size: float = None,
+                             address_type: str = "All", other_features: str = "Y", max_workers: int = 8) -> list:
+        """
+        Reverse geocode many points, each distinct grid cell at most once
+        :param points: (n, 2) array-like of (lat, lng), or of SVY21 (X, Y) if `xy`
+        :param radius: Search radius in metres, see `OneMap.reverse_geocode`
+        :param xy: Whether `points` are SVY21 (X, Y) rather than (lat, lng)
+        :param cell_size: Grid cell size in metres, `radius / 4` if not provided
+        :param max_workers: Number of concurrent requests
+        :return: List with the response of every point's cell, in the order of `points`, or the `ValueError`
+            raised for it. Points in the same cell share the same dictionary
+        """
+        cell_size = self.cell_size_for(radius, cell_size)
+        cells = self.cells(points, xy, cell_size)
+        unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+        logger.info(f"Reverse geocoding {len(cells)} points in {len(unique)} cells")
+
+        def resolve(cell):
+            try:
+                return self.resolve_cell(cell, xy, cell_size, radius, address_type, other_features)
+            except ValueError as e:
+                return e
+
+        # Authenticate once up front rather than from every worker
+        self.om.check_auth_and_authenticate()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(resolve, unique.tolist()))
+
+        return [results[i] for i in inverse.ravel()]
+
@@ -0,0 +1,334 @@
+"""
+Compact geometry model of planning area boundaries.
+
+Boundaries are kept as one contiguous (n, 2) float64 array of (lng, lat) per planning area, with offsets marking
+where every ring and polygon starts, rather than as GeoJSON strings or nested Python lists. A boundary is only
+decoded when it is first accessed, while its bounding box is computed up front.
+
+    boundaries = client.PlanningAreas.get_boundaries(year=2014)
+    boundaries["BISHAN"].bbox                   # (min_lng, min_lat, max_lng, max_lat)
+    boundaries["BISHAN"].rings                  # list of (n, 2) arrays, decoded on first access
+    boundaries.save("boundaries.bin")
+    boundaries = PlanningAreaBoundaries.load("boundaries.bin")    # memory-mapped
+"""
+import json
+import struct
+
+import numpy as np
+
+from . import bundle, jsonio
+
+_MAGIC = b"OMGEOM1\0"
+_OPEN, _CLOSE = ord("["), ord("]")
+_NO_BRACKETS = bytes.maketrans(b"[]", b"  ")
+
+
+def _coordinates(geojson) -> bytes:
+    """
+    :return: The `coordinates` array of a GeoJSON geometry string, as bytes without whitespace
+    """
+    if isinstance(geojson, str):
+        geojson = geojson.encode()
+    start = geojson.index(b"[", geojson.index(b'"coordinates"'))
+    if b'"bbox"' in geojson:
+        # Find the bracket closing the array, the bbox member could come after it
+        chars = np.frombuffer(geojson, dtype=np.uint8, offset=start)
+        depth = np.cumsum((chars == _OPEN).astype(np.int32) - (chars == _CLOSE))
+        end = start + int(np.argmax(depth == 0)) + 1
+    else:
+        end = geojson.rindex(b"]") + 1
+    return geojson[start:end].translate(None, b" \t\n\r")
+
+
+def _numbers(coordinates: bytes) -> np.ndarray:
+    """
+    :return: Every number in a coordinates array, in order
+    """
+    flat = coordinates.translate(_NO_BRACKETS)
+    try:
+        # One flat list is much faster to decode than nested lists, especially with orjson
+        return np.array(jsonio.loads(b"[" + flat + b"]"), dtype=np.float64)
+    except ValueError:
+        # Empty rings leave empty items behind
+        return np.array([number for number in flat.split(b",") if number.strip()], dtype=np.float64)
+
+
+def bounding_box(geojson):
+    """
+    Bounding box of a GeoJSON Polygon or MultiPolygon, without decoding its rings
+    :param geojson: GeoJSON geometry string
+    :return: (min_lng, min_lat, max_lng, max_lat)
+    """
+    coordinates = _coordinates(geojson)
+    # Number of values per position, from the first one
+    first = len(coordinates) - len(coordinates.lstrip(b"["))
+    dimensions = coordinates.count(b",", first, coordinates.index(b"]")) + 1
+    coords = _numbers(coordinates).reshape(-1, dimensions)
+    if len(coords) == 0:
+        return (np.nan,) * 4
+    lng, lat = coords[:, 0], coords[:, 1]
+    return float(lng.min()), float(lat.min()), float(lng.max()), float(lat.max())
+
+
+def decode_geojson(geojson):
+    """
+    Decode a GeoJSON Polygon or MultiPolygon into flat arrays, without building nested lists
+    :param geojson: GeoJSON geometry string
+    :return: (coords, ring_offsets, polygon_offsets): (n, 2) float64 array of (lng, lat), ring `i` being
+        `coords[ring_offsets[i]:ring_offsets[i + 1]]` and polygon `j` being rings
+        `polygon_offsets[j]:polygon_offsets[j + 1]` (exterior ring first, then its holes)
+    :raises ValueError: If `geojson` has no polygon coordinates
+    """
+    coordinates = _coordinates(geojson)
+    if coordinates.startswith(b"[[[["):
+        polygons = coordinates.split(b"]]],[[[")
+    elif coordinates.startswith(b"[[["):
+        polygons = [coordinates]
+    else:
+        raise ValueError(f"Not a Polygon or MultiPolygon: {coordinates[:100]!r}")
+
+    # Points within a ring are separated by "],[", rings within a polygon by "]],[["
+    ring_sizes, ring_counts = [], []
+    for polygon in polygons:
+        rings = polygon.split(b"]],[[")
+        ring_counts.append(len(rings))
+        ring_sizes.extend(ring.count(b"],[") + 1 for ring in rings)
+    ring_offsets = np.concatenate([[0], np.cumsum(ring_sizes)]).astype(np.int64)
+    polygon_offsets = np.concatenate([[0], np.cumsum(ring_counts)]).astype(np.int64)
+
+    coords = _numbers(coordinates)
+    if len(coords) != 2 * ring_offsets[-1]:
+        # Not plain 2D rings, e.g. with altitudes or empty rings
+        return _decode_nested(coordinates, len(polygons) > 1 or coordinates.startswith(b"[[[["))
+
+    return coords.reshape(-1, 2), ring_offsets, polygon_offsets
+
+
+def _decode_nested(coordinates: bytes, multi: bool):
+    # Slower path of `decode_geojson`, through nested lists
+    polygons = jsonio.loads(coordinates)
+    if not multi:
+        polygons = [polygons]
+    rings = [np.asarray(ring, dtype=np.float64).reshape(len(ring), -1)[:, :2] if ring else np.empty((0, 2))
+             for polygon in polygons for ring in polygon]
+    ring_offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in rings])]).astype(np.int64)
+    polygon_offsets = np.concatenate([[0], np.cumsum([len(polygon) for polygon in polygons])]).astype(np.int64)
+    coords = np.concatenate(rings).reshape(-1, 2) if rings else np.empty((0, 2))
+
+    return coords, ring_offsets, polygon_offsets
+
+
+class PlanningArea(object):
+    """
+    Boundary of one planning area, a MultiPolygon. Also exposes `__geo_interface__`, e.g. for `shapely.geometry.shape`
+    """
+    __slots__ = ("name", "bbox", "_geojson", "_coords", "_ring_offsets", "_polygon_offsets")
+
+    def __init__(self, name: str, bbox, geojson=None, coords: np.ndarray = None, ring_offsets: np.ndarray = None,
+                 polygon_offsets: np.ndarray = None):
+        """
+
+        :param name: Planning area name
+        :param bbox: (min_lng, min_lat, max_lng, max_lat)
+        :param geojson: GeoJSON geometry string, decoded on first access. Not needed if `coords` are given
+        :param coords: (n, 2) array of (lng, lat), see `decode_geojson`
+        :param ring_offsets: Offsets of the rings in `coords`
+        :param polygon_offsets: Offsets of the polygons in the rings
+        """
+        self.name = name
+        self.bbox = bbox
+        self._geojson = geojson
+        self._coords = coords
+        self._ring_offsets = ring_offsets
+        self._polygon_offsets = polygon_offsets
+
+    def __repr__(self):
+        return f"PlanningArea({self.name!r}, bbox={tuple(self.bbox)})"
+
+    @property
+    def decoded(self) -> bool:
+        return self._coords is not None
+
+    def _decode(self):
+        if self._coords is None:
+            self._coords, self._ring_offsets, self._polygon_offsets = decode_geojson(self._geojson)
+            # The arrays hold everything now
+            self._geojson = None
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        :return: (n, 2) array of the (lng, lat) of every ring, one after another
+        """
+        self._decode()
+        return self._coords
+
+    @property
+    def ring_offsets(self) -> np.ndarray:
+        self._decode()
+        return self._ring_offsets
+
+    @property
+    def polygon_offsets(self) -> np.ndarray:
+        self._decode()
+        return self._polygon_offsets
+
+    @property
+    def rings(self):
+        """
+        :return: List of (n, 2) arrays of (lng, lat), one per ring, holes included. Views into `coords`
+        """
+        offsets = self.ring_offsets
+        return [self._coords[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    @property
+    def polygons(self):
+        """
+        :return: List of polygons, each a list of rings (exterior first)
+        """
+        rings = self.rings
+        offsets = self._polygon_offsets
+        return [rings[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    @property
+    def __geo_interface__(self) -> dict:
+        return {"type": "MultiPolygon",
+                "coordinates": [[ring.tolist() for ring in polygon] for polygon in self.polygons]}
+
+    def to_geojson(self) -> dict:
+        """
+        :return: GeoJSON Feature with the planning area name as property
+        """
+        return {"type": "Feature", "properties": {"pln_area_n": self.name}, "geometry": self.__geo_interface__}
+
+    def to_wkb(self) -> bytes:
+        """
+        :return: Little-endian WKB MultiPolygon
+        """
+        ring_offsets, polygon_offsets = self.ring_offsets, self._polygon_offsets
+        coords = np.ascontiguousarray(self._coords, dtype="<f8")
+        parts = [struct.pack("<BII", 1, 6, len(polygon_offsets) - 1)]
+        for i in range(len(polygon_offsets) - 1):
+            parts.append(struct.pack("<BII", 1, 3, polygon_offsets[i + 1] - polygon_offsets[i]))
+            for j in range(polygon_offsets[i], polygon_offsets[i + 1]):
+                start, end = ring_offsets[j], ring_offsets[j + 1]
+                parts.append(struct.pack("<I", end - start))
+                parts.append(coords[start:end].tobytes())
+        return b"".join(parts)
+
+
+class PlanningAreaBoundaries(object):
+    """
+    Planning area boundaries of one year, indexable by position or name
+    """
+    def __init__(self, areas, year: int = None):
+        """
+
+        :param areas: List of `PlanningArea`
+        :param year: Year of the boundaries
+        """
+        self.areas = list(areas)
+        self.year = year
+        self._by_name = {area.name: i for i, area in enumerate(self.areas)}
+        self.bboxes = np.array([area.bbox for area in self.areas], dtype=np.float64).reshape(-1, 4)
+
+    @classmethod
+    def from_records(cls, records, year: int = None):
+        """
+        :param records: Planning area records as returned (or streamed) by `PlanningAreas`, dicts with
+            `pln_area_n` and `geojson`. Records without a boundary are skipped
+        """
+        areas = []
+        for record in records:
+            geojson = record.get("geojson")
+            if not geojson:
+                continue
+            geojson = geojson.encode() if isinstance(geojson, str) else json.dumps(geojson).encode()
+            areas.append(PlanningArea(record["pln_area_n"], bounding_box(geojson), geojson))
+        return cls(areas, year=year)
+
+    def __len__(self):
+        return len(self.areas)
+
+    def __iter__(self):
+        return iter(self.areas)
+
+    def __getitem__(self, key) -> PlanningArea:
+        """
+        :param key: Position, or planning area name
+        """
+        if isinstance(key, str):
+            return self.areas[self._by_name[key]]
+        return self.areas[key]
+
+    def __contains__(self, name: str):
+        return name in self._by_name
+
+    @property
+    def names(self):
+        return [area.name for area in self.areas]
+
+    def candidates(self, lat, lng) -> np.ndarray:
+        """
+        :return: Indices of the planning areas whose bounding box contains (lat, lng)
+        """
+        min_lng, min_lat, max_lng, max_lat = self.bboxes.T
+        return np.flatnonzero((min_lng <= lng) & (lng <= max_lng) & (min_lat <= lat) & (lat <= max_lat))
+
+    def to_geojson(self) -> dict:
+        """
+        :return: GeoJSON FeatureCollection of every planning area
+        """
+        return {"type": "FeatureCollection", "features": [area.to_geojson() for area in self.areas]}
+
+    def to_arrays(self) -> dict:
+        """
+        :return: Name -> array of every coordinate and offset, see `from_arrays`. Decodes every boundary
+        """
+        coords, ring_offsets, polygon_offsets, area_offsets = [], [0], [0], [0]
+        for area in self.areas:
+            coords.append(area.coords)
+            ring_offsets.extend(area.ring_offsets[1:] + ring_offsets[-1])
+            polygon_offsets.extend(area.polygon_offsets[1:] + polygon_offsets[-1])
+            area_offsets.append(len(polygon_offsets) - 1)
+        return {"coords": np.concatenate(coords) if coords else np.empty((0, 2)),
+                "ring_offsets": np.asarray(ring_offsets, dtype=np.int64),
+                "polygon_offsets": np.asarray(polygon_offsets, dtype=np.int64),
+                "area_offsets": np.asarray(area_offsets, dtype=np.int64),
+                "bboxes": self.bboxes}
+
+    @classmethod
+    def from_arrays(cls, names, arrays: dict, year: int = None):
+        """
+        :param names: Planning area names
+        :param arrays: See `to_arrays`, e.g. memory-mapped. Coordinates are not copied
+        """
+        coords, rings, polygons = arrays["coords"], arrays["ring_offsets"], arrays["polygon_offsets"]
+        area_offsets, bboxes = arrays["area_offsets"], arrays["bboxes"]
+        areas = []
+        for i, name in enumerate(names):
+            # Offsets relative to the area, coordinates as views
+            area_rings = polygons[area_offsets[i]:area_offsets[i + 1] + 1]
+            ring_offsets = rings[area_rings[0]:area_rings[-1] + 1]
+            areas.append(PlanningArea(name, tuple(map(float, bboxes[i])), None,
+                                      coords[ring_offsets[0]:ring_offsets[-1]],
+                                      ring_offsets - ring_offsets[0], area_rings - area_rings[0]))
+        boundaries = cls(areas, year=year)
+        boundaries.bboxes = bboxes
+        return boundaries
+
+    def save(self, path: str):
+        """
+        Save to a single binary file, which `load` memory-maps back without decoding anything.
+        Decodes every boundary that was not accessed yet.
+        """
+        bundle.write(path, _MAGIC, {"year": self.year, "names": self.names}, self.to_arrays())
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r"):
+        """
+        :param path: File written by `save`
+        :param mmap_mode: Memory-map mode (see `numpy.memmap`), None to read the arrays into memory instead
+        """
+        header, arrays = bundle.read(path, _MAGIC, mmap_mode)
+        return cls.from_arrays(header["names"], arrays, year=header["year"])
@@ -0,0 +1,266 @@
+"""
+Per-endpoint request instrumentation.
+
+Attach a `Metrics` to the transport and every request sent through `OneMap._get`, by any module, is
+recorded: counts, network latency and JSON parse time (as separate histograms), bytes received, cache
+hits and retries.
+
+    metrics = Metrics()
+    client = Client(transport=Transport(metrics=metrics))
+    ...
+    metrics.snapshot()["/commonapi/search"]["latency"]["p95"]
+    print(metrics.to_prometheus())
+"""
+import bisect
+import threading
+import time
+
+from .cache import CachedResponse
+
+
+def _default_bounds(lowest: float = 0.0005, highest: float = 120, factor: float = 1.5):
+    bounds = [lowest]
+    while bounds[-1] < highest:
+        bounds.append(bounds[-1] * factor)
+    return bounds
+
+
+# Upper bounds (in seconds) of the histogram buckets, 0.5ms to 2 min in steps of 50%
+DEFAULT_BOUNDS = tuple(_default_bounds())
+
+
+def _label(value) -> str:
+    # Label values escape backslashes, double quotes and line feeds in the Prometheus text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram. Memory use does not grow with the number of observations, and quantiles are
+    estimated by interpolating within a bucket, so they are accurate to within a bucket's width.
+    Not thread-safe on its own, `Metrics` serializes access.
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        # One more bucket for observations above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: Quantile, between 0 and 1
+        :return: Estimated value below which a fraction `q` of observations fall, 0 if there are none
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "max": self.max}
+
+
+class EndpointStats(object):
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.requests = 0
+        self.errors = 0
+        self.statuses = {}
+        self.bytes = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.latency = Histogram(bounds)
+        self.parse = Histogram(bounds)
+
+    def summary(self) -> dict:
+        return {"requests": self.requests,
+                "errors": self.errors,
+                "statuses": dict(self.statuses),
+                "bytes": self.bytes,
+                "cache_hits": self.cache_hits,
+                "cache_hit_ratio": self.cache_hits / self.requests if self.requests else 0.0,
+                "retries": self.retries,
+                "latency": self.latency.summary(),
+                "parse": self.parse.summary()}
+
+
+class RequestEvent(object):
+    """
+    One request through `OneMap._get`, passed to the `after` hooks once it completes.
+
+    `network_time` covers sending the request and receiving the response (including cache lookups, retries
+    and token refreshes), `parse_time` covers decoding the JSON body.
+    """
+    def __init__(self, metrics, endpoint: str, params: dict = None):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.params = params
+        self.status_code = None
+        self.bytes = 0
+        self.cached = False
+        self.network_time = None
+        self.parse_time = None
+        self.error = None
+        self._start = None
+        self._received = None
+
+    def received(self, response, streamed: bool = False):
+        """
+        :param response: Response received
+        :param streamed: Whether the body is still being downloaded, `bytes` is then counted by the caller
+        """
+        self._received = time.perf_counter()
+        self.network_time = self._received - self._start
+        self.status_code = response.status_code
+        self.bytes = 0 if streamed else len(response.content)
+        self.cached = isinstance(response, CachedResponse)
+
+    def __enter__(self):
+        if self.metrics is not None:
+            self.metrics.before_request(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        now = time.perf_counter()
+        if self._received is None:
+            self.network_time = now - self._start
+        else:
+            self.parse_time = now - self._received
+        self.error = exc
+        if self.metrics is not None:
+            self.metrics.after_request(self)
+
+
+class Metrics(object):
+    """
+    Thread-safe per-endpoint request metrics, with hooks called before and after every request.
+
+    Hooks are callables taking the `RequestEvent`. `before` hooks only see the endpoint and parameters;
+    `after` hooks see the whole event, e.g. to forward it to OpenTelemetry or to log slow requests:
+
+        metrics.add_hook(after=lambda e: e.network_time > 2 and logger.warning(f"Slow {e.endpoint}"))
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        """
+
+        :param bounds: Upper bounds (in seconds) of the latency histogram buckets
+        """
+        self.bounds = tuple(bounds)
+        self.endpoints = {}
+        self.before_hooks = []
+        self.after_hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, before=None, after=None):
+        if before is not None:
+            self.before_hooks.append(before)
+        if after is not None:
+            self.after_hooks.append(after)
+
+    def measure(self, endpoint: str, params: dict = None) -> RequestEvent:
+        """
+        Context manager timing one request, see `OneMap._get`
+        """
+        return RequestEvent(self, endpoint, params)
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointStats(self.bounds)
+        return stats
+
+    def before_request(self, event: RequestEvent):
+        for hook in self.before_hooks:
+            hook(event)
+
+    def after_request(self, event: RequestEvent):
+        with self._lock:
+            stats = self._stats(event.endpoint)
+            stats.requests += 1
+            if event.error is not None or event.status_code != 200:
+                stats.errors += 1
+            status = event.status_code if event.status_code is not None else type(event.error).__name__
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes += event.bytes
+            stats.cache_hits += event.cached
+            stats.latency.observe(event.network_time)
+            if event.parse_time is not None:
+                stats.parse.observe(event.parse_time)
+        for hook in self.after_hooks:
+            hook(event)
+
+    def record_retry(self, endpoint: str):
+        with self._lock:
+            self._stats(endpoint).retries += 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: Endpoint -> summary of its requests, latencies and parse times in seconds
+        """
+        with self._lock:
+            return {endpoint: stats.summary() for endpoint, stats in self.endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def to_prometheus(self, prefix: str = "onemap") -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format, e.g. to serve from a `/metrics` endpoint
+        """
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def histogram(name, attribute, help_text):
+            metric(name, "histogram", help_text)
+            for endpoint, stats in endpoints:
+                hist = getattr(stats, attribute)
+                cumulative = 0
+                for bound, count in zip(hist.bounds + ("+Inf",), hist.counts):
+                    cumulative += count
+                    le = bound if isinstance(bound, str) else f"{bound:.6g}"
+                    lines.append(f'{prefix}_{name}_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_{name}_sum{{endpoint="{endpoint}"}} {hist.sum:.9g}')
+                lines.append(f'{prefix}_{name}_count{{endpoint="{endpoint}"}} {hist.count}')
+
+        def counter(name, attribute, help_text):
+            metric(name, "counter", help_text)
+            for endpoint, stats in endpoints:
+                lines.append(f'{prefix}_{name}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+        with self._lock:
+            endpoints = [(_label(endpoint), stats) for endpoint, stats in sorted(self.endpoints.items())]
+            metric("requests_total", "counter", "Requests by endpoint and status")
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.statuses.items(), key=str):
+                    lines.append(f'{prefix}_requests_total{{endpoint="{endpoint}",status="{_label(status)}"}} {count}')
+            counter("response_bytes_total", "bytes", "Bytes received")
+            counter("cache_hits_total", "cache_hits", "Requests served from the response cache")
+            counter("retries_total", "retries", "Requests retried by the transport policy")
+            histogram("request_duration_seconds", "latency", "Network time, excluding JSON parsing")
+            histogram("parse_duration_seconds", "parse", "JSON parse time")
+
+        return "\n".join(lines) + "\n"
@@ -1,14 +1,18 @@
 from .base import *
+from .geometry import PlanningAreaBoundaries
+from .spatial import PlanningAreaIndex
 
 
 class PlanningAreas(OneMap):
-    def __init__(self, om: OneMap = None):
-        super().__init__()
+    def __init__(self, om: OneMap = None, timeout = 10, transport: Transport = None,
+                 tokens: TokenProvider = None):
         if om is not None:
+            super().__init__(om.email, om.password, om.timeout, transport or om.transport, tokens or om.tokens)
             self.logger = om.logger
-            self.token = om.token
-            self.authenticated = om.authenticated
             self.url = om.url
+        else:
+            super().__init__(timeout=timeout, transport=transport, tokens=tokens)
+        self.supported_years = [1998, 2008, 2014]
 
     def get_all_planning_areas(self, year: int = 2014, names_only: bool = False,
                           endpoint = "/privateapi/popapi/getAllPlanningarea"):
@@ -19,32 +23,70 @@ class PlanningAreas(OneMap):
         :param endpoint: Parameterized in case SLA updates the OneMap API
         :return: Dictionary converted from the response JSON
         """
+        if self.snapshot is not None:
+            response = self.snapshot.planning_areas(year, names_only)
+            if response is not None:
+                return response
+
         if names_only:
             endpoint = "/privateapi/popapi/getPlanningareaNames"
 
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{endpoint}",
-                                params={"token": self.token, "year": year},
-                                timeout=self.timeout)
-
-        response = self.parse_response(response)
+        response = self._get(endpoint, {"token": self.token, "year": year})
 
         return response
 
+    def iter_planning_areas(self, year: int = 2014, endpoint="/privateapi/popapi/getAllPlanningarea"):
+        """
+        Streaming version of `get_all_planning_areas`: yields the planning areas one at a time while the response
+        is being downloaded, instead of holding every boundary in memory at once
+        :param year: Year to retrieve the data for (1998, 2008, 2014)
+        :param endpoint: Parameterized in case SLA updates the OneMap API
+        :return: Generator of planning area records (dicts with `pln_area_n` and `geojson`)
+        :raises OneMapError: If the request failed
+        """
+        if self.snapshot is not None:
+            response = self.snapshot.planning_areas(year)
+            if response is not None:
+                return iter(response["SearchResults"])
+
+        self.check_auth_and_authenticate()
+
+        return self._stream(endpoint, {"token": self.token, "year": year}, key="SearchResults")
+
+    def get_boundaries(self, year: int = 2014) -> PlanningAreaBoundaries:
+        """
+        Download all planning area boundaries for `year` into a compact `PlanningAreaBoundaries`, streaming the
+        response so that the raw GeoJSON of every area is never held as nested lists
+        :param year: Year to retrieve the data for (1998, 2008, 2014)
+        :return: `PlanningAreaBoundaries`, each boundary is decoded on first access
+        """
+        if self.snapshot is not None and self.snapshot.boundaries(year) is not None:
+            return self.snapshot.boundaries(year)
+
+        return PlanningAreaBoundaries.from_records(self.iter_planning_areas(year=year), year=year)
+
     def find_planning_area(self, lat: float, lng: float, year: int = 2014,
                           endpoint = "/privateapi/popapi/getPlanningarea"):
 
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{endpoint}",
-                                params={"token": self.token,
+        response = self._get(endpoint, {"token": self.token,
                                         "lat": lat,
                                         "lng": lng,
-                                        "year": year},
-                                timeout=self.timeout)
-        self.logger.debug(response.url)
+                                        "year": year})
 
-        response = self.parse_response(response)
+        return response
+
+    def build_index(self, year: int = 2014, **kwargs) -> PlanningAreaIndex:
+        """
+        Download all planning area boundaries for `year` once, and index them for offline lookups.
+        Use `PlanningAreaIndex.save` and `PlanningAreaIndex.load` to reuse the index across processes.
+        :param year: Year to retrieve the data for (1998, 2008, 2014)
+        :return: `PlanningAreaIndex` answering `find_planning_area`-style queries locally
+        """
+        if self.snapshot is not None and self.snapshot.boundaries(year) is not None:
+            return PlanningAreaIndex.from_boundaries(self.snapshot.boundaries(year), **kwargs)
 
-        return response
\ No newline at end of file
+        return PlanningAreaIndex.from_api(self, year=year, **kwargs)
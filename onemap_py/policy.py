@@ -0,0 +1,241 @@
+"""
+Transport-level request policy: rate limiting, retries with backoff and a circuit breaker.
+
+    policy = RequestPolicy(limiter=RateLimiter({"search": 4, "routing": 1}),
+                           retry=Backoff(max_retries=5),
+                           breaker=CircuitBreaker(failure_threshold=10))
+    client = Client(transport=Transport(policy=policy))
+
+One policy can be shared by a `Transport` and an `AsyncTransport`, it is safe to use from threads and
+asyncio tasks at once.
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from .exceptions import CircuitOpenError, RetryError
+from .ratelimit import RateLimiter
+
+# Throttled, or the server is (temporarily) failing
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def retry_after(response):
+    """
+    :return: Seconds to wait as requested by the response's Retry-After header, or None
+    """
+    value = response.headers.get("Retry-After") if getattr(response, "headers", None) is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Backoff(object):
+    """
+    Exponential backoff with full jitter: attempt `n` waits a random time up to `base * 2 ** n` seconds,
+    at most `max_delay`. A Retry-After header overrides it.
+    """
+    def __init__(self, max_retries: int = 3, base: float = 0.5, max_delay: float = 30,
+                 statuses=RETRY_STATUSES):
+        """
+
+        :param max_retries: Number of retries after the first attempt
+        :param base: Backoff of the first retry (in seconds), doubled for every further retry
+        :param max_delay: Maximum wait (in seconds) between attempts, also caps Retry-After
+        :param statuses: HTTP status codes to retry
+        """
+        self.max_retries = max_retries
+        self.base = base
+        self.max_delay = max_delay
+        self.statuses = frozenset(statuses)
+
+    def should_retry(self, response) -> bool:
+        return response.status_code in self.statuses
+
+    def delay(self, attempt: int, response=None) -> float:
+        """
+        :param attempt: Number of the retry, starting at 0
+        :param response: Failed response, if any
+        :return: Seconds to wait before retrying
+        """
+        requested = None if response is None else retry_after(response)
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast while the API is down, instead of queueing up requests that would time out anyway.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests raise `CircuitOpenError`.
+    After `reset_timeout` seconds a single trial request is let through: the circuit closes if it succeeds,
+    and opens again if it fails.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+
+        :param failure_threshold: Number of consecutive failures opening the circuit
+        :param reset_timeout: Seconds to wait before letting a trial request through an open circuit
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before(self):
+        """
+        Raise `CircuitOpenError` unless a request may be sent now
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let this request through as the trial, others keep failing fast until it completes
+                self._state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("OneMap API unavailable, failing fast until the circuit breaker resets")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class RequestPolicy(object):
+    """
+    Applies rate limiting, retries and a circuit breaker to every request sent through a transport.
+    Any of the three can be left out.
+
+    When retries are exhausted a `RetryError` is raised, rather than the failed response being returned.
+    """
+    def __init__(self, limiter: RateLimiter = None, retry: Backoff = None, breaker: CircuitBreaker = None):
+        """
+
+        :param limiter: (Optional) Per endpoint group rate limits
+        :param retry: (Optional) Backoff between retries, no retries if not provided
+        :param breaker: (Optional) Circuit breaker
+        """
+        self.limiter = limiter
+        self.retry = retry if retry is not None else Backoff(max_retries=0)
+        self.breaker = breaker
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _outcome(self, url: str, attempt: int, response=None, error: Exception = None):
+        """
+        Record the outcome of an attempt
+        :return: Seconds to wait before retrying, or None if the attempt's response should be returned
+        """
+        failed = error is not None or self.retry.should_retry(response)
+        # Throttling means the API is up, only errors count towards opening the circuit
+        if self.breaker is not None:
+            if error is None and (not failed or response.status_code == 429):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if not failed:
+            return None
+
+        if attempt >= self.retry.max_retries:
+            reason = repr(error) if error is not None else f"HTTP {response.status_code}"
+            raise RetryError(f"Request to {url} failed after {attempt + 1} attempts: {reason}", response) from error
+
+        delay = self.retry.delay(attempt, response)
+        if self.limiter is not None and response is not None and response.status_code == 429:
+            # Slow down every caller of this endpoint group, not only this one
+            self.limiter.pause(url, delay)
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def _aborted(self):
+        # Any other exception (even a cancellation) ends the attempt too, so that a trial request cannot leave
+        # the circuit half-open forever
+        if self.breaker is not None:
+            self.breaker.record_failure()
+
+    def send(self, url: str, send, errors=(), on_retry=None):
+        """
+        :param url: URL of the request, used to pick its rate limit
+        :param send: Callable sending the request and returning the response
+        :param errors: Exception types raised by `send()` that should be retried, e.g. connection errors
+        :param on_retry: (Optional) Called with `url` before every retry
+        :return: Response of the first successful attempt
+        """
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before()
+            try:
+                if self.limiter is not None:
+                    self.limiter.acquire(url)
+                response = send()
+            except errors as e:
+                delay = self._outcome(url, attempt, error=e)
+            except BaseException:
+                self._aborted()
+                raise
+            else:
+                delay = self._outcome(url, attempt, response=response)
+                if delay is None:
+                    return response
+            if on_retry is not None:
+                on_retry(url)
+            time.sleep(delay)
+            attempt += 1
+
+    async def send_async(self, url: str, send, errors=(), on_retry=None):
+        """
+        asyncio counterpart of `send`, `send()` must return an awaitable
+        """
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before()
+            try:
+                if self.limiter is not None:
+                    await self.limiter.acquire_async(url)
+                response = await send()
+            except errors as e:
+                delay = self._outcome(url, attempt, error=e)
+            except BaseException:
+                self._aborted()
+                raise
+            else:
+                delay = self._outcome(url, attempt, response=response)
+                if delay is None:
+                    return response
+            if on_retry is not None:
+                on_retry(url)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,116 @@
+"""
+Vectorized decoding of many encoded polylines (e.g. `route_geometry` of routing responses) at once.
+
+All polylines are decoded together with NumPy into one flat coordinate buffer plus an offsets array,
+without creating a Python object per point.
+"""
+import numpy as np
+
+
+class PolylineBatch(object):
+    """
+    Ragged array of decoded polylines: polyline `i` is `coords[offsets[i]:offsets[i + 1]]`.
+    `coords` is a (num_points, 2) float64 array of (lng, lat), the same order as `Router.decode_route_geometry`.
+    """
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray):
+        self.coords = coords
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def save(self, path: str):
+        """
+        Save as `{path}.coords.npy` and `{path}.offsets.npy`, which `load` can memory-map back
+        """
+        np.save(f"{path}.coords.npy", self.coords)
+        np.save(f"{path}.offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r"):
+        return cls(np.load(f"{path}.coords.npy", mmap_mode=mmap_mode),
+                   np.load(f"{path}.offsets.npy", mmap_mode=mmap_mode))
+
+
+def _decode_chunk(chars: np.ndarray, points: np.ndarray, out: np.ndarray, scale: float):
+    """
+    Decode the concatenated characters of whole polylines with `points` points each into `out`
+    """
+    chars = chars.astype(np.int64) - 63
+
+    # Every value is a run of 5-bit chunks, least significant first, with 0x20 set on all but the last
+    ends = np.flatnonzero(chars < 0x20)
+    starts = np.r_[0, ends[:-1] + 1]
+    position = np.arange(len(chars)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((chars & 0x1f) << (5 * position), starts)
+
+    # Zigzag decode into signed deltas, alternating lat, lng, then swap into (lng, lat)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1).reshape(-1, 2)[:, ::-1]
+
+    # Running sum of deltas, restarting at every polyline
+    totals = np.cumsum(deltas, axis=0)
+    non_empty = points[points > 0]
+    first = np.cumsum(non_empty) - non_empty
+    restart = np.zeros((len(first), 2), dtype=np.int64)
+    restart[1:] = totals[first[1:] - 1]
+    totals -= np.repeat(restart, non_empty, axis=0)
+
+    np.divide(totals, scale, out=out)
+
+
+def decode_polylines(polylines, precision: int = 5, out: str = None, chunk_size: int = 1 << 20) -> PolylineBatch:
+    """
+    Decode many encoded polylines at once
+    :param polylines: Iterable of encoded polylines, as str or bytes
+    :param precision: Number of decimal places encoded, 5 for OneMap routes
+    :param out: (Optional) Path prefix to write the coordinates and offsets to as `.npy` files, see
+        `PolylineBatch.save`. The returned batch is then memory-mapped from those files
+    :param chunk_size: Approximate number of characters decoded at a time, bounding temporary memory
+    :return: `PolylineBatch`
+    """
+    encoded = [p.encode("ascii") if isinstance(p, str) else bytes(p) for p in polylines]
+    lengths = np.fromiter((len(p) for p in encoded), dtype=np.int64, count=len(encoded))
+    chars = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    del encoded
+
+    # Count the values (characters below 63 + 0x20 end one) and so the points in every polyline
+    char_offsets = np.r_[0, np.cumsum(lengths)]
+    is_last = chars < 63 + 0x20
+    if not is_last[char_offsets[1:][lengths > 0] - 1].all():
+        raise ValueError("Truncated polyline")
+    value_counts = np.diff(np.r_[0, np.searchsorted(np.flatnonzero(is_last), char_offsets[1:] - 1, side="right")])
+    del is_last
+    if np.any(value_counts % 2):
+        raise ValueError("Polyline with an odd number of values")
+    points = value_counts // 2
+    offsets = np.r_[0, np.cumsum(points)].astype(np.int64)
+
+    shape = (int(offsets[-1]), 2)
+    if out is None:
+        coords = np.empty(shape, dtype=np.float64)
+    else:
+        coords = np.lib.format.open_memmap(f"{out}.coords.npy", mode="w+", dtype=np.float64, shape=shape)
+
+    # Decode whole polylines, about `chunk_size` characters at a time
+    scale = 10 ** precision
+    i = 0
+    while i < len(lengths):
+        j = max(i + 1, int(np.searchsorted(char_offsets, char_offsets[i] + chunk_size, side="right")) - 1)
+        if offsets[j] > offsets[i]:
+            _decode_chunk(chars[char_offsets[i]:char_offsets[j]], points[i:j], coords[offsets[i]:offsets[j]], scale)
+        i = j
+
+    if out is None:
+        return PolylineBatch(coords, offsets)
+
+    coords.flush()
+    del coords
+    np.save(f"{out}.offsets.npy", offsets)
+    return PolylineBatch.load(out)
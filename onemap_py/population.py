@@ -1,39 +1,153 @@
 from .base import *
+from .planning_areas import PlanningAreas
+from itertools import product
+
+import numpy as np
+
+# Fields of a population record that identify it, every other numeric field is a category
+CUBE_KEYS = {"planning_area", "year", "gender"}
+
+
+class PopulationCube(object):
+    """
+    Population data for many (data type, year, planning area, gender) cells, in tidy columnar form: one row per
+    category of every cell, with columns `data_type`, `year`, `planning_area`, `gender` ("" if not by gender),
+    `category` (e.g. "employed") and `value`.
+
+    Keeps track of which cells were fetched, so `Population.fetch_cube(..., cube=cube)` only fetches the
+    missing or failed ones.
+    """
+    COLUMNS = ["data_type", "year", "planning_area", "gender", "category", "value"]
+
+    def __init__(self):
+        self.rows = {column: [] for column in self.COLUMNS}
+        # (data_type, year, planning_area, gender) -> number of rows, or None if fetching it failed
+        self.cells = {}
+
+    def add(self, cell, response):
+        """
+        Add the response of one cell
+        :param cell: (data_type, year, planning_area, gender)
+        :param response: Response of `get_population_data` or `get_population_by_gender`
+        """
+        if not isinstance(response, list):
+            self.cells[cell] = None
+            return
+
+        data_type, year, planning_area, gender = cell
+        added = 0
+        for record in response:
+            for category, value in record.items():
+                if category in CUBE_KEYS:
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    # e.g. {"Result": "No Data Available!"}
+                    continue
+                for column, item in zip(self.COLUMNS, (data_type, year, planning_area, gender, category, value)):
+                    self.rows[column].append(item)
+                added += 1
+        self.cells[cell] = added
+
+    def missing(self, cells):
+        """
+        :return: The cells in `cells` that were not fetched yet, or failed
+        """
+        return [cell for cell in cells if self.cells.get(cell) is None]
+
+    @property
+    def failed(self):
+        return [cell for cell, rows in self.cells.items() if rows is None]
+
+    def __len__(self):
+        return len(self.rows["value"])
+
+    def to_dict(self) -> dict:
+        """
+        :return: Column name -> NumPy array
+        """
+        return {"data_type": np.array(self.rows["data_type"], dtype=str),
+                "year": np.array(self.rows["year"], dtype=np.int32),
+                "planning_area": np.array(self.rows["planning_area"], dtype=str),
+                "gender": np.array(self.rows["gender"], dtype=str),
+                "category": np.array(self.rows["category"], dtype=str),
+                "value": np.array(self.rows["value"], dtype=np.float64)}
+
+    def to_pandas(self):
+        """
+        :return: `pandas.DataFrame`, requires pandas
+        """
+        import pandas as pd
+        return pd.DataFrame(self.to_dict())
+
+    def to_arrow(self):
+        """
+        :return: `pyarrow.Table`, requires pyarrow
+        """
+        import pyarrow as pa
+        return pa.table(self.to_dict())
+
+    def save(self, path: str):
+        """
+        Save to a `.npz` file, including which cells were fetched, so a later run can refresh only missing cells
+        """
+        cells = sorted(self.cells.items(), key=str)
+        np.savez(path, **self.to_dict(),
+                 cells=np.array([[str(i) for i in cell] for cell, _ in cells], dtype=str).reshape(-1, 4),
+                 cell_rows=np.array([-1 if rows is None else rows for _, rows in cells], dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str):
+        cube = cls()
+        with np.load(path) as data:
+            for column in cls.COLUMNS:
+                cube.rows[column] = data[column].tolist()
+            for (data_type, year, planning_area, gender), rows in zip(data["cells"].tolist(), data["cell_rows"]):
+                cube.cells[(data_type, int(year), planning_area, gender)] = None if rows < 0 else int(rows)
+        return cube
 
 
 class Population(OneMap):
 
-    def __init__(self, om: OneMap = None):
+    data_to_endpoint = {
+        "economic": "/getEconomicStatus",
+        "education": "/getEducationAttending",
+        "ethnicity": "/getEthnicGroup",
+        "household_income_from_work": "/getHouseholdMonthlyIncomeWork",
+        "household_size": "/getHouseholdSize",
+        "household_structure": "/getHouseholdStructure",
+        "income_from_work": "/getIncomeFromWork",
+        "industry": '/getIndustry',
+        "language_literacy": "/getLanguageLiterate",
+        "marital": "/getMaritalStatus",
+        "mode_transport_school": "/getModeOfTransportSchool",
+        "mode_transport_work": '/getModeOfTransportWork',
+        "occupation": "/getOccupation",
+        "age": "/getPopulationAgeGroup",
+        "religion": "/getReligion",
+        "spoken_language": "/getSpokenAtHome",
+        "tenancy": "/getTenancy",
+        "dwelling_type_household": "/getTypeOfDwellingHousehold",
+        "dwelling_type_population": "/getTypeOfDwellingPop"
+    }
+    data_query_by_gender = ["economic","ethnicity", "marital"]
+    available_data_types = list(data_to_endpoint.keys())
+
+    def __init__(self, om: OneMap = None, timeout = 10, transport: Transport = None,
+                 tokens: TokenProvider = None):
         if om is None:
-            super().__init__()
+            super().__init__(timeout=timeout, transport=transport, tokens=tokens)
         else:
+            super().__init__(om.email, om.password, om.timeout, transport or om.transport, tokens or om.tokens)
             self.logger = om.logger
-            self.token = om.token
-            self.authenticated = om.authenticated
             self.url = om.url
-        self.data_to_endpoint = {
-            "economic": "/getEconomicStatus",
-            "education": "/getEducationAttending",
-            "ethnicity": "/getEthnicGroup",
-            "household_income_from_work": "/getHouseholdMonthlyIncomeWork",
-            "household_size": "/getHouseholdSize",
-            "household_structure": "/getHouseholdStructure",
-            "income_from_work": "/getIncomeFromWork",
-            "industry": '/getIndustry',
-            "language_literacy": "/getLanguageLiterate",
-            "marital": "/getMaritalStatus",
-            "mode_transport_school": "/getModeOfTransportSchool",
-            "mode_transport_work": '/getModeOfTransportWork',
-            "occupation": "/getOccupation",
-            "age": "/getPopulationAgeGroup",
-            "religion": "/getReligion",
-            "spoken_language": "/getSpokenAtHome",
-            "tenancy": "/getTenancy",
-            "dwelling_type_household": "/getTypeOfDwellingHousehold",
-            "dwelling_type_population": "/getTypeOfDwellingPop"
-        }
-        self.data_query_by_gender = ["economic","ethnicity", "marital"]
-        self.available_data_types = list(self.data_to_endpoint.keys())
+
+    def _check_data_type(self, data_type: str):
+        if data_type not in self.data_to_endpoint.keys():
+            self.logger.error(f"Unsupported `data_type` provided: {data_type}")
+            self.logger.info(f"Supported data types: {self.data_to_endpoint.keys()}")
+            return {"error": f"Unsupported `data_type` provided: {data_type}"}
 
     def get_population_data(self,
                             data_type: str,
@@ -48,19 +162,21 @@ class Population(OneMap):
         :param endpoint: Parameterized in case SLA changes OneMap API
         :return:
         """
-        if data_type not in self.data_to_endpoint.keys():
-            self.logger.error(f"Unsupported `data_type` provided: {data_type}")
-            self.logger.info(f"Supported data types: {self.data_to_endpoint.keys()}")
-            return {"error": f"Unsupported `data_type` provided: {data_type}"}
+        error = self._check_data_type(data_type)
+        if error is not None:
+            return error
+
+        if self.snapshot is not None:
+            response = self.snapshot.population(data_type, year, planning_area)
+            if response is not None:
+                return response
 
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{endpoint}{self.data_to_endpoint[data_type]}",
-                                params={"token": self.token,
-                                        "year": year,
-                                        "planningArea": planning_area})
-        self.logger.debug(response.url)
-        response = self.parse_response(response)
+        response = self._get(f"{endpoint}{self.data_to_endpoint[data_type]}",
+                             {"token": self.token,
+                              "year": year,
+                              "planningArea": planning_area})
 
         return response
 
@@ -71,19 +187,100 @@ class Population(OneMap):
                                  gender: str = None,
                                  endpoint="/privateapi/popapi"):
 
-        if data_type not in self.data_to_endpoint.keys():
-            self.logger.error(f"Unsupported `data_type` provided: {data_type}")
-            self.logger.info(f"Supported data types: {self.data_to_endpoint.keys()}")
-            return {"error": f"Unsupported `data_type` provided: {data_type}"}
+        error = self._check_data_type(data_type)
+        if error is not None:
+            return error
+
+        if self.snapshot is not None:
+            response = self.snapshot.population(data_type, year, planning_area, gender)
+            if response is not None:
+                return response
 
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{endpoint}{self.data_to_endpoint[data_type]}",
-                                params={"token": self.token,
-                                        "year": year,
-                                        "planningArea": planning_area,
-                                        "gender": gender})
-        self.logger.debug(response.url)
-        response = self.parse_response(response)
+        response = self._get(f"{endpoint}{self.data_to_endpoint[data_type]}",
+                             {"token": self.token,
+                              "year": year,
+                              "planningArea": planning_area,
+                              "gender": gender})
 
         return response
+
+    def _cube_data_types(self, data_types=None) -> list:
+        data_types = self.available_data_types if data_types is None else list(data_types)
+        for data_type in data_types:
+            error = self._check_data_type(data_type)
+            if error is not None:
+                raise ValueError(error["error"])
+        return data_types
+
+    def _cube_missing(self, cube: PopulationCube, data_types, years, planning_areas, by_gender: bool,
+                      genders) -> list:
+        """
+        :return: Cells (data_type, year, planning_area, gender) of the cube that still need to be fetched
+        """
+        cells = []
+        for data_type, year, planning_area in product(data_types, years, planning_areas):
+            if by_gender and data_type in self.data_query_by_gender:
+                cells.extend((data_type, year, planning_area, gender) for gender in genders)
+            else:
+                cells.append((data_type, year, planning_area, ""))
+
+        missing = cube.missing(cells)
+        self.logger.info(f"Fetching {len(missing)} of {len(cells)} population cells")
+        return missing
+
+    def fetch_cube(self, data_types, years, planning_areas=None, by_gender: bool = False,
+                   genders=("male", "female"), max_workers: int = 8, cube: PopulationCube = None,
+                   planning_area_year: int = 2014) -> PopulationCube:
+        """
+        Fetch many data types for many planning areas and years concurrently, into one columnar `PopulationCube`.
+
+        With `cube`, only the cells missing from it (or that failed before) are fetched and added to it.
+        Attach a `ResponseCache` to the transport to also reuse responses across cubes and processes.
+
+        :param data_types: Data types to fetch, see self.available_data_types. All of them if None
+        :param years: Years to fetch, e.g. [2000, 2010, 2015]
+        :param planning_areas: Planning area names. All of them, from `PlanningAreas.get_all_planning_areas`,
+            if not provided
+        :param by_gender: Fetch the data types in self.data_query_by_gender once per gender in `genders`
+        :param genders: Genders to fetch if `by_gender`
+        :param max_workers: Number of concurrent requests
+        :param cube: (Optional) Cube from a previous call to refresh
+        :param planning_area_year: Year of the planning area boundaries to list the planning areas of
+        :return: `PopulationCube`, use `.to_dict()`, `.to_pandas()` or `.to_arrow()` for the data
+        """
+        data_types = self._cube_data_types(data_types)
+
+        if self.snapshot is None:
+            # Authenticate once up front rather than from every worker
+            self.check_auth_and_authenticate()
+
+        if planning_areas is None:
+            planning_area_source = PlanningAreas(self)
+            planning_area_source.snapshot = self.snapshot
+            names = planning_area_source.get_all_planning_areas(year=planning_area_year, names_only=True)
+            if not isinstance(names, list):
+                raise ValueError(f"Failed to list planning areas: {names}")
+            planning_areas = [area["pln_area_n"] for area in names]
+
+        cube = cube if cube is not None else PopulationCube()
+        missing = self._cube_missing(cube, data_types, years, planning_areas, by_gender, genders)
+
+        def fetch(cell):
+            data_type, year, planning_area, gender = cell
+            if gender:
+                return self.get_population_by_gender(data_type, year, planning_area, gender)
+            return self.get_population_data(data_type, year, planning_area)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, cell): cell for cell in missing}
+            for future in futures:
+                cell = futures[future]
+                try:
+                    cube.add(cell, future.result())
+                except Exception as e:
+                    self.logger.warning(f"Failed to fetch population data {cell}: {e}")
+                    cube.add(cell, None)
+
+        return cube
@@ -0,0 +1,124 @@
+"""
+Client-side rate limiting, shared between threads and asyncio tasks.
+"""
+import asyncio
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `rate` requests per second on average, with bursts of up to `capacity` requests.
+
+    Callers reserve a token and then sleep until it is theirs, so concurrent callers are spaced out evenly
+    instead of all retrying at once. The same bucket can be used from threads (`acquire`) and from asyncio
+    tasks (`acquire_async`).
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        """
+
+        :param rate: Tokens added per second
+        :param capacity: Maximum number of tokens that can accumulate, defaults to one second's worth
+        """
+        if rate <= 0:
+            raise ValueError("`rate` must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take `tokens` from the bucket, possibly going into debt
+        :return: Seconds to wait before the reserved tokens may be used
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float):
+        """
+        Hold back every caller for at least `seconds`, e.g. when the server asks to slow down with Retry-After.
+        Callers then resume at `rate` rather than all at once.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def acquire(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Endpoint group -> path fragment identifying its endpoints
+ENDPOINT_GROUPS = {
+    "search": "/commonapi/search",
+    "routing": "/privateapi/routingsvc",
+    "popapi": "/privateapi/popapi",
+    "themesvc": "/privateapi/themesvc",
+}
+
+
+class RateLimiter(object):
+    """
+    One `TokenBucket` per endpoint group, so that e.g. routing calls cannot starve searches of their quota.
+
+        RateLimiter({"search": 4, "routing": 1}, default=2)
+    """
+    def __init__(self, rates: dict = None, default: float = None, groups: dict = None):
+        """
+
+        :param rates: Endpoint group -> requests per second, or a `TokenBucket` to share it with other limiters
+        :param default: (Optional) Requests per second of endpoints outside every group in `rates`, shared between
+            them. Unlimited if not provided
+        :param groups: Endpoint group -> path fragment, overriding `ENDPOINT_GROUPS`
+        """
+        self.groups = dict(ENDPOINT_GROUPS)
+        if groups is not None:
+            self.groups.update(groups)
+        self.buckets = {group: rate if isinstance(rate, TokenBucket) else TokenBucket(rate)
+                        for group, rate in (rates or {}).items()}
+        self.default = TokenBucket(default) if default else None
+
+    def group_for(self, url: str):
+        """
+        :return: Endpoint group of `url`, or None if it is in none of them
+        """
+        for group, fragment in self.groups.items():
+            if fragment in url:
+                return group
+        return None
+
+    def bucket_for(self, url: str):
+        """
+        :return: `TokenBucket` limiting requests to `url`, or None if they are unlimited
+        """
+        return self.buckets.get(self.group_for(url), self.default)
+
+    def acquire(self, url: str):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def acquire_async(self, url: str):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            await bucket.acquire_async()
+
+    def pause(self, url: str, seconds: float):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            bucket.pause(seconds)
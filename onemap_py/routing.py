@@ -1,12 +1,80 @@
+import json
+
 from .base import *
+from .cache import MemoryCache
+from .exceptions import PostalCodeNotFoundError
+from .geocoding import PostalResolver
+from .polyline import PolylineBatch, decode_polylines
 from pypolyline.util import decode_polyline
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def route_summary(response):
+    """
+    :param response: Response of `Router.route`, driving/walking/cycling or public transport
+    :return: (total time in seconds, total distance in metres, list of encoded polylines) of a route response
+    :raises KeyError, IndexError, TypeError, ValueError: If the response has no route
+    """
+    if "route_summary" in response:
+        geometry = [response["route_geometry"]] if response.get("route_geometry") else []
+        return (float(response["route_summary"]["total_time"]),
+                float(response["route_summary"]["total_distance"]),
+                geometry)
+
+    # Public transport: take the first itinerary
+    itinerary = response["plan"]["itineraries"][0]
+    legs = itinerary.get("legs", [])
+    return (float(itinerary["duration"]),
+            float(sum(leg.get("distance", 0) for leg in legs)),
+            [leg["legGeometry"]["points"] for leg in legs if leg.get("legGeometry")])
+
+
+class RouteMatrix(object):
+    """
+    Result of `Router.route_matrix`.
+
+    `time` (seconds) and `distance` (metres) are (origins x destinations) float arrays, NaN where no route
+    was found. Route geometries are kept encoded and only decoded by `geometry(i, j)`. `failed` lists the
+    (i, j) cells whose route could not be fetched or had no route.
+    """
+    def __init__(self, origins, destinations, time: np.ndarray, distance: np.ndarray, encoded_geometry=None,
+                 failed=None):
+        self.origins = origins
+        self.destinations = destinations
+        self.time = time
+        self.distance = distance
+        self.encoded_geometry = encoded_geometry
+        self.failed = failed if failed is not None else []
+
+    @property
+    def shape(self):
+        return self.time.shape
+
+    def geometry(self, i: int, j: int):
+        """
+        :return: Decoded route geometry from origin `i` to destination `j`, as a list of (lng, lat),
+            or None if unavailable
+        """
+        if self.encoded_geometry is None or self.encoded_geometry[i, j] is None:
+            return None
+        return [point for polyline in self.encoded_geometry[i, j]
+                for point in Router.decode_route_geometry(polyline)]
 
 
 class Router(OneMap):
-    def __init__(self, email =None, password = None, timeout = 30):
-        super().__init__(email, password, timeout)
-        self.supported_route_types = ['walk', 'drive', 'cycle', 'pt']
-        self.supported_pt_modes = ['TRANSIT', 'BUS', 'RAIL']
+    supported_route_types = ['walk', 'drive', 'cycle', 'pt']
+    supported_pt_modes = ['TRANSIT', 'BUS', 'RAIL']
+    # Seconds `route_matrix` reuses a route for, and number of routes it remembers
+    route_memo_ttl = 60 * 60
+    route_memo_size = 10000
+
+    def __init__(self, email =None, password = None, timeout = 30, transport: Transport = None,
+                 tokens: TokenProvider = None):
+        super().__init__(email, password, timeout, transport, tokens)
+        self.resolver = PostalResolver(self)
+        self.route_memo = MemoryCache(self.route_memo_size)
 
     def route(self, start_point: Tuple[float, float], end_point: Tuple[float, float], route_type: str,
               date: str = None, time: str = None,
@@ -27,11 +95,22 @@ class Router(OneMap):
 
         :return: dictionary of API response
         """
-        if route_type not in self.supported_route_types:
-            raise ValueError(f"Route type `{route_type}` not supported\n Supported: {self.supported_route_types}")
+        self._check_route_type(route_type)
 
         self.check_auth_and_authenticate()
 
+        payload = self._route_payload(start_point, end_point, route_type, date, time, mode,
+                                      max_walk_distance, num_itineraries)
+
+        return self._get(endpoint, payload)
+
+    def _check_route_type(self, route_type: str):
+        if route_type not in self.supported_route_types:
+            raise ValueError(f"Route type `{route_type}` not supported\n Supported: {self.supported_route_types}")
+
+    def _route_payload(self, start_point: Tuple[float, float], end_point: Tuple[float, float], route_type: str,
+                       date: str = None, time: str = None,
+                       mode: str = None, max_walk_distance: int = None, num_itineraries: int = None):
         payload = {"token": self.token,
                    "start": f"{start_point[0]},{start_point[1]}",
                    "end": f"{end_point[0]},{end_point[1]}",
@@ -50,18 +129,150 @@ class Router(OneMap):
             if num_itineraries is not None:
                 payload['numItineraries'] = num_itineraries
 
-        response = requests.get(url = f"{self.url}{endpoint}",
-                                params = payload,
-                                timeout = self.timeout)
-        print(response.url)
+        return payload
+
+    def route_matrix(self, origins, destinations, route_type: str,
+                     date: str = None, time: str = None,
+                     mode: str = None, max_walk_distance: int = None, num_itineraries: int = None,
+                     max_workers: int = 8, skip_diagonal: bool = False, keep_geometry: bool = False,
+                     endpoint = "/privateapi/routingsvc/route") -> RouteMatrix:
+        """
+        Route every origin to every destination concurrently.
+        Identical (origin, destination) pairs are only routed once. Routes found are remembered in `self.route_memo`
+        (an LRU of `route_memo_size` routes) for `route_memo_ttl` seconds, so that repeated or overlapping matrices
+        with the same parameters reuse them instead of routing them again.
+
+        :param origins: Sequence of (lat, lng)
+        :param destinations: Sequence of (lat, lng)
+        :param route_type: One of self.supported_route_types
+        :param date, time, mode, max_walk_distance, num_itineraries: See `route`
+        :param max_workers: Number of concurrent route calls
+        :param skip_diagonal: Don't route origin `i` to destination `i` (e.g. when origins are the destinations),
+            its time and distance are set to 0
+        :param keep_geometry: Keep the encoded route geometry of every cell, see `RouteMatrix.geometry`
+        :param endpoint: Parameterized in case endpoint changes
+        :return: `RouteMatrix`. A pair that fails is NaN and listed in `RouteMatrix.failed`, the other routes are kept
+        """
+        self._check_route_type(route_type)
+
+        # Authenticate once up front rather than from every worker
+        self.check_auth_and_authenticate()
+
+        origins, destinations, cells = self._matrix_cells(origins, destinations, skip_diagonal)
+        params = (route_type, date, time, mode, max_walk_distance, num_itineraries, endpoint)
+        routes = self._recall_routes(cells, params)
+        pending = [pair for pair in cells if pair not in routes]
+
+        def route(pair):
+            return self.route(pair[0], pair[1], route_type, date, time, mode,
+                              max_walk_distance, num_itineraries, endpoint)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(route, pair) for pair in pending]
+            responses = []
+            for future in futures:
+                try:
+                    responses.append(future.result())
+                except Exception as e:
+                    # Reported in `RouteMatrix.failed` rather than discarding every other route
+                    responses.append(e)
+
+        routes.update(self._memoize_routes(pending, responses, params))
+        return self._build_matrix(origins, destinations, cells, [routes[pair] for pair in cells],
+                                  skip_diagonal, keep_geometry)
+
+    @staticmethod
+    def _route_memo_key(pair, params: tuple) -> str:
+        return json.dumps([pair[0], pair[1], *params])
+
+    def _recall_routes(self, pairs, params: tuple) -> dict:
+        """
+        :return: {(origin, destination): route response} of the pairs found in `self.route_memo`
+        """
+        routes = {}
+        for pair in pairs:
+            value = self.route_memo.get(self._route_memo_key(pair, params))
+            if value is not None:
+                routes[pair] = json.loads(value)
+        return routes
+
+    def _memoize_routes(self, pairs, responses, params: tuple) -> dict:
+        """
+        Remember the responses that have a route, failures are routed again next time
+        :return: {(origin, destination): response or exception}
+        """
+        for pair, response in zip(pairs, responses):
+            if isinstance(response, BaseException):
+                continue
+            try:
+                route_summary(response)
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            self.route_memo.set(self._route_memo_key(pair, params), json.dumps(response).encode(), self.route_memo_ttl)
+        return dict(zip(pairs, responses))
+
+    @staticmethod
+    def _matrix_cells(origins, destinations, skip_diagonal: bool = False):
+        """
+        :return: (origins, destinations, {(origin, destination): [(i, j), ...]}) with every distinct pair once
+        """
+        origins = [tuple(map(float, point)) for point in origins]
+        destinations = [tuple(map(float, point)) for point in destinations]
+
+        cells = {}
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                if skip_diagonal and i == j:
+                    continue
+                cells.setdefault((origin, destination), []).append((i, j))
 
-        return self.parse_response(response)
+        return origins, destinations, cells
+
+    def _build_matrix(self, origins, destinations, cells: dict, responses: list,
+                      skip_diagonal: bool = False, keep_geometry: bool = False) -> RouteMatrix:
+        shape = (len(origins), len(destinations))
+        total_time = np.full(shape, np.nan)
+        total_distance = np.full(shape, np.nan)
+        encoded_geometry = np.full(shape, None, dtype=object) if keep_geometry else None
+        if skip_diagonal:
+            np.fill_diagonal(total_time, 0)
+            np.fill_diagonal(total_distance, 0)
+
+        failed = []
+        for pair, response in zip(cells, responses):
+            if isinstance(response, BaseException):
+                self.logger.warning(f"Routing from {pair[0]} to {pair[1]} failed: "
+                                    f"{type(response).__name__}: {response}")
+                failed.extend(cells[pair])
+                continue
+            try:
+                summary = route_summary(response)
+            except (KeyError, IndexError, TypeError, ValueError):
+                self.logger.warning(f"No route from {pair[0]} to {pair[1]}: {response}")
+                failed.extend(cells[pair])
+                continue
+            for i, j in cells[pair]:
+                total_time[i, j], total_distance[i, j] = summary[0], summary[1]
+                if keep_geometry:
+                    encoded_geometry[i, j] = summary[2]
+
+        return RouteMatrix(origins, destinations, total_time, total_distance, encoded_geometry, sorted(failed))
 
     @staticmethod
     def decode_route_geometry(polyline):
         # Convenience wrapper for decoding route geometry
         return decode_polyline(polyline.encode("utf-8"), 5)
 
+    @staticmethod
+    def decode_route_geometries(polylines, out: str = None) -> PolylineBatch:
+        """
+        Decode many route geometries at once into one flat (lng, lat) coordinate array plus offsets
+        :param polylines: Iterable of encoded `route_geometry` strings
+        :param out: (Optional) Path prefix to write the result to as memory-mapped `.npy` files
+        :return: `polyline.PolylineBatch`
+        """
+        return decode_polylines(polylines, 5, out)
+
     def route_from_postal(self, start_postal: str, end_postal: str, route_type: str,
               date: str = None, time: str = None,
               mode: str = None, max_walk_distance: int = None, num_itineraries: int = None):
@@ -70,17 +281,60 @@ class Router(OneMap):
         if len(start_postal) + len(end_postal) != 12:
             raise ValueError("Please provide valid postal codes, which contain 6 digits each")
 
-        try:
-            start_point = (self.search(start_postal)['results'][0]['LATITUDE'],
-                           self.search(start_postal)['results'][0]['LONGITUDE'])
-        except IndexError:  # out of bounds means empty results list returned
-            raise ValueError(f"Please check your starting postal code, {start_postal} did not return any results")
+        # Start and end are looked up concurrently, and memoized by self.resolver
+        points = self.resolver.resolve_many([start_postal, end_postal], max_workers=2)
 
-        try:
-            end_point = (self.search(end_postal)['results'][0]['LATITUDE'],
-                         self.search(start_postal)['results'][0]['LONGITUDE'])
-        except IndexError:
-            raise ValueError(f"Please check your destination postal code, {end_postal} did not return any results")
+        start_point = self._resolved_point(points, start_postal, "starting")
+        end_point = self._resolved_point(points, end_postal, "destination")
 
         return self.route(start_point, end_point, route_type, date, time, mode,
                           max_walk_distance, num_itineraries)
+
+    def route_from_postal_many(self, postal_pairs, route_type: str,
+                               date: str = None, time: str = None,
+                               mode: str = None, max_walk_distance: int = None, num_itineraries: int = None,
+                               max_workers: int = 8):
+        """
+        Route between many (start postal code, end postal code) pairs concurrently.
+        Every distinct postal code is only looked up once across the whole batch.
+
+        :param postal_pairs: Sequence of (start_postal, end_postal)
+        :param route_type: One of self.supported_route_types
+        :param date, time, mode, max_walk_distance, num_itineraries: See `route`
+        :param max_workers: Number of concurrent lookups and route calls
+        :return: List of route responses in the order of `postal_pairs`, with
+            {"error": ...} for pairs whose postal codes did not return any results or could not be looked up
+        """
+        self._check_route_type(route_type)
+        self.check_auth_and_authenticate()
+
+        postal_pairs = list(postal_pairs)
+        points = self.resolver.resolve_many([postal for pair in postal_pairs for postal in pair], max_workers)
+
+        def route(pair):
+            error = self._unresolved_postal_error(pair, points)
+            if error is not None:
+                return error
+            return self.route(points[pair[0]], points[pair[1]], route_type, date, time, mode,
+                              max_walk_distance, num_itineraries)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(route, postal_pairs))
+
+    @staticmethod
+    def _resolved_point(points: dict, postal: str, which: str):
+        point = points[postal]
+        if isinstance(point, PostalCodeNotFoundError):
+            raise PostalCodeNotFoundError(f"Please check your {which} postal code, "
+                                          f"{postal} did not return any results") from point
+        if isinstance(point, Exception):
+            raise OneMapError(f"Failed to look up {which} postal code {postal}: {point}") from point
+        return point
+
+    @staticmethod
+    def _unresolved_postal_error(pair, points: dict):
+        for postal in pair:
+            if isinstance(points[postal], PostalCodeNotFoundError):
+                return {"error": f"Postal code {postal} did not return any results"}
+            if isinstance(points[postal], Exception):
+                return {"error": f"Failed to look up postal code {postal}: {points[postal]}"}
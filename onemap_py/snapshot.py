@@ -0,0 +1,236 @@
+"""
+Offline snapshot of the OneMap datasets that rarely change: planning area boundaries, population data and themes.
+
+Everything is exported into one versioned bundle file (see `bundle`), whose arrays are memory-mapped back, so
+that services can answer those queries locally instead of fetching them on every cold start:
+
+    export_snapshot(client, "onemap.snapshot", population_years=[2015, 2020], themes=["kindergartens"])
+
+    client = Client(email, password, snapshot="onemap.snapshot")
+    client.PlanningAreas.get_all_planning_areas(year=2014)      # served from the snapshot
+    client.Router.route(...)                                    # live API
+
+Queries the snapshot cannot answer (another year, theme or population cell) fall back to the live API.
+"""
+import json
+import time
+
+import numpy as np
+
+from . import bundle
+from .exceptions import OneMapError
+from .geometry import PlanningAreaBoundaries
+from .population import PopulationCube
+from .spatial import _parse_latlng
+
+FORMAT_VERSION = 1
+_MAGIC = b"OMSNAP1\0"
+
+
+def export_snapshot(client, path: str, years=None, population_years=(), data_types=None, by_gender: bool = False,
+                    themes=(), max_workers: int = 8):
+    """
+    Download the static datasets through `client` into a snapshot bundle file
+    :param client: `Client` to download with
+    :param path: File to write
+    :param years: Years of the planning area boundaries, all of `PlanningAreas.supported_years` if not provided
+    :param population_years: Years of population data to include, none if empty
+    :param data_types: Population data types, all of them if not provided
+    :param by_gender: Include the population data types available by gender once per gender
+    :param themes: Query names of the themes to include
+    :param max_workers: Number of concurrent requests for the population data
+    :return: The exported `Snapshot`, memory-mapped from `path`
+    :raises OneMapError: If any dataset could not be downloaded, rather than exporting an incomplete snapshot
+    """
+    header = {"format": FORMAT_VERSION, "created_at": time.time(), "planning_areas": {}, "population": None,
+              "themes": {}, "themes_info": None}
+    arrays = {}
+
+    for year in client.PlanningAreas.supported_years if years is None else years:
+        names = client.PlanningAreas.get_all_planning_areas(year=year, names_only=True)
+        if not isinstance(names, list):
+            raise OneMapError(f"Failed to list the planning areas of {year}: {names}")
+        try:
+            boundaries = client.PlanningAreas.get_boundaries(year=year)
+        except ValueError as e:
+            raise OneMapError(f"Failed to get the planning area boundaries of {year}: {e}") from e
+        header["planning_areas"][str(year)] = {"names": boundaries.names, "names_response": names}
+        arrays.update({f"planning_areas/{year}/{name}": array for name, array in boundaries.to_arrays().items()})
+
+    if population_years:
+        cube = client.Population.fetch_cube(data_types, population_years, by_gender=by_gender,
+                                            max_workers=max_workers)
+        if cube.failed:
+            raise OneMapError(f"Failed to fetch {len(cube.failed)} population cells, e.g. {cube.failed[0]}")
+        # Rows sorted by cell, in the same order as the cells in the header
+        columns = cube.to_dict()
+        order = np.lexsort((columns["gender"], columns["planning_area"], columns["year"], columns["data_type"]))
+        arrays.update({f"population/{name}": column[order] for name, column in columns.items()})
+        header["population"] = {"cells": [list(cell) + [rows] for cell, rows in sorted(cube.cells.items())]}
+
+    if themes:
+        themes_info = client.Themes.get_all_themes_info()
+        if not isinstance(themes_info, dict) or "Theme_Names" not in themes_info:
+            raise OneMapError(f"Failed to get the themes' info: {themes_info}")
+        header["themes_info"] = themes_info
+    for theme in themes:
+        response = client.Themes.retrieve_theme(theme)
+        if not isinstance(response, tuple):
+            raise OneMapError(f"Failed to retrieve theme {theme}: {response}")
+        metadata, records = response
+        header["themes"][theme] = {"metadata": metadata}
+        arrays[f"themes/{theme}"] = np.frombuffer(json.dumps(records).encode(), dtype=np.uint8)
+
+    bundle.write(path, _MAGIC, header, arrays)
+    return Snapshot.load(path)
+
+
+def load_snapshot(path: str, mmap_mode: str = "r"):
+    """
+    :param path: File written by `export_snapshot`
+    :param mmap_mode: Memory-map mode (see `numpy.memmap`), None to read the whole file into memory instead
+    :return: `Snapshot`, pass it (or `path`) to `Client(snapshot=...)`
+    """
+    return Snapshot.load(path, mmap_mode)
+
+
+class Snapshot(object):
+    """
+    Datasets of a snapshot bundle, answering the same queries as the API. Every method returns None for a query
+    the snapshot has no data for.
+
+    Datasets are decoded on first access and then kept, so repeated queries take microseconds.
+    """
+    def __init__(self, header: dict, arrays: dict):
+        """
+
+        :param header: Bundle header, see `export_snapshot`
+        :param arrays: Bundle arrays
+        """
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {header.get('format')}, expected {FORMAT_VERSION}")
+        self.header = header
+        self.arrays = arrays
+        self.created_at = header["created_at"]
+        self._boundaries = {}
+        self._planning_areas = {}
+        self._themes = {}
+        self._cells = None
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r"):
+        header, arrays = bundle.read(path, _MAGIC, mmap_mode)
+        return cls(header, arrays)
+
+    @property
+    def years(self):
+        """
+        :return: Years of the planning area boundaries in the snapshot
+        """
+        return sorted(int(year) for year in self.header["planning_areas"])
+
+    @property
+    def themes(self):
+        return list(self.header["themes"])
+
+    def boundaries(self, year: int = 2014) -> PlanningAreaBoundaries:
+        year = str(year)
+        if year not in self.header["planning_areas"]:
+            return None
+        if year not in self._boundaries:
+            prefix = f"planning_areas/{year}/"
+            arrays = {name[len(prefix):]: array for name, array in self.arrays.items() if name.startswith(prefix)}
+            self._boundaries[year] = PlanningAreaBoundaries.from_arrays(
+                self.header["planning_areas"][year]["names"], arrays, year=int(year))
+        return self._boundaries[year]
+
+    def planning_areas(self, year: int = 2014, names_only: bool = False):
+        """
+        :return: Response of `PlanningAreas.get_all_planning_areas`, the GeoJSON rebuilt from the boundaries
+        """
+        if str(year) not in self.header["planning_areas"]:
+            return None
+        if names_only:
+            return self.header["planning_areas"][str(year)]["names_response"]
+        if str(year) not in self._planning_areas:
+            self._planning_areas[str(year)] = {"SearchResults": [
+                {"pln_area_n": area.name, "geojson": json.dumps(area.__geo_interface__)}
+                for area in self.boundaries(year)]}
+        return self._planning_areas[str(year)]
+
+    @property
+    def cells(self) -> dict:
+        """
+        :return: (data_type, year, planning_area, gender) -> (first row, last row + 1) of the population columns
+        """
+        if self._cells is None:
+            cells, start = {}, 0
+            for data_type, year, planning_area, gender, rows in (self.header["population"] or {}).get("cells", []):
+                cells[(data_type, year, planning_area, gender)] = (start, start + rows)
+                start += rows
+            self._cells = cells
+        return self._cells
+
+    def population(self, data_type: str, year: int, planning_area: str, gender: str = None):
+        """
+        :return: Response of `Population.get_population_data` (or `get_population_by_gender` if `gender`),
+            rebuilt from the population cube: one record with every category
+        """
+        try:
+            cell = (data_type, int(year), planning_area, gender or "")
+        except (TypeError, ValueError):
+            return None
+        if cell not in self.cells:
+            return None
+        start, end = self.cells[cell]
+        if start == end:
+            return [{"Result": "No Data Available!"}]
+
+        record = {"planning_area": planning_area, "year": int(year)}
+        if gender:
+            record["gender"] = gender
+        categories = self.arrays["population/category"][start:end].tolist()
+        record.update(zip(categories, self.arrays["population/value"][start:end].tolist()))
+        return [record]
+
+    def cube(self) -> PopulationCube:
+        """
+        :return: The population data as a `PopulationCube`
+        """
+        cube = PopulationCube()
+        if self.header["population"] is None:
+            return cube
+        for column in cube.COLUMNS:
+            cube.rows[column] = self.arrays[f"population/{column}"].tolist()
+        cube.cells = {cell: end - start for cell, (start, end) in self.cells.items()}
+        return cube
+
+    def theme(self, theme: str, bbox=None):
+        """
+        :param bbox: (Optional) Bounding box vertices ((lat,lng), (lat,lng)) to filter results
+        :return: (metadata, results), as returned by `Themes.retrieve_theme`
+        """
+        if theme not in self.header["themes"]:
+            return None
+        if theme not in self._themes:
+            self._themes[theme] = json.loads(self.arrays[f"themes/{theme}"].tobytes())
+        records = self._themes[theme]
+        metadata = self.header["themes"][theme]["metadata"]
+        if bbox is None:
+            return metadata, list(records)
+
+        (lat1, lng1), (lat2, lng2) = bbox
+        lat_lo, lat_hi, lng_lo, lng_hi = min(lat1, lat2), max(lat1, lat2), min(lng1, lng2), max(lng1, lng2)
+        inside = []
+        for record in records:
+            lat, lng = _parse_latlng(record.get("LatLng"))
+            if lat_lo <= lat <= lat_hi and lng_lo <= lng <= lng_hi:
+                inside.append(record)
+        return metadata, inside
+
+    @property
+    def themes_info(self):
+        """
+        :return: Response of `Themes.get_all_themes_info`, if the snapshot has any themes
+        """
+        return self.header["themes_info"]
@@ -0,0 +1,478 @@
+"""
+Local spatial indexes over OneMap datasets, answering queries without calling the API.
+"""
+import json
+
+import numpy as np
+
+
+def _parse_rings(geojson):
+    """
+    :param geojson: GeoJSON Polygon or MultiPolygon geometry, either as a string or already parsed
+    :return: List of (n, 2) arrays of (lng, lat), one per ring, holes included
+    """
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+
+    polygons = geojson["coordinates"]
+    if geojson["type"] == "Polygon":
+        polygons = [polygons]
+
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+
+
+class PlanningAreaIndex(object):
+    """
+    Offline point-in-polygon index over the planning area boundaries of one year.
+
+    Boundary edges are bucketed into horizontal bands of latitude. A point is located by casting a ray
+    eastwards and counting, per planning area, how many of its band's edges it crosses: the area with an
+    odd count contains the point. Only the few edges in the point's band are ever tested.
+
+        index = client.PlanningAreas.build_index(year=2014)
+        index.lookup(1.3521, 103.8198)          # 'BISHAN'
+        index.lookup_many(lats, lngs)           # array of names, None where outside every area
+    """
+    def __init__(self, names, rings, ring_areas, year: int = None, num_bands: int = 1024):
+        """
+
+        :param names: Planning area names
+        :param rings: List of (n, 2) arrays of (lng, lat), one per ring
+        :param ring_areas: Index into `names` of the planning area each ring belongs to
+        :param year: Year of the planning area boundaries
+        :param num_bands: Number of latitude bands to bucket edges into
+        """
+        self.names = list(names)
+        self.year = year
+
+        # Edges (x1, y1, x2, y2) of every ring, horizontal edges never cross an eastward ray
+        edges, edge_areas = [], []
+        for ring, area in zip(rings, ring_areas):
+            if len(ring) < 3:
+                continue
+            if not np.array_equal(ring[0], ring[-1]):
+                ring = np.vstack([ring, ring[:1]])
+            ring_edges = np.hstack([ring[:-1], ring[1:]])
+            ring_edges = ring_edges[ring_edges[:, 1] != ring_edges[:, 3]]
+            edges.append(ring_edges)
+            edge_areas.append(np.full(len(ring_edges), area, dtype=np.int32))
+        edges = np.vstack(edges) if edges else np.empty((0, 4))
+        edge_areas = np.concatenate(edge_areas) if edge_areas else np.empty(0, dtype=np.int32)
+
+        self._build(edges, edge_areas, num_bands)
+
+    def _build(self, edges: np.ndarray, edge_areas: np.ndarray, num_bands: int):
+        self.edges = edges
+        self.edge_areas = edge_areas
+        self.num_bands = num_bands
+
+        lo = np.minimum(edges[:, 1], edges[:, 3])
+        hi = np.maximum(edges[:, 1], edges[:, 3])
+        self.y0 = float(lo.min()) if len(edges) else 0.0
+        self.band_height = (float(hi.max()) - self.y0) / num_bands if len(edges) else 1.0
+
+        # Expand each edge into every band it overlaps, then sort by (band, area) into CSR form
+        band_lo = np.clip(((lo - self.y0) // self.band_height).astype(np.int64), 0, num_bands - 1)
+        band_hi = np.clip(((hi - self.y0) // self.band_height).astype(np.int64), 0, num_bands - 1)
+        counts = band_hi - band_lo + 1
+        edge_ids = np.repeat(np.arange(len(edges)), counts)
+        bands = np.repeat(band_lo, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+
+        order = np.lexsort((edge_areas[edge_ids], bands))
+        self.band_edges = edge_ids[order]
+        self.band_offsets = np.searchsorted(bands[order], np.arange(num_bands + 1))
+
+    @classmethod
+    def from_response(cls, response, year: int = None, **kwargs):
+        """
+        Build the index from the response of `PlanningAreas.get_all_planning_areas`
+        """
+        records = response["SearchResults"] if isinstance(response, dict) else response
+
+        names, rings, ring_areas = [], [], []
+        for record in records:
+            if not record.get("geojson"):
+                continue
+            area_rings = _parse_rings(record["geojson"])
+            rings.extend(area_rings)
+            ring_areas.extend([len(names)] * len(area_rings))
+            names.append(record["pln_area_n"])
+
+        return cls(names, rings, ring_areas, year=year, **kwargs)
+
+    @classmethod
+    def from_boundaries(cls, boundaries, **kwargs):
+        """
+        Build the index from `PlanningAreaBoundaries`, e.g. loaded from disk
+        """
+        rings, ring_areas = [], []
+        for i, area in enumerate(boundaries):
+            area_rings = area.rings
+            rings.extend(area_rings)
+            ring_areas.extend([i] * len(area_rings))
+
+        return cls(boundaries.names, rings, ring_areas, year=boundaries.year, **kwargs)
+
+    @classmethod
+    def from_api(cls, planning_areas, year: int = 2014, **kwargs):
+        """
+        Download the boundaries for `year` once through a `PlanningAreas` instance and index them
+        """
+        return cls.from_response(planning_areas.get_all_planning_areas(year=year), year=year, **kwargs)
+
+    def query(self, lat, lng) -> np.ndarray:
+        """
+        Vectorized point-in-polygon lookup
+        :param lat: Latitude(s)
+        :param lng: Longitude(s)
+        :return: Index into self.names of the planning area containing each point, -1 if none
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lng = np.atleast_1d(np.asarray(lng, dtype=np.float64))
+        result = np.full(lat.shape, -1, dtype=np.int32)
+
+        bands = np.floor((lat - self.y0) / self.band_height)
+        valid = np.flatnonzero((bands >= 0) & (bands < self.num_bands))
+        bands = bands[valid].astype(np.int64)
+
+        order = np.argsort(bands, kind="stable")
+        points = valid[order]
+        point_bands, starts = np.unique(bands[order], return_index=True)
+        ends = np.append(starts[1:], len(points))
+
+        for band, start, end in zip(point_bands, starts, ends):
+            edge_ids = self.band_edges[self.band_offsets[band]:self.band_offsets[band + 1]]
+            if len(edge_ids) == 0:
+                continue
+            # Bound the (points x edges) working set to a few million cells
+            chunk = max(1, 4000000 // len(edge_ids))
+            for chunk_start in range(start, end, chunk):
+                idx = points[chunk_start:min(end, chunk_start + chunk)]
+                result[idx] = self._locate(lat[idx], lng[idx], edge_ids)
+
+        return result
+
+    def _locate(self, lat: np.ndarray, lng: np.ndarray, edge_ids: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = self.edges[edge_ids].T
+        py = lat[:, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = (straddles & (lng[:, None] < x_cross)).astype(np.int32)
+
+        # Edges are sorted by area within a band, so crossings can be summed per area in one pass
+        areas = self.edge_areas[edge_ids]
+        area_starts = np.flatnonzero(np.r_[True, areas[1:] != areas[:-1]])
+        inside = np.add.reduceat(crossings, area_starts, axis=1) % 2 == 1
+
+        found = inside.any(axis=1)
+        return np.where(found, areas[area_starts][inside.argmax(axis=1)], -1)
+
+    def lookup(self, lat: float, lng: float):
+        """
+        :return: Name of the planning area containing (lat, lng), or None
+        """
+        area = self.query(lat, lng)[0]
+        return self.names[area] if area >= 0 else None
+
+    def lookup_many(self, lat, lng) -> np.ndarray:
+        """
+        :return: Object array with the planning area name of each point, None where outside every area
+        """
+        names = np.array(self.names + [None], dtype=object)
+        return names[self.query(lat, lng)]
+
+    def save(self, path: str):
+        """
+        Save the index to a `.npz` file, so it can be loaded without downloading or rebuilding it
+        """
+        np.savez(path, names=np.array(self.names, dtype=str), edges=self.edges, edge_areas=self.edge_areas,
+                 band_edges=self.band_edges, band_offsets=self.band_offsets,
+                 meta=np.array([self.y0, self.band_height, self.num_bands,
+                                -1 if self.year is None else self.year], dtype=np.float64))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.names = data["names"].tolist()
+            index.edges = data["edges"]
+            index.edge_areas = data["edge_areas"]
+            index.band_edges = data["band_edges"]
+            index.band_offsets = data["band_offsets"]
+            y0, band_height, num_bands, year = data["meta"]
+        index.y0 = float(y0)
+        index.band_height = float(band_height)
+        index.num_bands = int(num_bands)
+        index.year = None if year < 0 else int(year)
+        return index
+
+
+EARTH_RADIUS = 6371008.8
+
+
+def _parse_latlng(value):
+    """
+    :param value: `LatLng` of a theme result, "lat,lng", or "lat,lng|lat,lng|..." for lines and polygons
+    :return: (lat, lng), the mean of all vertices for lines and polygons, or (nan, nan) if unparseable
+    """
+    try:
+        pairs = [pair.split(",") for pair in str(value).split("|") if pair]
+        lat = sum(float(pair[0]) for pair in pairs) / len(pairs)
+        lng = sum(float(pair[1]) for pair in pairs) / len(pairs)
+    except (ValueError, IndexError, ZeroDivisionError):
+        return float("nan"), float("nan")
+    return lat, lng
+
+
+def _theme_version(metadata: dict, feature_count: bool = True):
+    """
+    :param feature_count: Fall back to the feature count if the metadata has no date and time fields. False for
+        the metadata of a bbox probe, whose count is that of the probed area rather than of the whole theme
+    :return: The date and time fields of a theme's metadata record, which change whenever the theme is updated
+    """
+    if not isinstance(metadata, dict):
+        return None
+    version = {k: v for k, v in metadata.items() if "date" in k.lower() or "time" in k.lower()}
+    if not version and feature_count:
+        version = {"FeatCount": metadata.get("FeatCount")}
+    return json.dumps(version, sort_keys=True, default=str)
+
+
+class ThemeIndex(object):
+    """
+    Offline nearest neighbour, radius and bounding box index over every result of one theme.
+
+    Points are projected to metres (equirectangular, exact enough at Singapore's scale) and bucketed into a
+    uniform grid, sorted by cell so that each row of cells is one contiguous slice. Queries only test the
+    points of the cells around them, and batches are processed one occupied grid cell at a time.
+
+        index = client.Themes.build_index("kindergartens")
+        distances, ids = index.nearest(lats, lngs, k=5)    # (n, 5) arrays, metres and indices
+        index.records[ids[0, 0]]["NAME"]
+        index.refresh(client.Themes)                       # re-downloads only if the theme changed
+    """
+    def __init__(self, records, metadata: dict = None, theme: str = None, points_per_cell: float = 4):
+        """
+
+        :param records: Theme results, as returned in the second element of `Themes.retrieve_theme`
+        :param metadata: Metadata record, the first element of `Themes.retrieve_theme`
+        :param theme: Query name of the theme
+        :param points_per_cell: Average number of points per grid cell
+        """
+        self.theme = theme
+        self.points_per_cell = points_per_cell
+        self._build(list(records), metadata)
+
+    def _build(self, records, metadata):
+        self.metadata = metadata
+        self.version = _theme_version(metadata)
+
+        latlng = np.array([_parse_latlng(record.get("LatLng")) for record in records],
+                          dtype=np.float64).reshape(-1, 2)
+        valid = ~np.isnan(latlng).any(axis=1)
+        self.records = [record for record, ok in zip(records, valid) if ok]
+        self.latlng = latlng[valid]
+
+        self.lat0 = float(np.radians(self.latlng[:, 0].mean())) if len(self.latlng) else 0.0
+        xy = self._project(self.latlng[:, 0], self.latlng[:, 1])
+
+        # Grid sized for about `points_per_cell` points per cell
+        self.origin = xy.min(axis=0) if len(xy) else np.zeros(2)
+        extent = np.maximum(xy.max(axis=0) - self.origin, 1.0) if len(xy) else np.ones(2)
+        self.cell_size = max(1.0, float(np.sqrt(extent[0] * extent[1] * self.points_per_cell / max(1, len(xy)))))
+        self.shape = tuple(int(i) for i in np.floor(extent / self.cell_size).astype(np.int64) + 1)
+
+        cells = self._cell_ids(xy)
+        order = np.argsort(cells, kind="stable")
+        self.order = order
+        self.xy = xy[order]
+        self.cell_offsets = np.searchsorted(cells[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    @classmethod
+    def from_api(cls, themes, theme: str, **kwargs):
+        """
+        Download every result of `theme` once through a `Themes` instance and index them
+        """
+        response = themes.retrieve_theme(theme)
+        if not isinstance(response, tuple):
+            raise ValueError(f"Failed to retrieve theme {theme}: {response}")
+        metadata, records = response
+        return cls(records, metadata, theme=theme, **kwargs)
+
+    def refresh(self, themes, metadata: dict = None) -> bool:
+        """
+        Re-download the theme only if its metadata changed since the index was built
+        :param themes: `Themes` instance
+        :param metadata: (Optional) Current metadata record of the theme. If not provided, it is fetched with a
+            `retrieve_theme` call over an empty area, which returns the metadata record without any results. Its
+            feature count is that of the empty area, so only its date and time fields are compared: a theme without
+            any is then never downloaded again, pass `metadata` with its current `FeatCount` to detect changes
+        :return: True if the index was rebuilt
+        """
+        if metadata is None:
+            response = themes.retrieve_theme(self.theme, bbox=((0.0, 0.0), (0.00001, 0.00001)))
+            probe = response[0] if isinstance(response, tuple) else None
+            unchanged = probe is not None and \
+                _theme_version(probe, feature_count=False) == _theme_version(self.metadata, feature_count=False)
+        else:
+            unchanged = _theme_version(metadata) == self.version
+        if unchanged:
+            return False
+
+        response = themes.retrieve_theme(self.theme)
+        if not isinstance(response, tuple):
+            raise ValueError(f"Failed to retrieve theme {self.theme}: {response}")
+        self._build(response[1], response[0])
+        return True
+
+    def __len__(self):
+        return len(self.records)
+
+    def _project(self, lat, lng) -> np.ndarray:
+        lat = np.radians(np.asarray(lat, dtype=np.float64))
+        lng = np.radians(np.asarray(lng, dtype=np.float64))
+        return np.stack([EARTH_RADIUS * np.cos(self.lat0) * lng, EARTH_RADIUS * lat], axis=-1).reshape(-1, 2)
+
+    def _cells(self, xy: np.ndarray) -> np.ndarray:
+        # Points outside the grid are clamped to its edge, distances are always computed exactly
+        cells = np.floor((xy - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, np.array(self.shape) - 1)
+
+    def _cell_ids(self, xy: np.ndarray) -> np.ndarray:
+        cells = self._cells(xy)
+        return cells[:, 1] * self.shape[0] + cells[:, 0]
+
+    def _candidates(self, cell, reach: int) -> np.ndarray:
+        """
+        :return: Positions (into self.xy) of the points within `reach` cells of `cell`
+        """
+        x0, x1 = max(0, cell[0] - reach), min(self.shape[0] - 1, cell[0] + reach)
+        y0, y1 = max(0, cell[1] - reach), min(self.shape[1] - 1, cell[1] + reach)
+        rows = np.arange(y0, y1 + 1) * self.shape[0]
+        starts = self.cell_offsets[rows + x0]
+        ends = self.cell_offsets[rows + x1 + 1]
+        lengths = ends - starts
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def _outside(self, xy: np.ndarray, cell) -> np.ndarray:
+        """
+        :return: Distance of each point from `cell`, non-zero only for points clamped into the grid
+        """
+        lo = self.origin + np.asarray(cell) * self.cell_size
+        gap = np.maximum(np.maximum(lo - xy, xy - (lo + self.cell_size)), 0)
+        return np.hypot(gap[:, 0], gap[:, 1])
+
+    def _by_cell(self, xy: np.ndarray):
+        """
+        Group query points by grid cell
+        :return: Generator of (cell, query indices)
+        """
+        cells = self._cells(xy)
+        ids = cells[:, 1] * self.shape[0] + cells[:, 0]
+        order = np.argsort(ids, kind="stable")
+        unique, starts = np.unique(ids[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for start, end in zip(starts, ends):
+            yield cells[order[start]], order[start:end]
+
+    def nearest(self, lat, lng, k: int = 1):
+        """
+        k nearest theme results of each point
+        :param lat: Latitude(s)
+        :param lng: Longitude(s)
+        :param k: Number of neighbours
+        :return: (distances in metres, indices into self.records), both (n, k) arrays sorted by distance.
+            Padded with inf and -1 if the theme has fewer than k results
+        """
+        xy = self._project(np.atleast_1d(lat), np.atleast_1d(lng))
+        distances = np.full((len(xy), k), np.inf)
+        indices = np.full((len(xy), k), -1, dtype=np.int64)
+        if len(self.xy) == 0:
+            return distances, indices
+        kk = min(k, len(self.xy))
+        max_reach = max(self.shape)
+
+        for cell, queries in self._by_cell(xy):
+            outside = self._outside(xy[queries], cell)
+            # Grow the neighbourhood until it holds k points...
+            reach = 1
+            candidates = self._candidates(cell, reach)
+            while len(candidates) < kk and reach < max_reach:
+                reach *= 2
+                candidates = self._candidates(cell, reach)
+            while True:
+                d = np.hypot(xy[queries, None, 0] - self.xy[candidates, 0],
+                             xy[queries, None, 1] - self.xy[candidates, 1])
+                part = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+                # ...and until it reaches at least as far as the k-th neighbour of every query in the cell
+                kth = (np.take_along_axis(d, part, axis=1).max(axis=1) + outside).max()
+                needed = int(np.ceil(kth / self.cell_size))
+                if needed <= reach or reach >= max_reach:
+                    break
+                reach = min(max_reach, needed)
+                candidates = self._candidates(cell, reach)
+
+            part_d = np.take_along_axis(d, part, axis=1)
+            ranked = np.argsort(part_d, axis=1)
+            distances[queries, :kk] = np.take_along_axis(part_d, ranked, axis=1)
+            indices[queries, :kk] = self.order[candidates[np.take_along_axis(part, ranked, axis=1)]]
+
+        return distances, indices
+
+    def within(self, lat, lng, radius: float):
+        """
+        Theme results within `radius` metres of each point
+        :return: List with one array of indices into self.records per point, sorted by distance
+        """
+        xy = self._project(np.atleast_1d(lat), np.atleast_1d(lng))
+        out = [np.empty(0, dtype=np.int64)] * len(xy)
+        if len(self.xy) == 0:
+            return out
+        for cell, queries in self._by_cell(xy):
+            reach = int(np.ceil((radius + self._outside(xy[queries], cell).max()) / self.cell_size))
+            candidates = self._candidates(cell, reach)
+            d = np.hypot(xy[queries, None, 0] - self.xy[candidates, 0],
+                         xy[queries, None, 1] - self.xy[candidates, 1])
+            for row, query in enumerate(queries):
+                inside = np.flatnonzero(d[row] <= radius)
+                out[query] = self.order[candidates[inside[np.argsort(d[row, inside])]]]
+
+        return out
+
+    def in_bbox(self, bbox) -> np.ndarray:
+        """
+        :param bbox: ((lat, lng), (lat, lng)) corners, as for `Themes.retrieve_theme`
+        :return: Indices into self.records of the results inside `bbox`
+        """
+        (lat0, lng0), (lat1, lng1) = bbox
+        corners = self._project([min(lat0, lat1), max(lat0, lat1)], [min(lng0, lng1), max(lng0, lng1)])
+        lo, hi = self._cells(corners)
+        centre = (lo + hi) // 2
+        candidates = self._candidates(centre, int(max(hi - lo)) // 2 + 1)
+        xy = self.xy[candidates]
+        inside = ((xy >= corners[0]) & (xy <= corners[1])).all(axis=1)
+        return np.sort(self.order[candidates[inside]])
+
+    def nearest_records(self, lat: float, lng: float, k: int = 1):
+        """
+        :return: List of (record, distance in metres) of the k results nearest to (lat, lng)
+        """
+        distances, indices = self.nearest(lat, lng, k)
+        return [(self.records[i], float(d)) for d, i in zip(distances[0], indices[0]) if i >= 0]
+
+    def save(self, path: str):
+        """
+        Save the index to a `.npz` file, including the metadata needed by `refresh`
+        """
+        np.savez(path, records=np.array([json.dumps(record) for record in self.records], dtype=str),
+                 metadata=np.array(json.dumps(self.metadata), dtype=str),
+                 theme=np.array(json.dumps(self.theme), dtype=str),
+                 points_per_cell=np.array(self.points_per_cell))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls([json.loads(record) for record in data["records"].tolist()],
+                       json.loads(str(data["metadata"])), theme=json.loads(str(data["theme"])),
+                       points_per_cell=float(data["points_per_cell"]))
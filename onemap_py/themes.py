@@ -1,29 +1,26 @@
 from .base import *
+from .spatial import ThemeIndex
 
 
 class Themes(OneMap):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, timeout = 10, transport: Transport = None, tokens: TokenProvider = None):
+        super().__init__(timeout=timeout, transport=transport, tokens=tokens)
 
     def get_theme_info(self, theme_name: str,
                        endpoint: str = "/privateapi/themesvc/getThemeInfo"):
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{endpoint}",
-                                params={"token": self.token, "queryName": theme_name})
-
-        response = self.parse_response(response)
+        response = self._get(endpoint, {"token": self.token, "queryName": theme_name})
 
         return response
 
     def get_all_themes_info(self, more_info = "Y", theme_endpoint: str = "/privateapi/themesvc/getAllThemesInfo"):
+        if self.snapshot is not None and more_info == "Y" and self.snapshot.themes_info is not None:
+            return self.snapshot.themes_info
 
         self.check_auth_and_authenticate()
 
-        response = requests.get(url=f"{self.url}{theme_endpoint}",
-                                params={"token": self.token, "moreInfo": more_info})
-
-        response = self.parse_response(response)
+        response = self._get(theme_endpoint, {"token": self.token, "moreInfo": more_info})
 
         return response
 
@@ -37,29 +34,75 @@ class Themes(OneMap):
         :param endpoint: Parameterized in case endpoint changes
         :return: Dictionary form of json response from API
         """
+        if self.snapshot is not None:
+            response = self.snapshot.theme(theme, bbox)
+            if response is not None:
+                return response
+
         self.check_auth_and_authenticate()
+
+        response = self._get(endpoint, self._retrieve_theme_payload(theme, bbox))
+
+        return self._split_theme_results(response)
+
+    def iter_theme(self, theme: str, bbox: Tuple[Tuple[float, float], Tuple[float, float]] = None,
+                   endpoint="/privateapi/themesvc/retrieveTheme"):
+        """
+        Streaming version of `retrieve_theme`: yields the theme's results one at a time while the response is
+        being downloaded, instead of holding them all in memory at once. The metadata record is skipped.
+        :param theme: One of the acceptable `QueryName`s as returned from get_themes()
+        :param bbox: (Optional) Bounding box vertices ((lat,lng), (lat,lng)) to filter results
+        :param endpoint: Parameterized in case endpoint changes
+        :return: Generator of result records
+        :raises OneMapError: If the request failed
+        """
+        if self.snapshot is not None:
+            response = self.snapshot.theme(theme, bbox)
+            if response is not None:
+                yield from response[1]
+                return
+
+        self.check_auth_and_authenticate()
+
+        records = self._stream(endpoint, self._retrieve_theme_payload(theme, bbox), key="SrchResults")
+        # First one is metadata
+        next(records, None)
+        yield from records
+
+    def _retrieve_theme_payload(self, theme: str, bbox: Tuple[Tuple[float, float], Tuple[float, float]] = None):
         payload = {"token": self.token,
                    "queryName": theme
                    }
         if bbox is not None:
             payload['extents'] = "{:.5f},{:.5f},{:.5f},{:.5f}".format(bbox[0][0], bbox[0][1], bbox[1][0], bbox[1][1])
 
-        response = requests.get(url=f"{self.url}{endpoint}",
-                                params=payload,
-                                timeout=self.timeout)
-
-        response = self.parse_response(response)
+        return payload
 
+    @staticmethod
+    def _split_theme_results(response):
         try:
             out = response['SrchResults'] # Just return results
             return out[0], out[1:] # first one is metadata, 2nd one is results
         except KeyError:
             return response
 
+    @staticmethod
+    def _theme_query_names(themes):
+        themes = themes['Theme_Names']
+
+        return [i['QUERYNAME'] for i in themes]
+
     def get_list_of_available_themes(self):
         themes = self.get_all_themes_info()
-        themes = themes['Theme_Names']
 
-        queries = [i['QUERYNAME'] for i in themes]
+        return self._theme_query_names(themes)
 
-        return queries
+    def build_index(self, theme: str, **kwargs) -> ThemeIndex:
+        """
+        Download every result of `theme` once, and index them for offline nearest, radius and bbox queries.
+        Use `ThemeIndex.refresh` to update it only when the theme changed, and `ThemeIndex.save` / `load`
+        to reuse it across processes.
+        :param theme: One of the acceptable `QueryName`s as returned from get_themes()
+        :return: `ThemeIndex`
+        """
+        return ThemeIndex.from_api(self, theme, **kwargs)
@@ -0,0 +1,72 @@
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import ResponseCache
+from .metrics import Metrics
+from .policy import RequestPolicy
+
+
+class Transport(object):
+    """
+    HTTP transport shared by `OneMap` and all of its modules.
+
+    Wraps a single `requests.Session` so that connections are kept alive and reused between calls,
+    instead of paying a new TCP + TLS handshake for every request.
+    """
+    def __init__(self, timeout: float = 10,
+                 pool_connections: int = 4, pool_maxsize: int = 10, pool_block: bool = False,
+                 cache: ResponseCache = None, policy: RequestPolicy = None, metrics: Metrics = None):
+        """
+
+        :param timeout: Default timeout (in seconds) applied to every request that does not specify its own
+        :param pool_connections: Number of per-host connection pools to keep
+        :param pool_maxsize: Maximum number of keep-alive connections kept per host
+        :param pool_block: If True, never open more than `pool_maxsize` connections to a host at once,
+            callers wait for a free connection instead
+        :param cache: (Optional) Cache for responses of read-only endpoints
+        :param policy: (Optional) Rate limits, retries and circuit breaker applied to every request
+        :param metrics: (Optional) Per-endpoint request metrics, recorded by `OneMap._get`
+        """
+        self.timeout = timeout
+        self.cache = cache
+        self.policy = policy
+        self.metrics = metrics
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, timeout: float = None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        if self.policy is None:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+        return self.policy.send(url, lambda: self.session.request(method, url, timeout=timeout, **kwargs),
+                                errors=(requests.ConnectionError, requests.Timeout), on_retry=self._on_retry)
+
+    def _on_retry(self, url: str):
+        if self.metrics is not None:
+            self.metrics.record_retry(urlsplit(url).path)
+
+    def get(self, url: str, params: dict = None, timeout: float = None, **kwargs):
+        return self.request("GET", url, params=params, timeout=timeout, **kwargs)
+
+    def post(self, url: str, json: dict = None, timeout: float = None, **kwargs):
+        return self.request("POST", url, json=json, timeout=timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
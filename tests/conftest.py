@@ -0,0 +1,96 @@
+"""
+Fakes shared by the tests: canned responses, and a transport and a session that answer without any network.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from onemap_py import Client, Transport
+
+
+class FakeResponse(object):
+    """
+    Response with `body` as its content: bytes as they are, anything else encoded as JSON
+    """
+    url = "fake"
+
+    def __init__(self, body=b'{"results": []}', status_code=200, headers=None, chunk_size=None):
+        """
+
+        :param chunk_size: (Optional) Size of the chunks streamed by `iter_content`, whatever the caller asks for
+        """
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.text = self.content.decode()
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        size = self.chunk_size or chunk_size
+        return (self.content[i:i + size] for i in range(0, len(self.content), size))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport(Transport):
+    """
+    Answers every request with `handler(method, url, params, **kwargs)`: a `FakeResponse`, a body to wrap in one,
+    or None for an empty search result. Every request is recorded in `calls` as (method, url, params, timeout).
+    """
+    def __init__(self, handler=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handler = handler
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, params=None, **kwargs):
+        with self.lock:
+            self.calls.append((method, url, params, timeout))
+        response = None if self.handler is None else self.handler(method, url, params, **kwargs)
+        if response is None:
+            return FakeResponse()
+        return response if isinstance(response, FakeResponse) else FakeResponse(response)
+
+
+class ScriptedSession(object):
+    """
+    Session answering with the scripted status codes in turn, then 200s, each after `delay` seconds.
+    Sits below the transport's policy, unlike `FakeTransport`.
+    """
+    def __init__(self, statuses=(), headers=None, delay: float = 0):
+        self.statuses = list(statuses)
+        self.headers = headers
+        self.delay = delay
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        time.sleep(self.delay)
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        return FakeResponse(status_code=status, headers=self.headers)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_client():
+    """
+    :return: Factory of `Client`s sending through `session` on a real `Transport` if given, through a
+        `FakeTransport` answering with `handler` otherwise. Other keyword arguments go to the transport.
+    """
+    def make(handler=None, session=None, authenticated: bool = False, **kwargs):
+        if session is None:
+            client = Client(transport=FakeTransport(handler, **kwargs))
+        else:
+            client = Client(transport=Transport(**kwargs))
+            client.transport.session = session
+        if authenticated:
+            client.authenticated = True
+        return client
+
+    return make
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from onemap_py import AsyncClient, PostalCodeNotFoundError
+
+
+def make_client(handler):
+    client = AsyncClient(email="e", password="p")
+    client.transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_search_fan_out_returns_dicts():
+    def handler(request):
+        return httpx.Response(200, json={"results": [{"SEARCHVAL": request.url.params["searchVal"]}]})
+
+    async def run():
+        async with make_client(handler) as client:
+            return await asyncio.gather(*[client.search(str(i)) for i in range(50)])
+
+    results = asyncio.run(run())
+    assert [r["results"][0]["SEARCHVAL"] for r in results] == [str(i) for i in range(50)]
+
+
+def test_authentication_shared_with_modules():
+    def handler(request):
+        if request.url.path.endswith("getToken"):
+            assert json.loads(request.content) == {"email": "e", "password": "p"}
+            return httpx.Response(200, json={"access_token": "abc"})
+        assert request.url.params["token"] == "abc"
+        # None-valued parameters are dropped, like requests does
+        assert "gender" not in request.url.params
+        return httpx.Response(200, json=[{"planning_area": "Bedok"}])
+
+    async def run():
+        async with make_client(handler) as client:
+            await client.authenticate()
+            assert client.Population.transport is client.transport
+            return await client.Population.get_population_by_gender("economic", 2010, "Bedok")
+
+    assert asyncio.run(run()) == [{"planning_area": "Bedok"}]
+
+
+def test_search_all_pages():
+    def handler(request):
+        page = int(request.url.params["pageNum"])
+        return httpx.Response(200, json={"totalNumPages": 5, "pageNum": page,
+                                         "results": [{"page": page, "i": i} for i in range(10)]})
+
+    async def run():
+        async with make_client(handler) as client:
+            return await client.search_all("x", max_results=33, max_workers=2)
+
+    results = asyncio.run(run())
+    assert [(r["page"], r["i"]) for r in results] == [(p, i) for p in range(1, 5) for i in range(10)][:33]
+
+
+def test_batch_methods_and_sync_only():
+    def handler(request):
+        if request.url.path.endswith("getToken"):
+            return httpx.Response(200, json={"access_token": "abc"})
+        if request.url.path.endswith("getPlanningareaNames"):
+            return httpx.Response(200, json=[{"pln_area_n": "BEDOK"}, {"pln_area_n": "BISHAN"}])
+        if "revgeocode" in request.url.path:
+            return httpx.Response(200, json={"GeocodeInfo": [{"location": request.url.params["location"]}]})
+        return httpx.Response(200, json=[{"planning_area": request.url.params["planningArea"], "Employed": 1}])
+
+    async def run():
+        async with make_client(handler) as client:
+            cube = await client.Population.fetch_cube(["economic"], [2010, 2015])
+            places = await client.reverse_geocode_many([(30000.0, 30000.0), (30000.1, 30000.0)], xy=True)
+            return cube, places, await client.convert_coordinates("WGS84", "SVY21", lat=1.3, lng=103.8, offline=True)
+
+    cube, places, converted = asyncio.run(run())
+    assert len(cube.cells) == 4 and not cube.failed
+    assert places[0] is places[1]
+    assert set(converted) == {"X", "Y"}
+
+    client = AsyncClient()
+    with pytest.raises(TypeError):
+        client.bulk_geocode(["018956"])
+
+
+def test_route_from_postal_memoizes_lookups():
+    searched = []
+
+    def handler(request):
+        if request.url.path.endswith("getToken"):
+            return httpx.Response(200, json={"access_token": "abc"})
+        if request.url.path.endswith("search"):
+            postal = request.url.params["searchVal"]
+            searched.append(postal)
+            results = [] if postal == "999999" else [{"LATITUDE": "1.3", "LONGITUDE": postal[:3]}]
+            return httpx.Response(200, json={"found": len(results), "results": results})
+        return httpx.Response(200, json={"route_summary": {"total_time": 1, "total_distance": 1}})
+
+    async def run():
+        async with make_client(handler) as client:
+            await client.Router.route_from_postal("111111", "222222", "drive")
+            responses = await client.Router.route_from_postal_many([("222222", "111111"), ("111111", "999999")],
+                                                                   "drive")
+            with pytest.raises(PostalCodeNotFoundError):
+                await client.Router.route_from_postal("999999", "111111", "drive")
+            return responses
+
+    responses = asyncio.run(run())
+    assert sorted(searched) == ["111111", "222222", "999999"]
+    assert "route_summary" in responses[0]
+    assert responses[1] == {"error": "Postal code 999999 did not return any results"}
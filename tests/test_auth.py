@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from onemap_py import Client, OneMap, TokenProvider
+
+from .conftest import FakeResponse, FakeTransport
+
+
+class TokenServer(object):
+    """
+    Issues tokens "t1", "t2", ... and only accepts the latest one
+    """
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.issued = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, params, **kwargs):
+        if method == "POST":
+            time.sleep(0.05)
+            with self._lock:
+                self.issued += 1
+                return {"access_token": f"t{self.issued}", "expiry_timestamp": str(time.time() + self.lifetime)}
+        self.requests.append(params["token"])
+        if params["token"] != f"t{self.issued}":
+            return {"error": "Invalid token"}
+        return {"result": "OK"}
+
+
+def test_concurrent_callers_authenticate_once():
+    server = TokenServer()
+    client = Client("e", "p", transport=FakeTransport(server))
+
+    with ThreadPoolExecutor(64) as pool:
+        tokens = list(pool.map(lambda _: client.tokens.get_token(), range(64)))
+
+    assert set(tokens) == {"t1"}
+    assert server.issued == 1
+    assert client.tokens.refresh_count == 1
+
+
+def test_modules_share_token():
+    client = Client("e", "p", transport=FakeTransport(TokenServer()))
+    client.authenticate()
+    for module in [client.Themes, client.PlanningAreas, client.Router, client.Population]:
+        assert module.tokens is client.tokens
+        assert module.token == "t1"
+        assert module.authenticated
+
+
+def test_refresh_before_expiry():
+    provider = TokenProvider("e", "p", transport=FakeTransport(TokenServer(lifetime=60)), refresh_margin=600)
+    assert provider.get_token() == "t1"
+    # Expires within the refresh margin, so the next caller refreshes it
+    assert provider.needs_refresh()
+    assert provider.get_token() == "t2"
+
+
+def test_rejected_token_is_refreshed_and_retried():
+    server = TokenServer()
+    client = Client("e", "p", transport=FakeTransport(server))
+    client.authenticate()
+    # Token revoked server side
+    server.issued += 1
+
+    assert client.PlanningAreas.find_planning_area(1.3, 103.8) == {"result": "OK"}
+    assert server.requests == ["t1", "t3"]
+    assert client.Themes.token == "t3"
+
+
+def test_token_persisted(tmp_path):
+    path = str(tmp_path / "token.json")
+    server = TokenServer()
+    transport = FakeTransport(server)
+    TokenProvider("e", "p", transport=transport, token_path=path).get_token()
+
+    provider = TokenProvider("e", "p", transport=transport, token_path=path)
+    assert provider.get_token() == "t1"
+    assert server.issued == 1
+
+
+def test_token_rejection_needs_a_token_error_body():
+    assert OneMap._token_rejected(FakeResponse({"error": "Invalid token"}))
+    assert OneMap._token_rejected(FakeResponse({"error": "Token has expired, please retrieve a new one"}))
+    assert not OneMap._token_rejected(FakeResponse({"error": "Spoken language data is broken"}))
+    assert not OneMap._token_rejected(FakeResponse({"results": [{"error": "token"}]}))
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from onemap_py import ResponseCache, MemoryCache, SQLiteCache
+
+
+def slow(method, url, params, **kwargs):
+    time.sleep(0.01)
+
+
+def test_memory_cache_lru_eviction():
+    cache = MemoryCache(maxsize=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+
+
+def test_ttl_expiry(tmp_path):
+    for backend in [MemoryCache(), SQLiteCache(str(tmp_path / "cache.sqlite"))]:
+        backend.set("a", b"1", ttl=-1)
+        backend.set("b", b"2", ttl=60)
+        assert backend.get("a") is None
+        assert backend.get("b") == b"2"
+
+
+def test_sqlite_cache_lru_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), maxsize=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert len(cache) == 2
+    assert cache.get("b") is None
+
+    # Replacing a key does not count as a new row, so it evicts nothing
+    cache.set("c", b"4")
+    assert cache.get("a") == b"1" and cache.get("c") == b"4"
+
+    # Rows written by another process are picked up when recounting
+    other = SQLiteCache(str(tmp_path / "cache.sqlite"), maxsize=10)
+    for key in "defg":
+        other.set(key, b"5")
+    cache.RECOUNT_EVERY = 1
+    cache.set("h", b"6")
+    assert len(cache) == 2
+
+
+def test_repeated_queries_hit_cache_without_token(make_client):
+    cache = ResponseCache()
+    client = make_client(slow, cache=cache)
+    client.token = "secret"
+    client.authenticated = True
+    client.authenticate()
+
+    for _ in range(3):
+        client.search("123456")
+        client.PlanningAreas.get_all_planning_areas(2014)
+
+    assert len(client.transport.calls) == 2
+    assert cache.stats["hits"] == 4
+    assert not any("secret" in key for key in cache.backend._data)
+
+
+def test_concurrent_misses_fetch_once(make_client):
+    cache = ResponseCache()
+    client = make_client(slow, cache=cache)
+
+    threads = [threading.Thread(target=client.search, args=("123456",)) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(client.transport.calls) == 1
+    assert cache.stats == {"hits": 15, "misses": 1, "hit_ratio": 15 / 16, "size": 1}
+
+
+def test_uncached_endpoints(make_client):
+    client = make_client(slow, cache=ResponseCache())
+    client.authenticated = True
+    client.authenticate()
+
+    client.Router.route((1.3, 103.8), (1.35, 103.9), "drive")
+    client.Router.route((1.3, 103.8), (1.35, 103.9), "drive")
+    assert len(client.transport.calls) == 2
@@ -0,0 +1,101 @@
+import csv
+import json
+import threading
+
+from onemap_py import Client, cli
+
+
+class FakeClient(Client):
+    def __init__(self, fail=()):
+        super().__init__()
+        self.tokens.token, self.tokens.authenticated = "token", True
+        self.searched = []
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.Router.route = lambda start, end, route_type, *args: {
+            "route_summary": {"total_time": 60, "total_distance": 500}}
+
+    def search(self, search_val=None, *args, **kwargs):
+        with self.lock:
+            self.searched.append(search_val)
+        if search_val in self.fail:
+            return "500 - error"
+        return {"found": 1, "totalNumPages": 1, "pageNum": 1, "results": [{"POSTAL": search_val, "X": "1"}]}
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_search_csv_to_jsonl(tmp_path, monkeypatch):
+    client = FakeClient(fail={"000003"})
+    monkeypatch.setattr(cli, "_client", lambda args: client)
+    source = tmp_path / "addresses.csv"
+    source.write_text("id,postal\n" + "".join(f"{i},{i:06d}\n" for i in range(20)) + "20,\n")
+    output = str(tmp_path / "out.jsonl")
+
+    assert cli.main(["search", str(source), "-o", output, "--column", "postal", "--workers", "4", "--quiet"]) == 1
+
+    results = read_jsonl(output)
+    assert sorted(r["row"] for r in results) == list(range(21))
+    statuses = {r["row"]: r["status"] for r in results}
+    assert statuses[3] == "error" and statuses[20] == "invalid" and statuses[0] == "found"
+    assert sorted(client.searched) == [f"{i:06d}" for i in range(20)]
+
+
+def test_resume_after_interruption(tmp_path, monkeypatch):
+    source = tmp_path / "points.jsonl"
+    source.write_text("".join(json.dumps({"query": f"{i:06d}"}) + "\n" for i in range(50)))
+    output = str(tmp_path / "out.jsonl")
+    argv = ["search", str(source), "-o", output, "--workers", "2", "--quiet"]
+    read_rows = cli.read_rows
+
+    def interrupted(f, fmt):
+        for i, row in enumerate(read_rows(f, fmt)):
+            if i == 30:
+                raise KeyboardInterrupt
+            yield row
+
+    first = FakeClient()
+    monkeypatch.setattr(cli, "_client", lambda args: first)
+    monkeypatch.setattr(cli, "read_rows", interrupted)
+    assert cli.main(argv) == 130
+    # A result written after the last checkpoint is dropped on resume rather than duplicated
+    with open(output, "a") as f:
+        f.write('{"row": 49, "status": "found", "inp')
+
+    second = FakeClient()
+    monkeypatch.setattr(cli, "_client", lambda args: second)
+    monkeypatch.setattr(cli, "read_rows", read_rows)
+    assert cli.main(argv) == 0
+
+    rows = [r["row"] for r in read_jsonl(output)]
+    assert sorted(rows) == list(range(50))
+    assert len(first.searched) + len(second.searched) == 50
+
+
+def test_route_to_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "_client", lambda args: FakeClient())
+    source = tmp_path / "trips.csv"
+    source.write_text("trip,start_lat,start_lng,end_lat,end_lng\na,1.30,103.8,1.35,103.9\nb,x,103.8,1.35,103.9\n")
+    output = str(tmp_path / "routes.csv")
+
+    assert cli.main(["route", str(source), "-o", output, "--route-type", "drive", "--quiet"]) == 0
+
+    with open(output) as f:
+        rows = {row["trip"]: row for row in csv.DictReader(f)}
+    assert rows["a"]["status"] == "ok" and float(rows["a"]["total_distance"]) == 500
+    assert rows["b"]["status"] == "invalid" and rows["b"]["total_time"] == ""
+
+
+def test_missing_credentials_fail_before_the_batch(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("ONEMAP_EMAIL", raising=False)
+    monkeypatch.delenv("ONEMAP_PASSWORD", raising=False)
+    source = tmp_path / "trips.csv"
+    source.write_text("start_lat,start_lng,end_lat,end_lng\n1.30,103.8,1.35,103.9\n")
+    output = tmp_path / "routes.csv"
+
+    assert cli.main(["route", str(source), "-o", str(output), "--route-type", "drive", "--quiet"]) == 2
+    assert "email and password" in capsys.readouterr().err
+    assert not output.exists()
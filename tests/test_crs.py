@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from onemap_py import OneMap
+from onemap_py import crs
+
+# (lat, lng, X, Y) control points: the SVY21 projection origin, and the example from the OneMap API documentation
+CONTROL_POINTS = [
+    (1.366666, 103.833333, 28001.642, 38744.572),
+    (1.319728905, 103.8421581, 28983.788791079794, 33554.5098132845),
+]
+
+
+@pytest.mark.parametrize("lat, lng, x, y", CONTROL_POINTS)
+def test_svy21_control_points(lat, lng, x, y):
+    assert crs.convert_coordinates("WGS84", "SVY21", lat=lat, lng=lng) == pytest.approx({"X": x, "Y": y}, abs=1e-3)
+    assert crs.convert_coordinates("SVY21", "WGS84", x=x, y=y) == \
+        pytest.approx({"latitude": lat, "longitude": lng}, abs=1e-8)
+
+
+def test_epsg3857():
+    x, y = crs.wgs84_to_epsg3857(0, 180)
+    assert x == pytest.approx(20037508.342789244)
+    assert y == pytest.approx(0, abs=1e-6)
+
+    lat, lng = crs.epsg3857_to_wgs84(*crs.wgs84_to_epsg3857(1.319728905, 103.8421581))
+    assert (lat, lng) == pytest.approx((1.319728905, 103.8421581), abs=1e-10)
+
+
+def test_batch_round_trip():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(2000, 50000, 10000)
+    y = rng.uniform(20000, 50000, 10000)
+
+    mx, my = crs.convert_many("SVY21", "EPSG3857", x=x, y=y)
+    back_x, back_y = crs.convert_many("EPSG3857", "SVY21", x=mx, y=my)
+
+    np.testing.assert_allclose(back_x, x, atol=1e-6)
+    np.testing.assert_allclose(back_y, y, atol=1e-6)
+
+
+def test_offline_convert_coordinates_is_drop_in():
+    result = OneMap().convert_coordinates("SVY21", "WGS84", x=28983.788791079794, y=33554.5098132845, offline=True)
+    assert set(result) == {"latitude", "longitude"}
+
+
+def test_cross_check_falls_back_to_remote():
+    class FakeOneMap(object):
+        def convert_coordinates(self, *args):
+            return {"X": 0.0, "Y": 0.0}
+
+    converter = crs.CoordinateConverter(om=FakeOneMap())
+    assert converter.convert("WGS84", "SVY21", lat=1.319728905, lng=103.8421581) == {"X": 0.0, "Y": 0.0}
@@ -0,0 +1,107 @@
+import json
+import threading
+
+from onemap_py import OneMap
+from onemap_py.geocoding import normalise_query
+
+
+class FakeOneMap(OneMap):
+    def __init__(self, fail=()):
+        super().__init__()
+        self.searched = []
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+
+    def search(self, search_val=None, *args, **kwargs):
+        with self.lock:
+            self.searched.append(search_val)
+        if search_val in self.fail:
+            return "500 - error"
+        if search_val == "NOWHERE":
+            return {"found": 0, "totalNumPages": 0, "pageNum": 1, "results": []}
+        return {"found": 1, "totalNumPages": 1, "pageNum": 1, "results": [{"POSTAL": search_val}]}
+
+
+def test_normalise_query():
+    assert normalise_query(18956) == "018956"
+    assert normalise_query(" s018956 ") == "018956"
+    assert normalise_query("Singapore 018956") == "018956"
+    assert normalise_query("  grand   hyatt ") == "GRAND HYATT"
+    assert normalise_query("  ") is None
+
+
+def test_deduplicates_and_streams_every_input():
+    om = FakeOneMap()
+    inputs = ["018956", 18956, "S018956", "nowhere", "", "238867"]
+    results = list(om.bulk_geocode(inputs, max_workers=4))
+
+    assert sorted(om.searched) == ["018956", "238867", "NOWHERE"]
+    assert sorted(map(str, (r.input for r in results))) == sorted(map(str, inputs))
+    statuses = {str(r.input): r.status for r in results}
+    assert statuses == {"018956": "found", "18956": "found", "S018956": "found",
+                        "nowhere": "not_found", "": "invalid", "238867": "found"}
+
+
+def test_resume_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    inputs = [f"{i:06d}" for i in range(20)]
+
+    first = FakeOneMap(fail={"000003"})
+    list(first.bulk_geocode(inputs, checkpoint=checkpoint, rate=1000))
+    with open(checkpoint) as f:
+        assert len([json.loads(line) for line in f]) == 19
+
+    second = FakeOneMap()
+    results = list(second.bulk_geocode(inputs, checkpoint=checkpoint))
+    assert second.searched == ["000003"]
+    assert all(r.status == "found" for r in results)
+
+
+class FakeReverseOneMap(OneMap):
+    def __init__(self):
+        super().__init__()
+        self.authenticated = True
+        self.queried = []
+        self.lock = threading.Lock()
+
+    def reverse_geocode(self, radius=10, xy=None, latlng=None, *args, **kwargs):
+        with self.lock:
+            self.queried.append(xy or latlng)
+        return {"GeocodeInfo": [{"BUILDINGNAME": str(xy or latlng)}]}
+
+
+def test_reverse_geocode_many_snaps_to_cells():
+    om = FakeReverseOneMap()
+    # Two clusters of points, each well inside one 10m cell
+    points = [(28985.0 + i * 0.1, 33555.0) for i in range(50)] + [(30005.0, 31005.0 + i * 0.1) for i in range(50)]
+    results = om.reverse_geocode_many(points, xy=True, cell_size=10)
+
+    assert sorted(om.queried) == [(28985.0, 33555.0), (30005.0, 31005.0)]
+    assert len(results) == 100
+    assert results[0] is results[49] and results[50] is results[99]
+    assert results[0]["GeocodeInfo"][0]["BUILDINGNAME"] == "(28985.0, 33555.0)"
+
+    # Memoized per cell and parameters
+    om.reverse_geocode_many(points[:1], xy=True, cell_size=10)
+    assert len(om.queried) == 2
+    om.reverse_geocode_many(points[:1], radius=50, xy=True, cell_size=10)
+    assert len(om.queried) == 3
+
+
+def test_reverse_geocode_many_latlng():
+    om = FakeReverseOneMap()
+    points = [(1.3 + i * 1e-6, 103.8) for i in range(20)]
+    results = om.reverse_geocode_many(points, cell_size=100)
+
+    assert len(om.queried) == 1
+    lat, lng = om.queried[0]
+    assert abs(lat - 1.3) < 0.001 and abs(lng - 103.8) < 0.001
+    assert len(results) == 20
+
+
+def test_reverse_geocode_many_default_cell_size():
+    om = FakeReverseOneMap()
+    # 8m apart: one 10m cell, but two cells of the default radius / 4 = 5m
+    om.reverse_geocode_many([(28981.0, 33551.0), (28989.0, 33551.0)], radius=20, xy=True)
+    assert sorted(om.queried) == [(28982.5, 33552.5), (28987.5, 33552.5)]
+    assert OneMap()._reverse_geocoder is None
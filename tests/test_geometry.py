@@ -0,0 +1,60 @@
+import json
+import struct
+
+import numpy as np
+
+from onemap_py import PlanningAreaBoundaries
+from onemap_py.geometry import decode_geojson
+from onemap_py.spatial import PlanningAreaIndex, _parse_rings
+
+from .test_spatial import RESPONSE, square
+
+
+def test_lazy_decoding_matches_geojson():
+    boundaries = PlanningAreaBoundaries.from_records(RESPONSE["SearchResults"], year=2014)
+    west, east = boundaries
+
+    assert boundaries.names == ["WEST", "EAST"]
+    assert np.allclose(west.bbox, (103.6, 1.3, 103.7, 1.4))
+    assert not west.decoded and not east.decoded
+    assert boundaries.candidates(1.32, 103.92).tolist() == [1]
+
+    for record, area in zip(RESPONSE["SearchResults"], boundaries):
+        expected = _parse_rings(record["geojson"])
+        assert all(np.array_equal(ring, expected_ring) for ring, expected_ring in zip(area.rings, expected))
+    assert west.decoded
+    assert [len(polygon) for polygon in west.polygons] == [2]
+    assert [len(polygon) for polygon in east.polygons] == [1, 1]
+    assert east.__geo_interface__["coordinates"][1][0] == square(103.9, 1.3, 0.05)
+
+    # Altitudes are dropped
+    coords, rings, polygons = decode_geojson(json.dumps({"type": "Polygon", "coordinates": [[[0, 0, 5], [1, 0, 5],
+                                                                                             [0, 1, 5], [0, 0, 5]]]}))
+    assert coords.shape == (4, 2) and rings.tolist() == [0, 4] and polygons.tolist() == [0, 1]
+
+
+def test_wkb():
+    east = PlanningAreaBoundaries.from_records(RESPONSE["SearchResults"])["EAST"]
+    wkb = east.to_wkb()
+
+    assert struct.unpack_from("<BII", wkb) == (1, 6, 2)
+    assert struct.unpack_from("<BIII", wkb, 9) == (1, 3, 1, 5)
+    assert np.array_equal(np.frombuffer(wkb, dtype="<f8", count=10, offset=22).reshape(-1, 2),
+                          square(103.7, 1.3, 0.1))
+    assert len(wkb) == 9 + 2 * (9 + 4 + 5 * 16)
+
+
+def test_save_and_memory_map(tmp_path):
+    boundaries = PlanningAreaBoundaries.from_records(RESPONSE["SearchResults"], year=2008)
+    path = str(tmp_path / "boundaries.bin")
+    boundaries.save(path)
+
+    loaded = PlanningAreaBoundaries.load(path)
+    assert loaded.year == 2008 and loaded.names == boundaries.names
+    assert isinstance(loaded["WEST"].coords, np.memmap)
+    assert np.array_equal(loaded.bboxes, boundaries.bboxes)
+    for area, original in zip(loaded, boundaries):
+        assert area.to_wkb() == original.to_wkb()
+
+    index = PlanningAreaIndex.from_boundaries(loaded)
+    assert index.lookup_many([1.31, 1.35, 1.32], [103.61, 103.65, 103.92]).tolist() == ["WEST", None, "EAST"]
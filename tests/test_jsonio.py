@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from onemap_py import Metrics, OneMapError
+from onemap_py import jsonio
+from onemap_py.jsonio import iter_items, loads
+
+from .conftest import FakeResponse
+
+
+def chunked(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_iter_items_matches_loads(monkeypatch):
+    records = [{"pln_area_n": f"AREA {i}", "geojson": json.dumps({"coordinates": [[i, 1.5], [2, "]},{"]]}),
+                "note": 'quote " and \\ backslash, [brackets]'} for i in range(20)]
+    document = json.dumps({"before": ["not", {"this": 1}], "SearchResults": records, "after": [1]}).encode()
+
+    for size in [1, 3, 64, len(document)]:
+        assert list(iter_items(chunked(document, size), key="SearchResults")) == records
+    assert list(iter_items(chunked(b' [1, "a", {"b": [2]}, null] ', 2))) == [1, "a", {"b": [2]}, None]
+    assert list(iter_items([b'{"SrchResults": [ ]}'], key="SrchResults")) == []
+    assert loads(document)["SearchResults"] == records
+    # Past the orjson size limit, the standard library decodes the same document
+    monkeypatch.setattr(jsonio, "ORJSON_MAX_BYTES", 0)
+    assert loads(document)["SearchResults"] == records
+
+    with pytest.raises(ValueError):
+        list(iter_items([b'{"error": "Server busy"}'], key="SearchResults"))
+
+
+def test_stream_planning_areas_and_themes(make_client):
+    areas = {"SearchResults": [{"pln_area_n": "BEDOK", "geojson": "{}"}, {"pln_area_n": "BISHAN", "geojson": "{}"}]}
+    theme = {"SrchResults": [{"FeatCount": 1}, {"NAME": "KINDERGARTEN"}]}
+    bodies = [(200, {"error": "Invalid token"}), (200, areas), (200, theme), (500, "Server error")]
+    responses = []
+
+    def stream(method, url, params, stream=False, **kwargs):
+        assert stream
+        status, body = bodies.pop(0)
+        responses.append(FakeResponse(body, status, chunk_size=7))
+        return responses[-1]
+
+    metrics = Metrics()
+    client = make_client(stream, metrics=metrics)
+    client.tokens.token, client.tokens.authenticated = "stale", True
+    client.tokens.refresh = lambda stale_token=None: "fresh"
+
+    assert [a["pln_area_n"] for a in client.PlanningAreas.iter_planning_areas()] == ["BEDOK", "BISHAN"]
+    assert [params["token"] for _, _, params, _ in client.transport.calls] == ["stale", "fresh"]
+    assert list(client.Themes.iter_theme("kindergartens")) == [{"NAME": "KINDERGARTEN"}]
+    assert all(response.closed for response in responses)
+    assert metrics.snapshot()["/privateapi/popapi/getAllPlanningarea"]["bytes"] == len(json.dumps(areas))
+
+    with pytest.raises(OneMapError):
+        list(client.PlanningAreas.iter_planning_areas())
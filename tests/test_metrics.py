@@ -0,0 +1,76 @@
+from onemap_py import ResponseCache, Metrics, RequestPolicy, Backoff
+from onemap_py.metrics import Histogram
+
+from .conftest import ScriptedSession
+
+
+def slow_session(statuses=()):
+    return ScriptedSession(statuses, headers={"Retry-After": "0"}, delay=0.02)
+
+
+def test_histogram_quantiles():
+    hist = Histogram()
+    for ms in range(1, 1001):
+        hist.observe(ms / 1000)
+    summary = hist.summary()
+    assert summary["count"] == 1000
+    assert abs(summary["p50"] - 0.5) < 0.5 * 0.5
+    assert abs(summary["p99"] - 0.99) < 0.99 * 0.5
+    assert summary["max"] == 1.0
+
+
+def test_snapshot_per_endpoint(make_client):
+    metrics = Metrics()
+    client = make_client(session=slow_session(), metrics=metrics, cache=ResponseCache())
+    for _ in range(4):
+        client.search("x")
+    client.convert_coordinates("WGS84", "EPSG3857", lat=1.3, lng=103.8)
+
+    snapshot = metrics.snapshot()
+    search = snapshot["/commonapi/search"]
+    assert search["requests"] == 4
+    assert search["cache_hits"] == 3
+    assert search["cache_hit_ratio"] == 0.75
+    assert search["bytes"] == 4 * len(b'{"results": []}')
+    assert search["statuses"] == {200: 4}
+    # Network time of the one uncached request, parse time measured separately
+    assert search["latency"]["max"] >= 0.02
+    assert search["parse"]["count"] == 4
+    assert search["parse"]["max"] < 0.02
+    assert snapshot["/commonapi/convert//4326to3857"]["requests"] == 1
+
+
+def test_retries_and_hooks(make_client):
+    metrics = Metrics()
+    events = []
+    metrics.add_hook(before=lambda e: events.append(("before", e.endpoint)),
+                     after=lambda e: events.append(("after", e.status_code)))
+    client = make_client(session=slow_session([503, 503]), metrics=metrics,
+                         policy=RequestPolicy(retry=Backoff(max_retries=2)))
+    client.search("x")
+
+    assert metrics.snapshot()["/commonapi/search"]["retries"] == 2
+    assert events == [("before", "/commonapi/search"), ("after", 200)]
+
+
+def test_prometheus_export(make_client):
+    metrics = Metrics()
+    client = make_client(session=slow_session([500]), metrics=metrics)
+    client.search("x")
+    client.search("x")
+
+    text = metrics.to_prometheus()
+    assert 'onemap_requests_total{endpoint="/commonapi/search",status="200"} 1' in text
+    assert 'onemap_requests_total{endpoint="/commonapi/search",status="500"} 1' in text
+    assert 'onemap_request_duration_seconds_bucket{endpoint="/commonapi/search",le="+Inf"} 2' in text
+    assert 'onemap_request_duration_seconds_count{endpoint="/commonapi/search"} 2' in text
+    assert "# TYPE onemap_parse_duration_seconds histogram" in text
+
+
+def test_prometheus_escapes_label_values():
+    metrics = Metrics()
+    metrics.record_retry('/a"b\\c\nd')
+
+    text = metrics.to_prometheus()
+    assert 'onemap_retries_total{endpoint="/a\\"b\\\\c\\nd"} 1' in text
+    assert all(line.startswith(("# ", "onemap_")) for line in text.splitlines())
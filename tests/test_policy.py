@@ -0,0 +1,114 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from onemap_py import RequestPolicy, RateLimiter, TokenBucket, Backoff, CircuitBreaker, RetryError, CircuitOpenError
+
+from .conftest import FakeResponse, ScriptedSession
+
+
+def test_retries_until_success(make_client):
+    session = ScriptedSession([503, 429, 502], headers={"Retry-After": "0"})
+    client = make_client(session=session, policy=RequestPolicy(retry=Backoff(max_retries=3)))
+    assert client.search("x") == {"results": []}
+    assert session.calls == 4
+    assert client.transport.policy.retries == 3
+
+
+def test_retries_exhausted(make_client):
+    session = ScriptedSession([503] * 10)
+    client = make_client(session=session, policy=RequestPolicy(retry=Backoff(max_retries=2, base=0.001)))
+    with pytest.raises(RetryError) as e:
+        client.search("x")
+    assert e.value.response.status_code == 503
+    assert session.calls == 3
+
+
+def test_backoff_honours_retry_after():
+    backoff = Backoff(base=0.001, max_delay=30)
+    assert backoff.delay(0, FakeResponse(status_code=429, headers={"Retry-After": "7"})) == 7
+    assert backoff.delay(0, FakeResponse(status_code=429, headers={"Retry-After": "3600"})) == 30
+    assert 0 <= backoff.delay(3, FakeResponse(status_code=503)) <= 0.008
+
+
+def test_circuit_breaker_fails_fast_then_recovers(make_client):
+    session = ScriptedSession([500] * 3)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+    client = make_client(session=session, policy=RequestPolicy(breaker=breaker))
+
+    for _ in range(3):
+        with pytest.raises(RetryError):
+            client.search("x")
+    with pytest.raises(CircuitOpenError):
+        client.search("x")
+    assert session.calls == 3
+
+    time.sleep(0.1)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.search("x") == {"results": []}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unexpected_error_in_trial_reopens_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    policy = RequestPolicy(breaker=breaker)
+    with pytest.raises(RetryError):
+        policy.send("url", lambda: FakeResponse(status_code=500))
+
+    def broken():
+        raise KeyError("bug")
+
+    with pytest.raises(KeyError):
+        policy.send("url", broken)
+    assert breaker.state != CircuitBreaker.CLOSED
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(policy.send_async("url", cancelled))
+
+    # The API is healthy again: the next trial closes the circuit instead of failing fast forever
+    assert policy.send("url", lambda: FakeResponse()).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_rate_limit_shared_across_threads(make_client):
+    limiter = RateLimiter({"search": TokenBucket(100, capacity=1)})
+    session = ScriptedSession()
+    client = make_client(session=session, policy=RequestPolicy(limiter=limiter))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: client.search(str(i)), range(31)))
+    # One token to start with, then 100 per second
+    assert time.monotonic() - start >= 0.29
+    assert session.calls == 31
+
+
+def test_unlimited_groups():
+    limiter = RateLimiter({"routing": 1})
+    assert limiter.group_for("https://developers.onemap.sg/privateapi/routingsvc/route") == "routing"
+    assert limiter.bucket_for("https://developers.onemap.sg/commonapi/search") is None
+
+
+def test_async_transport_shares_policy():
+    httpx = pytest.importorskip("httpx")
+    from onemap_py import AsyncClient, AsyncTransport
+
+    statuses = [429, 503]
+
+    def handler(request):
+        if statuses:
+            return httpx.Response(statuses.pop(0), headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"results": []})
+
+    async def run():
+        policy = RequestPolicy(limiter=RateLimiter({"search": 50}), retry=Backoff(max_retries=2))
+        async with AsyncClient(transport=AsyncTransport(policy=policy)) as client:
+            client.transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            return await client.search("x"), policy.retries
+
+    assert asyncio.run(run()) == ({"results": []}, 2)
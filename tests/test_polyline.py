@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from pypolyline.util import decode_polyline, encode_coordinates
+
+from onemap_py import Router
+from onemap_py.polyline import PolylineBatch, decode_polylines
+
+
+def random_polylines(n):
+    rng = np.random.default_rng(0)
+    polylines = []
+    for _ in range(n):
+        size = int(rng.integers(0, 40))
+        coords = np.c_[rng.uniform(103.6, 104.0, size), rng.uniform(1.2, 1.47, size)].round(5)
+        polylines.append(encode_coordinates(coords.tolist(), 5).decode() if size else "")
+    return polylines
+
+
+def test_matches_pypolyline():
+    polylines = random_polylines(100)
+    batch = Router.decode_route_geometries(polylines)
+
+    assert len(batch) == 100
+    assert batch.coords.dtype == np.float64
+    for decoded, polyline in zip(batch, polylines):
+        expected = np.array(decode_polyline(polyline.encode(), 5)).reshape(-1, 2) if polyline else np.empty((0, 2))
+        np.testing.assert_allclose(decoded, expected, atol=1e-9)
+
+
+def test_write_to_memory_mapped_files(tmp_path):
+    polylines = random_polylines(20)
+    path = str(tmp_path / "routes")
+    batch = decode_polylines(polylines, out=path)
+
+    assert isinstance(batch.coords, np.memmap)
+    loaded = PolylineBatch.load(path)
+    np.testing.assert_array_equal(loaded.coords, decode_polylines(polylines).coords)
+    np.testing.assert_array_equal(loaded.offsets, batch.offsets)
+
+
+def test_truncated_polyline():
+    with pytest.raises(ValueError):
+        decode_polylines(["_p~iF~ps|U_", "_p~iF~ps|U"])
@@ -0,0 +1,65 @@
+import threading
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from onemap_py import PopulationCube
+
+
+class PopulationServer(object):
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, params, **kwargs):
+        path = urlsplit(url).path
+        with self.lock:
+            self.calls.append((path, params.get("planningArea"), params.get("gender")))
+        if path.endswith("getPlanningareaNames"):
+            return [{"id": 1, "pln_area_n": "BEDOK"}, {"id": 2, "pln_area_n": "BISHAN"}]
+        if params["planningArea"] in self.failing:
+            return {"error": "Server busy"}
+        if path.endswith("getReligion"):
+            return [{"Result": "No Data Available!"}]
+        record = {"planning_area": params["planningArea"], "year": params["year"], "employed": 10, "unemployed": 2}
+        if params.get("gender"):
+            record["gender"] = params["gender"]
+        return [record]
+
+
+def test_fetch_cube_columnar(make_client):
+    server = PopulationServer()
+    population = make_client(server, authenticated=True).Population
+    cube = population.fetch_cube(["economic", "religion"], [2010, 2015], by_gender=True)
+
+    # 2 years x 2 areas x (2 genders for economic + 1 for religion)
+    assert len(cube.cells) == 12
+    assert len(server.calls) == 13
+
+    data = cube.to_dict()
+    assert len(data["value"]) == 2 * 2 * 2 * 2
+    assert set(data["gender"]) == {"male", "female"}
+    assert data["value"][data["category"] == "employed"].sum() == 8 * 10
+    assert data["year"].dtype == np.int32
+    assert set(data["planning_area"]) == {"BEDOK", "BISHAN"}
+
+
+def test_refresh_only_missing_cells(tmp_path, make_client):
+    server = PopulationServer(failing={"BISHAN"})
+    population = make_client(server, authenticated=True).Population
+    cube = population.fetch_cube(["economic"], [2010], planning_areas=["BEDOK", "BISHAN"])
+    assert cube.failed == [("economic", 2010, "BISHAN", "")]
+
+    path = str(tmp_path / "cube.npz")
+    cube.save(path)
+    cube = PopulationCube.load(path)
+
+    server.failing.clear()
+    server.calls.clear()
+    cube = population.fetch_cube(["economic"], [2010, 2015], planning_areas=["BEDOK", "BISHAN"], cube=cube)
+    assert sorted(server.calls) == [("/privateapi/popapi/getEconomicStatus", "BEDOK", None),
+                                       ("/privateapi/popapi/getEconomicStatus", "BISHAN", None),
+                                       ("/privateapi/popapi/getEconomicStatus", "BISHAN", None)]
+    assert cube.failed == []
+    assert len(cube) == 4 * 2
@@ -0,0 +1,130 @@
+import threading
+
+import numpy as np
+import pytest
+
+from onemap_py import Router, OneMapError, PostalCodeNotFoundError
+
+
+class FakeRouter(Router):
+    def __init__(self):
+        super().__init__()
+        self.authenticated = True
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def route(self, start_point, end_point, route_type, *args, **kwargs):
+        with self.lock:
+            self.calls.append((start_point, end_point))
+        if end_point == (9.0, 9.0):
+            return {"status": 404, "status_message": "No route found"}
+        if end_point == (7.0, 7.0):
+            raise ConnectionError("connection reset")
+        distance = abs(start_point[0] - end_point[0]) + abs(start_point[1] - end_point[1])
+        return {"route_summary": {"total_time": distance * 10, "total_distance": distance * 100},
+                # Encoded (38.5, -120.2), (40.7, -120.95)
+                "route_geometry": "_p~iF~ps|U_ulLnnqC"}
+
+
+def test_route_matrix():
+    router = FakeRouter()
+    points = [(1.0, 1.0), (2.0, 2.0), (1.0, 1.0)]
+    matrix = router.route_matrix(points, points + [(9.0, 9.0)], "drive", skip_diagonal=True, keep_geometry=True)
+
+    assert matrix.shape == (3, 4)
+    # Repeated pairs are only routed once, the diagonal not at all
+    assert len(router.calls) == len(set(router.calls)) == 5
+    np.testing.assert_array_equal(matrix.time[:, :3], [[0, 20, 0], [20, 0, 20], [0, 20, 0]])
+    np.testing.assert_array_equal(matrix.distance[0, :3], [0, 200, 0])
+    assert np.isnan(matrix.time[:, 3]).all()
+
+    assert matrix.geometry(0, 0) is None
+    assert np.allclose(matrix.geometry(0, 1), [[-120.2, 38.5], [-120.95, 40.7]])
+    assert matrix.failed == [(0, 3), (1, 3), (2, 3)]
+
+
+def test_route_matrix_keeps_routes_when_a_pair_fails():
+    router = FakeRouter()
+    matrix = router.route_matrix([(1.0, 1.0), (2.0, 2.0)], [(3.0, 3.0), (7.0, 7.0)], "drive")
+
+    np.testing.assert_array_equal(matrix.time[:, 0], [40, 20])
+    assert np.isnan(matrix.time[:, 1]).all()
+    assert matrix.failed == [(0, 1), (1, 1)]
+
+
+def test_route_matrix_memoizes_routes_across_calls():
+    router = FakeRouter()
+    first = router.route_matrix([(1.0, 1.0), (2.0, 2.0)], [(3.0, 3.0), (9.0, 9.0)], "drive")
+    assert len(router.calls) == 4
+
+    # Overlapping matrix: only the new pair and the pairs without a route are routed again
+    second = router.route_matrix([(1.0, 1.0), (2.0, 2.0)], [(3.0, 3.0), (4.0, 4.0), (9.0, 9.0)], "drive")
+    assert len(router.calls) == 4 + 2 + 2
+    np.testing.assert_array_equal(second.time[:, 0], first.time[:, 0])
+
+    # Other parameters are other routes
+    router.route_matrix([(1.0, 1.0)], [(3.0, 3.0)], "walk")
+    assert len(router.calls) == 9
+
+
+class PostalRouter(Router):
+    POINTS = {"111111": ("1.1", "103.1"), "222222": ("1.2", "103.2"), "333333": ("1.3", "103.3")}
+
+    def __init__(self):
+        super().__init__()
+        self.authenticated = True
+        self.searched = []
+        self.routed = []
+        self.lock = threading.Lock()
+
+    def search(self, search_val=None, *args, **kwargs):
+        with self.lock:
+            self.searched.append(search_val)
+        if search_val == "500500":
+            return "500 - Internal Server Error"
+        if search_val == "000000":
+            raise ConnectionError("connection reset")
+        if search_val not in self.POINTS:
+            return {"found": 0, "totalNumPages": 0, "pageNum": 1, "results": []}
+        lat, lng = self.POINTS[search_val]
+        return {"found": 1, "totalNumPages": 1, "pageNum": 1, "results": [{"LATITUDE": lat, "LONGITUDE": lng}]}
+
+    def route(self, start_point, end_point, route_type, *args, **kwargs):
+        with self.lock:
+            self.routed.append((start_point, end_point))
+        return {"route_summary": {"total_time": 1, "total_distance": 1}}
+
+
+def test_route_from_postal_uses_end_coordinates_and_memo():
+    router = PostalRouter()
+    router.route_from_postal("111111", "222222", "drive")
+    router.route_from_postal("222222", "111111", "drive")
+
+    assert router.routed == [((1.1, 103.1), (1.2, 103.2)), ((1.2, 103.2), (1.1, 103.1))]
+    assert sorted(router.searched) == ["111111", "222222"]
+
+
+def test_route_from_postal_many():
+    router = PostalRouter()
+    responses = router.route_from_postal_many([("111111", "222222"), ("222222", "333333"),
+                                               ("333333", "111111"), ("111111", "999999")], "walk")
+
+    assert sorted(router.searched) == ["111111", "222222", "333333", "999999"]
+    assert len(router.routed) == 3
+    assert responses[3] == {"error": "Postal code 999999 did not return any results"}
+
+
+def test_route_from_postal_reports_lookup_failures():
+    router = PostalRouter()
+    with pytest.raises(PostalCodeNotFoundError, match="destination postal code, 999999 did not return"):
+        router.route_from_postal("111111", "999999", "drive")
+    with pytest.raises(OneMapError, match="starting postal code 500500: .*500 - Internal") as e:
+        router.route_from_postal("500500", "111111", "drive")
+    assert not isinstance(e.value, PostalCodeNotFoundError)
+    with pytest.raises(OneMapError) as e:
+        router.route_from_postal("111111", "000000", "drive")
+    assert isinstance(e.value.__cause__, ConnectionError)
+
+    responses = router.route_from_postal_many([("111111", "000000"), ("111111", "222222")], "walk")
+    assert responses[0] == {"error": "Failed to look up postal code 000000: connection reset"}
+    assert "route_summary" in responses[1]
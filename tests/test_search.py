@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from onemap_py import OneMap
+
+
+class PagedOneMap(OneMap):
+    def __init__(self, total_pages=10, page_size=10):
+        super().__init__()
+        self.total_pages = total_pages
+        self.page_size = page_size
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def search(self, search_val=None, return_geometry="Y", get_address_details="Y", page_num=1,
+               search_endpoint='/commonapi/search'):
+        with self.lock:
+            self.fetched.append(page_num)
+        return {"found": self.total_pages * self.page_size, "totalNumPages": self.total_pages, "pageNum": page_num,
+                "results": [{"page": page_num, "i": i} for i in range(self.page_size)]}
+
+
+def test_search_all_in_order():
+    om = PagedOneMap()
+    results = om.search_all("x", max_workers=3)
+    assert [(r["page"], r["i"]) for r in results] == [(p, i) for p in range(1, 11) for i in range(10)]
+
+
+def test_max_results_limits_fetching():
+    om = PagedOneMap()
+    results = om.search_all("x", max_results=25, max_workers=8)
+    assert len(results) == 25
+    assert sorted(om.fetched) == [1, 2, 3]
+
+
+def test_stops_fetching_when_consumer_stops():
+    om = PagedOneMap(total_pages=100)
+    results = om.iter_search("x", max_workers=2)
+    for _ in range(15):
+        next(results)
+    results.close()
+    assert len(om.fetched) <= 4
+
+
+def test_failed_search_raises():
+    class FailingOneMap(OneMap):
+        def search(self, *args, **kwargs):
+            return "500 - error"
+
+    with pytest.raises(ValueError):
+        FailingOneMap().search_all("x")
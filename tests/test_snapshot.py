@@ -0,0 +1,79 @@
+from urllib.parse import urlsplit
+
+import numpy as np
+import pytest
+
+from onemap_py import Client, OneMapError, load_snapshot
+
+from .conftest import FakeResponse, FakeTransport
+from .test_spatial import RESPONSE
+
+
+def dataset(method, url, params, **kwargs):
+    path = urlsplit(url).path
+    if path.endswith("getPlanningareaNames"):
+        return [{"id": 1, "pln_area_n": "WEST"}, {"id": 2, "pln_area_n": "EAST"}]
+    if path.endswith("getAllPlanningarea"):
+        return RESPONSE
+    if path.endswith("getAllThemesInfo"):
+        return {"Theme_Names": [{"QUERYNAME": "kindergartens"}]}
+    if path.endswith("retrieveTheme"):
+        return {"SrchResults": [{"FeatCount": 2},
+                                {"NAME": "A", "LatLng": "1.30,103.80"},
+                                {"NAME": "B", "LatLng": "1.40,103.90"}]}
+    if path.endswith("getEconomicStatus"):
+        return [{"planning_area": params["planningArea"], "year": params["year"], "employed": 10, "unemployed": 2}]
+    return {"route_summary": {}}
+
+
+def test_export_and_serve_offline(tmp_path, make_client):
+    path = str(tmp_path / "onemap.snapshot")
+    client = make_client(dataset, authenticated=True)
+    client.export_snapshot(path, years=[2014], population_years=[2015], data_types=["economic"],
+                           themes=["kindergartens"])
+
+    transport = FakeTransport(dataset)
+    offline = Client(transport=transport, snapshot=path)
+    assert offline.PlanningAreas.get_all_planning_areas(year=2014, names_only=True)[1]["pln_area_n"] == "EAST"
+    areas = offline.PlanningAreas.get_all_planning_areas(year=2014)["SearchResults"]
+    assert [area["pln_area_n"] for area in areas] == ["WEST", "EAST"]
+    assert offline.PlanningAreas.build_index(year=2014).lookup(1.31, 103.61) == "WEST"
+    assert isinstance(offline.PlanningAreas.get_boundaries(2014)["EAST"].coords, np.memmap)
+
+    assert offline.Population.get_population_data("economic", 2015, "EAST") == \
+        [{"planning_area": "EAST", "year": 2015, "employed": 10.0, "unemployed": 2.0}]
+    cube = offline.Population.fetch_cube(["economic"], [2015])
+    assert len(cube) == 4
+
+    metadata, records = offline.Themes.retrieve_theme("kindergartens")
+    assert metadata == {"FeatCount": 2} and len(records) == 2
+    assert [r["NAME"] for r in offline.Themes.retrieve_theme("kindergartens", ((1.35, 103.85), (1.45, 103.95)))[1]] \
+        == ["B"]
+    assert offline.Themes.get_all_themes_info()["Theme_Names"][0]["QUERYNAME"] == "kindergartens"
+    # Nothing was sent, not even authentication
+    assert transport.calls == []
+
+    # Anything missing from the snapshot goes to the API
+    offline.authenticated = True
+    offline.Population.get_population_data("economic", 2020, "EAST")
+    offline.Router.route((1.3, 103.8), (1.4, 103.9), "drive")
+    assert len(transport.calls) == 2
+
+
+def test_rejects_other_files(tmp_path, make_client):
+    path = str(tmp_path / "boundaries.bin")
+    client = make_client(dataset, authenticated=True)
+    client.PlanningAreas.get_boundaries(2014).save(path)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+
+def test_export_fails_on_themes_info_error(tmp_path, make_client):
+    def themes_info_down(method, url, params, **kwargs):
+        if url.endswith("getAllThemesInfo"):
+            return FakeResponse(b"Internal Server Error", 500)
+        return dataset(method, url, params, **kwargs)
+
+    client = make_client(themes_info_down, authenticated=True)
+    with pytest.raises(OneMapError, match="themes' info: 500"):
+        client.export_snapshot(str(tmp_path / "onemap.snapshot"), years=[2014], themes=["kindergartens"])
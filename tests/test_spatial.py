@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+
+from onemap_py.spatial import PlanningAreaIndex, ThemeIndex
+
+
+def square(x0, y0, size):
+    return [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+
+
+RESPONSE = {"SearchResults": [
+    # WEST has a hole that belongs to no planning area
+    {"pln_area_n": "WEST",
+     "geojson": json.dumps({"type": "Polygon", "coordinates": [square(103.6, 1.3, 0.1), square(103.64, 1.34, 0.02)]})},
+    {"pln_area_n": "EAST",
+     "geojson": json.dumps({"type": "MultiPolygon", "coordinates": [[square(103.7, 1.3, 0.1)],
+                                                                      [square(103.9, 1.3, 0.05)]]})},
+]}
+
+
+def test_lookup():
+    index = PlanningAreaIndex.from_response(RESPONSE, year=2014)
+
+    assert index.lookup(1.31, 103.61) == "WEST"
+    assert index.lookup(1.35, 103.65) is None
+    assert index.lookup(1.31, 103.75) == "EAST"
+    assert index.lookup(1.32, 103.92) == "EAST"
+    assert index.lookup(1.5, 103.75) is None
+
+
+def test_batch_lookup_and_save(tmp_path):
+    index = PlanningAreaIndex.from_response(RESPONSE, year=2008)
+    lat = np.array([1.31, 1.35, 1.31, 1.32, 1.5])
+    lng = np.array([103.61, 103.65, 103.75, 103.92, 103.75])
+    expected = ["WEST", None, "EAST", "EAST", None]
+
+    assert index.lookup_many(lat, lng).tolist() == expected
+
+    index.save(str(tmp_path / "index.npz"))
+    loaded = PlanningAreaIndex.load(str(tmp_path / "index.npz"))
+    assert loaded.year == 2008
+    assert loaded.lookup_many(lat, lng).tolist() == expected
+
+
+class FakeThemes(object):
+    def __init__(self, records, metadata):
+        self.records = records
+        self.metadata = metadata
+        self.calls = []
+
+    def retrieve_theme(self, theme, bbox=None):
+        self.calls.append(bbox)
+        if bbox is not None:
+            return dict(self.metadata, FeatCount=0), []
+        return dict(self.metadata), list(self.records)
+
+
+def random_theme(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lat, lng = rng.uniform(1.22, 1.47, n), rng.uniform(103.6, 104.0, n)
+    return lat, lng, [{"NAME": str(i), "LatLng": f"{a},{b}"} for i, (a, b) in enumerate(zip(lat, lng))]
+
+
+def test_theme_index_queries():
+    lat, lng, records = random_theme(500)
+    # Lines and polygons are indexed at the mean of their vertices, unparseable results are skipped
+    records += [{"NAME": "line", "LatLng": "1.3,103.8|1.32,103.82"}, {"NAME": "broken", "LatLng": ""}]
+    index = ThemeIndex(records, {"FeatCount": 502}, theme="kindergartens")
+    assert len(index) == 501
+    assert index.nearest_records(1.31, 103.81)[0][0]["NAME"] == "line"
+
+    rng = np.random.default_rng(1)
+    # Some queries outside the theme's extent
+    qlat, qlng = rng.uniform(1.1, 1.6, 300), rng.uniform(103.5, 104.1, 300)
+    distances, ids = index.nearest(qlat, qlng, k=3)
+
+    qxy, pxy = index._project(qlat, qlng), index._project(index.latlng[:, 0], index.latlng[:, 1])
+    brute = np.hypot(qxy[:, None, 0] - pxy[:, 0], qxy[:, None, 1] - pxy[:, 1])
+    np.testing.assert_allclose(distances, np.sort(brute, axis=1)[:, :3])
+    np.testing.assert_allclose(brute[np.arange(300)[:, None], ids], distances)
+
+    within = index.within(qlat, qlng, 1000)
+    assert all(set(w) == set(np.flatnonzero(b <= 1000)) for w, b in zip(within, brute))
+
+    inside = index.in_bbox(((1.3, 103.7), (1.35, 103.8)))
+    expected = np.flatnonzero((index.latlng[:, 0] >= 1.3) & (index.latlng[:, 0] <= 1.35) &
+                              (index.latlng[:, 1] >= 103.7) & (index.latlng[:, 1] <= 103.8))
+    assert list(inside) == list(expected)
+
+
+def test_theme_index_fewer_results_than_k():
+    index = ThemeIndex([{"LatLng": "1.3,103.8"}])
+    distances, ids = index.nearest([1.3], [103.8], k=2)
+    assert list(ids[0]) == [0, -1]
+    assert distances[0, 1] == np.inf
+
+
+def test_theme_index_refresh(tmp_path):
+    _, _, records = random_theme(50)
+    themes = FakeThemes(records, {"FeatCount": 50, "DateTime": {"date": "2020-01-01"}})
+    index = ThemeIndex.from_api(themes, "kindergartens")
+
+    path = str(tmp_path / "theme.npz")
+    index.save(path)
+    index = ThemeIndex.load(path)
+
+    # Unchanged: only the metadata is fetched
+    assert not index.refresh(themes)
+    assert themes.calls == [None, ((0.0, 0.0), (0.00001, 0.00001))]
+
+    themes.records = records[:10]
+    themes.metadata = {"FeatCount": 10, "DateTime": {"date": "2020-02-01"}}
+    assert index.refresh(themes)
+    assert len(index) == 10
+
+
+def test_theme_index_refresh_without_dates():
+    _, _, records = random_theme(20)
+    themes = FakeThemes(records, {"FeatCount": 20, "Theme_Name": "Kindergartens"})
+    index = ThemeIndex.from_api(themes, "kindergartens")
+
+    # The probe's FeatCount of 0 is not mistaken for a change
+    assert not index.refresh(themes)
+    assert not index.refresh(themes)
+    assert themes.calls.count(None) == 1
+
+    # With the theme's own metadata, the feature count still tells
+    themes.records = records[:5]
+    assert index.refresh(themes, {"FeatCount": 5, "Theme_Name": "Kindergartens"})
+    assert len(index) == 5
+
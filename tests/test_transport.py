@@ -0,0 +1,23 @@
+from onemap_py import Client
+
+from .conftest import FakeTransport
+
+
+def test_client_shares_transport():
+    client = Client(transport=FakeTransport())
+    for module in [client.Themes, client.PlanningAreas, client.Router, client.Population]:
+        assert module.transport is client.transport
+
+
+def test_timeout_applied_everywhere():
+    client = Client(timeout=5, transport=FakeTransport())
+    client.authenticated = True
+    client.authenticate()
+
+    client.search("GRAND HYATT")
+    client.Themes.get_all_themes_info()
+    client.Population.get_population_data("age", 2018, "BEDOK")
+    client.PlanningAreas.find_planning_area(1.3, 103.8)
+
+    assert len(client.transport.calls) == 4
+    assert all(timeout is not None for _, _, _, timeout in client.transport.calls)